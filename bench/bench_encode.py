@@ -0,0 +1,107 @@
+# bench/bench_encode.py
+"""
+Бенчмарк одновременных кодирований: "каждый сам за себя" (все ffmpeg сразу,
+без -threads) против EncodeScheduler (общий бюджет ядер, очередь).
+Каждое кодирование — подготовка видео (scale/crop до 9:16 + libx264), как в пайплайне.
+
+Запуск из корня репозитория (нужен только ffmpeg, ключи API не нужны):
+    python -m bench.bench_encode --jobs 10 --seconds 10 --threads 2 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import time
+
+from bench.bench_render import make_video
+from src.async_pipeline import run_process
+from src.encode_scheduler import EncodeScheduler
+from src.pipeline import VideoPipeline
+
+
+async def run_mode(pipeline: VideoPipeline, video_path: str, jobs: int,
+                   scheduler: EncodeScheduler | None) -> dict:
+    """jobs одновременных кодирований; без scheduler — как раньше, без ограничений."""
+    latencies = []
+
+    async def encode(i: int):
+        output = f"tmp/bench_encode_{i}.mp4"
+        cmd = pipeline._prepare_cmd(video_path, output)
+        started = time.perf_counter()
+        try:
+            if scheduler is None:
+                await run_process(cmd)
+            else:
+                async with scheduler.slot_async() as slot:
+                    await run_process(pipeline._with_threads(cmd, slot.threads), slot.preexec_fn)
+            latencies.append(time.perf_counter() - started)
+        finally:
+            if os.path.exists(output):
+                os.remove(output)
+
+    cpu_before = os.times()
+    started = time.perf_counter()
+    await asyncio.gather(*(encode(i) for i in range(jobs)))
+    wall = time.perf_counter() - started
+    cpu_after = os.times()
+
+    return {
+        "wall_s": wall,
+        "encodes_per_min": jobs / wall * 60,
+        "latency_p50_s": statistics.median(latencies),
+        "latency_max_s": max(latencies),
+        # Процессорное время дочерних ffmpeg: рост при той же работе — накладные расходы
+        "children_cpu_s": (cpu_after.children_user + cpu_after.children_system)
+                          - (cpu_before.children_user + cpu_before.children_system),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    pipeline = VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+    video_path = "tmp/bench_encode_input.mp4"
+    make_video(video_path, args.seconds, args.size)
+
+    results = {}
+    try:
+        results["free_for_all"] = await run_mode(pipeline, video_path, args.jobs, None)
+        for threads in args.threads:
+            scheduler = EncodeScheduler(cores=args.cores, threads=threads, pin_cpus=args.pin_cpus)
+            result = await run_mode(pipeline, video_path, args.jobs, scheduler)
+            result["scheduler"] = scheduler.stats()
+            result["speedup"] = results["free_for_all"]["wall_s"] / result["wall_s"]
+            results[f"scheduled_threads_{threads}"] = result
+    finally:
+        os.remove(video_path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10, help="одновременных кодирований")
+    parser.add_argument("--seconds", type=float, default=10.0, help="длина входного видео")
+    parser.add_argument("--size", default="1920x1080", help="разрешение входного видео")
+    parser.add_argument("--cores", type=int, default=0, help="бюджет ядер (0 — все доступные)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[2, 4], help="потоков на кодирование")
+    parser.add_argument("--pin-cpus", action="store_true", help="закреплять кодирования за ядрами")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("Для бенчмарка нужен ffmpeg в PATH")
+
+    args.cores = args.cores or None
+    results = asyncio.run(run_benchmark(args))
+    print(json.dumps({
+        "benchmark": "encode",
+        "cpu_count": os.cpu_count(),
+        "params": vars(args),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,132 @@
+# bench/bench_limiter.py
+"""
+Бенчмарк клиентского лимита ElevenLabs (src/rate_limit.py) на локальном фейковом TTS:
+
+1. scripted — сервер отвечает на первые запросы заданными ошибками (по умолчанию
+   429 с Retry-After и 503): все фразы должны быть озвучены, число ошибок и время — в отчёте;
+2. quota — сервер принимает не больше --quota-rps запросов в секунду (сверх — 429
+   с Retry-After). Сравниваются клиент без ограничения частоты (только повторы)
+   и клиент с TTS_RPS = квоте: пропускная способность, число 429 и упавшие фразы.
+
+    python -m bench.bench_limiter --quota-rps 5 --phrases 60 --concurrency 16 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from bench.fake_tts import FakeTTSServer
+from src.rate_limit import ProviderLimiter
+
+
+async def run_phrases(pipeline, phrases: int, concurrency: int, workdir: str) -> dict:
+    """Озвучивает phrases разных фраз, не больше concurrency одновременно."""
+    texts = [f"Фраза номер {i} для проверки лимита запросов." for i in range(phrases)]
+    slots = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def synthesize(i: int):
+        nonlocal failed
+        async with slots:
+            try:
+                await pipeline._synthesize_chunk_async(texts, i, "bench", workdir)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Фраза {i} не озвучена: {e}")
+                failed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(synthesize(i) for i in range(phrases)))
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": elapsed,
+        "ok": phrases - failed,
+        "failed": failed,
+        "throughput_rps": (phrases - failed) / elapsed if elapsed else 0.0,
+    }
+
+
+def make_limiter(args, rate: float) -> ProviderLimiter:
+    return ProviderLimiter(
+        "elevenlabs", rate=rate, burst=1, max_in_flight=args.concurrency,
+        max_retries=args.max_retries, backoff_base=args.backoff_base,
+        breaker_failures=args.breaker_failures, breaker_cooldown=args.breaker_cooldown,
+    )
+
+
+async def run_benchmark(args) -> dict:
+    server = FakeTTSServer(latency=args.latency, seconds_per_char=0.01).start()
+    os.environ["ELEVENLABS_BASE_URL"] = server.base_url
+    os.environ.setdefault("ELEVEN_LAB_API", "fake")
+    os.environ.setdefault("GEMENI_API_KEY", "fake")
+
+    # Импорт после настройки окружения: клиенты создаются в конструкторе
+    from src.async_pipeline import AsyncVideoPipeline
+    pipeline = AsyncVideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # 1. Сценарные ошибки: задачи переживают 429/5xx
+            server.script.extend(args.script)
+            server.retry_after = args.retry_after
+            pipeline.tts_limiter = make_limiter(args, rate=0.0)
+            errors_before = server.counters["errors"]
+            results["scripted"] = {
+                "script": args.script,
+                **await run_phrases(pipeline, args.phrases, args.concurrency, workdir),
+                "server_errors": server.counters["errors"] - errors_before,
+            }
+
+            # 2. Квота сервера: без ограничения частоты и с TTS_RPS = квоте
+            server.quota_rps = args.quota_rps
+            for name, rate in (("retries_only", 0.0), ("rate_limited", args.quota_rps)):
+                pipeline.tts_limiter = make_limiter(args, rate)
+                throttled_before = server.counters["throttled"]
+                # Окно квоты сервера должно очиститься от прошлого прогона
+                await asyncio.sleep(1.0)
+                level = await run_phrases(pipeline, args.phrases, args.concurrency, workdir)
+                level["server_429"] = server.counters["throttled"] - throttled_before
+                level["ceiling_utilization"] = level["throughput_rps"] / args.quota_rps
+                results[name] = level
+    finally:
+        server.stop()
+
+    return {
+        "benchmark": "limiter",
+        "timestamp": time.time(),
+        "params": vars(args),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quota-rps", type=float, default=5.0, help="квота фейкового сервера, запросов/с")
+    parser.add_argument("--phrases", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа фейкового TTS, с")
+    parser.add_argument("--script", type=int, nargs="*", default=[429, 429, 503, 429],
+                        help="коды ответов на первые запросы сценарного прогона")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After у сценарных 429, с")
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--backoff-base", type=float, default=0.25)
+    parser.add_argument("--breaker-failures", type=int, default=20)
+    parser.add_argument("--breaker-cooldown", type=float, default=2.0)
+    parser.add_argument("--output", help="файл для JSON-результата")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,297 @@
+# bench/bench_pipeline.py
+"""
+Сквозной офлайн-бенчмарк пайплайна: синтетические видео (lavfi) + локальные
+фейковые Gemini и ElevenLabs, без ключей API и без расхода кредитов.
+
+Для каждого входного видео и каждого уровня параллельности запускает N задач
+и сообщает p50/p95 по этапам, пропускную способность и пиковые RSS/диск.
+Результат — JSON (stdout и, при --output, файл), чтобы сравнивать "до" и "после".
+
+Запуск из корня репозитория (нужен ffmpeg):
+    python -m bench.bench_pipeline --lengths 10 30 --sizes 1080x1920 1920x1080 \\
+        --concurrency 1 4 --jobs 8 --tts-latency 0.3 --output bench_results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import time
+
+from bench.bench_render import make_video
+from bench.fake_gemini import FakeGeminiServer
+from bench.fake_tts import FakeTTSServer
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("prepare", "describe", "tts", "wait_prepare", "render", "total")
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Перцентиль методом ближайшего ранга (для малых выборок честнее интерполяции)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * q / 100))
+    return ordered[rank - 1]
+
+
+def _children_rss(pid: int) -> int:
+    """Суммарный RSS прямых потомков (ffmpeg) в байтах; только Linux (/proc)."""
+    total = 0
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid: # поле ppid
+                total += int(fields[21]) * resource.getpagesize() # поле rss, в страницах
+        except (OSError, IndexError, ValueError):
+            pass # Процесс завершился, пока читали
+    return total
+
+
+def _self_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakSampler:
+    """Фоновый замер пиков: RSS (бот + дочерние ffmpeg) и занятое место в рабочих папках."""
+
+    def __init__(self, workspaces: list, interval: float = 0.1):
+        self.workspaces = workspaces
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._task = None
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, _self_rss() + _children_rss(os.getpid()))
+        disk = sum(workspace.usage() for workspace in list(self.workspaces) if not workspace.closed)
+        self.peak_disk = max(self.peak_disk, disk)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.sample()
+
+
+async def run_job(pipeline, video_path: str, active_workspaces: list) -> dict:
+    """
+    Одна задача — те же шаги, что run_async, но с замером каждого этапа.
+    Возвращает {"ok": bool, "stages": {этап: секунды}}.
+    """
+    timings = {}
+    started = time.perf_counter()
+    workspace = pipeline.workspaces.acquire(pipeline.estimate_job_bytes(os.path.getsize(video_path)))
+    active_workspaces.append(workspace)
+    prep_task = None
+    try:
+        prep_task = pipeline.start_prepare(video_path, workspace.path)
+        if prep_task:
+            prep_started = time.perf_counter()
+            prep_task.add_done_callback(
+                lambda _: timings.__setitem__("prepare", time.perf_counter() - prep_started)
+            )
+
+        stage_started = time.perf_counter()
+        text_data = await pipeline.get_desc_video_async(video_path, workdir=workspace.path)
+        timings["describe"] = time.perf_counter() - stage_started
+        # При ошибке get_desc_video_async возвращает пустой title и текст ошибки в content
+        if not text_data or not text_data.get("title"):
+            return {"ok": False, "failed_stage": "describe", "stages": timings}
+
+        stage_started = time.perf_counter()
+        audio_path, srt_path = await pipeline.generate_audio_and_srt_async(
+            text_data["content"], "voice", workspace.path
+        )
+        timings["tts"] = time.perf_counter() - stage_started
+        if not audio_path or not srt_path:
+            return {"ok": False, "failed_stage": "tts", "stages": timings}
+
+        stage_started = time.perf_counter()
+        render_input = await pipeline.finish_prepare(prep_task, video_path)
+        timings["wait_prepare"] = time.perf_counter() - stage_started
+
+        stage_started = time.perf_counter()
+        created = await pipeline.create_video_async(
+            audio_path, render_input, workspace.file("result.mp4"), srt_path
+        )
+        timings["render"] = time.perf_counter() - stage_started
+        if not created:
+            return {"ok": False, "failed_stage": "render", "stages": timings}
+
+        timings["total"] = time.perf_counter() - started
+        return {"ok": True, "stages": timings}
+    finally:
+        await pipeline.discard_prepare(prep_task)
+        workspace.cleanup()
+        active_workspaces.remove(workspace)
+
+
+async def run_level(pipeline, video_path: str, concurrency: int, jobs: int) -> dict:
+    """Прогоняет jobs задач, не больше concurrency одновременно."""
+    slots = asyncio.Semaphore(concurrency)
+    active_workspaces = []
+    sampler = PeakSampler(active_workspaces)
+
+    async def limited():
+        async with slots:
+            return await run_job(pipeline, video_path, active_workspaces)
+
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        outcomes = await asyncio.gather(*(limited() for _ in range(jobs)), return_exceptions=True)
+    finally:
+        wall = time.perf_counter() - started
+        await sampler.stop()
+
+    stages = {}
+    failed = {}
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            logger.error(f"Задача упала: {outcome!r}")
+            failed["exception"] = failed.get("exception", 0) + 1
+            continue
+        if not outcome["ok"]:
+            failed[outcome["failed_stage"]] = failed.get(outcome["failed_stage"], 0) + 1
+        for stage, seconds in outcome["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+
+    ok = jobs - sum(failed.values())
+    return {
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "ok": ok,
+        "failed": failed,
+        "wall_s": wall,
+        "throughput_jobs_per_min": ok / wall * 60 if wall else None,
+        "stages": {
+            stage: {
+                "count": len(stages[stage]),
+                "p50_s": percentile(stages[stage], 50),
+                "p95_s": percentile(stages[stage], 95),
+                "max_s": max(stages[stage]),
+            }
+            for stage in STAGES if stage in stages
+        },
+        "peak_rss_mb": sampler.peak_rss / 1024 / 1024,
+        "peak_workspace_mb": sampler.peak_disk / 1024 / 1024,
+    }
+
+
+def _ffmpeg_version() -> str:
+    out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    return out.splitlines()[0] if out else "unknown"
+
+
+async def run_benchmark(args) -> dict:
+    gemini = FakeGeminiServer(
+        activation_delay=args.activation_delay, latency=args.gemini_latency,
+        error_rate=args.gemini_error_rate
+    ).start()
+    tts = FakeTTSServer(latency=args.tts_latency, error_rate=args.tts_error_rate).start()
+    os.environ["GEMINI_BASE_URL"] = gemini.base_url
+    os.environ["ELEVENLABS_BASE_URL"] = tts.base_url
+    os.environ.setdefault("GEMENI_API_KEY", "fake")
+    os.environ.setdefault("ELEVEN_LAB_API", "fake")
+
+    # Импорт после настройки окружения: клиенты создаются в конструкторе.
+    # Кэши выключены — иначе все прогоны, кроме первого, не дойдут до API
+    from src.async_pipeline import AsyncVideoPipeline
+    pipeline = AsyncVideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    try:
+        for seconds in args.lengths:
+            for size in args.sizes:
+                video_path = os.path.join(args.workdir, f"bench_input_{seconds:g}s_{size}.mp4")
+                make_video(video_path, seconds, size)
+                try:
+                    for concurrency in args.concurrency:
+                        logger.warning(f"Видео {seconds:g} с {size}, параллельность {concurrency}...")
+                        level = await run_level(pipeline, video_path, concurrency, args.jobs or concurrency * 2)
+                        results.append({"video": {"seconds": seconds, "size": size}, **level})
+                finally:
+                    os.remove(video_path)
+    finally:
+        gemini.stop()
+        tts.stop()
+
+    return {
+        "benchmark": "pipeline",
+        "timestamp": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": _ffmpeg_version(),
+        },
+        "params": vars(args),
+        "pipeline": {
+            "fused_render": pipeline.fused_render,
+            "tts_mode": pipeline.tts_mode,
+            "staged": pipeline.staged,
+            "subtitle_mode": pipeline.subtitle_mode,
+            "gemini_proxy_preset": pipeline.gemini_proxy_preset,
+            "tts_workers": pipeline.tts_workers,
+            "tts_max_in_flight": pipeline.tts_max_in_flight,
+        },
+        "api_calls": {"gemini": gemini.counters, "tts": tts.counters},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=float, nargs="+", default=[10.0, 30.0], help="длины входных видео, с")
+    parser.add_argument("--sizes", nargs="+", default=["1080x1920", "1920x1080"], help="разрешения входных видео")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="уровни параллельности")
+    parser.add_argument("--jobs", type=int, default=0, help="задач на уровень (0 — вдвое больше параллельности)")
+    parser.add_argument("--activation-delay", type=float, default=0.5, help="время до ACTIVE в фейковом Gemini")
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--workdir", default="tmp", help="куда класть синтетические видео")
+    parser.add_argument("--output", help="файл для JSON-результата")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("Для бенчмарка нужен ffmpeg в PATH")
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
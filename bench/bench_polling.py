@@ -0,0 +1,80 @@
+# bench/bench_polling.py
+"""
+Бенчмарк ожидания ACTIVE в Gemini на локальном фейковом сервере:
+старый опрос (фиксированная пауза 2 с) против адаптивного (_wait_file_active).
+Лишнее ожидание = время до обнаружения ACTIVE - реальное время активации.
+
+    python -m bench.bench_polling --delays 0.1 0.5 1 3 --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from bench.fake_gemini import FakeGeminiServer
+
+
+def fixed_wait(client, name: str, interval: float = 2.0) -> float:
+    """Прежняя логика: проверка, затем сон 2 с, до 10 попыток."""
+    started = time.perf_counter()
+    for _ in range(10):
+        if client.files.get(name=name).state == "ACTIVE":
+            return time.perf_counter() - started
+        time.sleep(interval)
+    raise RuntimeError("файл не стал ACTIVE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delays", type=float, nargs="+", default=[0.1, 0.5, 1.0, 3.0],
+                        help="время активации файла на фейковом сервере, с")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer().start()
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    os.environ.setdefault("GEMENI_API_KEY", "fake")
+
+    # Импорт после настройки окружения: клиент Gemini создаётся в конструкторе
+    from src.pipeline import VideoPipeline
+    pipeline = VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+    client = pipeline.gemini_client
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+        f.write(os.urandom(64 * 1024))
+        f.flush()
+
+        results = []
+        try:
+            for delay in args.delays:
+                server.activation_delay = delay
+                row = {"activation_delay_s": delay}
+                for mode in ("fixed", "adaptive"):
+                    overshoots = []
+                    gets_before = server.counters["get"]
+                    for _ in range(args.runs):
+                        uploaded = client.files.upload(file=f.name)
+                        # Отсчёт от загрузки, как в пайплайне
+                        if mode == "fixed":
+                            waited = fixed_wait(client, uploaded.name)
+                        else:
+                            waited = pipeline._wait_file_active(client, uploaded.name)
+                        overshoots.append(waited - delay)
+                        client.files.delete(name=uploaded.name)
+                    row[mode] = {
+                        "overshoot_p50_s": statistics.median(overshoots),
+                        "overshoot_max_s": max(overshoots),
+                        "get_requests_per_job": (server.counters["get"] - gets_before) / args.runs,
+                    }
+                results.append(row)
+        finally:
+            server.stop()
+
+    print(json.dumps({"benchmark": "gemini_polling", "runs": args.runs, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
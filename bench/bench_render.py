@@ -0,0 +1,124 @@
+# bench/bench_render.py
+"""
+Бенчмарк сборки видео: старый путь (склейка аудио отдельным ffmpeg + create_video)
+против однопроходного fused_render (фрагменты сразу во входе create_video)
+и режима мягких субтитров soft (fused_render + видео без перекодирования).
+
+Запуск из корня репозитория (нужен только ffmpeg, ключи API не нужны):
+    python -m bench.bench_render --seconds 20 --chunks 12 --runs 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import time
+
+from src.mp3_duration import get_mp3_duration
+from src.pipeline import VideoPipeline
+
+logger = logging.getLogger(__name__)
+
+
+def make_video(path: str, seconds: float, size: str = "1080x1920", fps: int = 30):
+    """Синтетическое видео (lavfi testsrc2 + синус) заданной длины и разрешения."""
+    subprocess.run([
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path
+    ], check=True, capture_output=True)
+
+
+def make_chunks(base_filename: str, count: int, seconds: float) -> list[str]:
+    """mp3-фрагменты в том же формате, что отдаёт ElevenLabs (mp3_44100_128)."""
+    paths = []
+    for i in range(count):
+        path = f"tmp/{base_filename}_chunk_{i}.mp3"
+        subprocess.run([
+            "ffmpeg", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency={300 + 20 * i}:duration={seconds}",
+            "-ar", "44100", "-c:a", "libmp3lame", "-b:a", "128k", path
+        ], check=True, capture_output=True)
+        paths.append(path)
+    return paths
+
+
+def write_srt(pipeline: VideoPipeline, srt_path: str, durations: list[float], pause: float):
+    current_time = 0.0
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for i, duration in enumerate(durations):
+            end_time = current_time + duration
+            f.write(f"{i + 1}\n")
+            f.write(f"{pipeline._format_srt_time(current_time)} --> {pipeline._format_srt_time(end_time)}\n")
+            f.write(f"Фраза номер {i + 1}\n\n")
+            current_time = end_time + pause
+
+
+def run_once(pipeline: VideoPipeline, video_path: str, mode: str, args, run: int) -> float:
+    """Один прогон сборки; возвращает время в секундах (генерация фрагментов не входит)."""
+    base_filename = f"bench_{mode}_{run}"
+    pause = 0.1
+    chunks = make_chunks(base_filename, args.chunks, args.chunk_seconds)
+    durations = [get_mp3_duration(open(path, "rb").read()) or 0.0 for path in chunks]
+    srt_path = f"tmp/{base_filename}.srt"
+    write_srt(pipeline, srt_path, durations, pause)
+    final_path = f"tmp/{base_filename}.mp4"
+
+    start = time.perf_counter()
+    try:
+        if mode in ("fused", "soft"):
+            audio_path = pipeline._write_audio_list(chunks, durations, base_filename, pause)
+        else:
+            audio_path = pipeline._concat_audio(chunks, base_filename, pause)
+        subtitle_mode = "soft" if mode == "soft" else "burn"
+        if not pipeline.create_video(audio_path, video_path, final_path, srt_path, subtitle_mode):
+            raise RuntimeError(f"create_video не справился в режиме {mode}")
+        return time.perf_counter() - start
+    finally:
+        for path in chunks + [final_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0, help="длина входного видео")
+    parser.add_argument("--size", default="1080x1920", help="разрешение входного видео")
+    parser.add_argument("--chunks", type=int, default=12, help="число TTS-фрагментов")
+    parser.add_argument("--chunk-seconds", type=float, default=1.5, help="длина одного фрагмента")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("Для бенчмарка нужен ffmpeg в PATH")
+
+    pipeline = VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+    video_path = "tmp/bench_render_input.mp4"
+    make_video(video_path, args.seconds, args.size)
+
+    results = {}
+    try:
+        for mode in ("concat", "fused", "soft"):
+            timings = [run_once(pipeline, video_path, mode, args, run) for run in range(args.runs)]
+            results[mode] = {
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "runs": timings,
+            }
+    finally:
+        os.remove(video_path)
+
+    results["speedup"] = results["concat"]["median_s"] / results["fused"]["median_s"]
+    # Выигрыш мягких субтитров относительно лучшей сборки с вжиганием
+    results["speedup_soft"] = results["fused"]["median_s"] / results["soft"]["median_s"]
+    print(json.dumps({"benchmark": "render", "params": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,109 @@
+# bench/bench_segments.py
+"""
+Бенчмарк сегментной сборки длинного видео против сборки одним проходом.
+Кроме времени сравнивает число кадров и длительность результатов:
+сегментная сборка должна давать тот же кадр в кадр результат.
+
+Запуск из корня репозитория (нужен только ffmpeg, ключи API не нужны):
+    python -m bench.bench_segments --seconds 180 --segment-seconds 20 --runs 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import time
+
+from bench.bench_render import make_chunks, make_video, write_srt
+from src.mp3_duration import get_mp3_duration
+from src.pipeline import VideoPipeline
+
+
+def probe_output(path: str) -> dict:
+    """Число видеокадров и длительность файла (ffprobe считает пакеты без декодирования)."""
+    out = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-count_packets",
+        "-show_entries", "stream=nb_read_packets:format=duration",
+        "-of", "json", path
+    ], check=True, capture_output=True, text=True).stdout
+    data = json.loads(out)
+    return {
+        "frames": int(data["streams"][0]["nb_read_packets"]),
+        "duration_s": float(data["format"]["duration"]),
+    }
+
+
+def run_once(pipeline: VideoPipeline, video_path: str, mode: str, args, run: int) -> (float, dict): # type: ignore
+    """Один прогон create_video; возвращает время и параметры результата."""
+    base_filename = f"bench_segments_{mode}_{run}"
+    pause = 0.1
+    chunks = make_chunks(base_filename, args.chunks, args.seconds / args.chunks - pause)
+    durations = [get_mp3_duration(open(path, "rb").read()) or 0.0 for path in chunks]
+    srt_path = f"tmp/{base_filename}.srt"
+    write_srt(pipeline, srt_path, durations, pause)
+    audio_path = pipeline._write_audio_list(chunks, durations, base_filename, pause)
+    final_path = f"tmp/{base_filename}.mp4"
+
+    # Порог 0 выключает сегментную сборку, порог 1 с — включает для любого видео
+    pipeline.segment_render_min_seconds = 1.0 if mode == "segmented" else 0.0
+    start = time.perf_counter()
+    try:
+        if not pipeline.create_video(audio_path, video_path, final_path, srt_path):
+            raise RuntimeError(f"create_video не справился в режиме {mode}")
+        elapsed = time.perf_counter() - start
+        return elapsed, probe_output(final_path)
+    finally:
+        for path in chunks + [final_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=180.0, help="длина входного видео")
+    parser.add_argument("--size", default="1080x1920", help="разрешение входного видео")
+    parser.add_argument("--segment-seconds", type=float, default=20.0, help="длина куска")
+    parser.add_argument("--chunks", type=int, default=60, help="число TTS-фрагментов на всё видео")
+    parser.add_argument("--runs", type=int, default=2)
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("Для бенчмарка нужен ffmpeg в PATH")
+
+    pipeline = VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+    pipeline.segment_seconds = args.segment_seconds
+    video_path = "tmp/bench_segments_input.mp4"
+    make_video(video_path, args.seconds, args.size)
+
+    results = {}
+    try:
+        for mode in ("single", "segmented"):
+            runs = [run_once(pipeline, video_path, mode, args, run) for run in range(args.runs)]
+            timings = [elapsed for elapsed, _ in runs]
+            results[mode] = {
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "runs": timings,
+                "output": runs[0][1],
+            }
+    finally:
+        os.remove(video_path)
+
+    results["speedup"] = results["single"]["median_s"] / results["segmented"]["median_s"]
+    results["frames_match"] = results["single"]["output"]["frames"] == results["segmented"]["output"]["frames"]
+    print(json.dumps({
+        "benchmark": "segments",
+        "encoder": pipeline.encoder.stats(),
+        "params": vars(args),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,145 @@
+# bench/bench_subtitles.py
+"""
+Бенчмарк вжигания субтитров: фильтр libass на каждом кадре (SUBTITLE_RENDERER=libass)
+против реплик, заранее отрисованных в картинки и наложенных одним overlay из ffconcat-потока
+картинок (SUBTITLE_RENDERER=overlay). Время отрисовки картинок считается отдельно.
+
+Два замера на каждый путь:
+1. filter — только декодирование и фильтры (видео в rawvideo, вывод в null):
+   чистая цена субтитров без кодировщика;
+2. encode — команда финальной сборки пайплайна целиком (libx264).
+
+Запуск из корня репозитория (нужен только ffmpeg, ключи API не нужны):
+    python -m bench.bench_subtitles --seconds 60 --runs 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import time
+
+from bench.bench_render import make_video
+from src.pipeline import VideoPipeline
+
+# Реплики примерно той длины, что режет _split_text_into_chunks
+PHRASES = [
+    "Смотрите, что происходит прямо сейчас на этой улице.",
+    "Никто не ожидал, что всё закончится именно так.",
+    "А теперь самое интересное — обратите внимание на детали.",
+    "Вот почему этот момент разлетелся по всему интернету.",
+]
+
+
+def write_cues(pipeline: VideoPipeline, srt_path: str, seconds: float, cue_seconds: float, pause: float):
+    """SRT на всю длину видео: реплики по cue_seconds с паузами pause, как у озвучки."""
+    current_time, i = 0.0, 0
+    with open(srt_path, "w", encoding="utf-8") as f:
+        while current_time < seconds:
+            end_time = min(current_time + cue_seconds, seconds)
+            f.write(f"{i + 1}\n")
+            f.write(f"{pipeline._format_srt_time(current_time)} --> {pipeline._format_srt_time(end_time)}\n")
+            f.write(f"{PHRASES[i % len(PHRASES)]}\n\n")
+            current_time, i = end_time + pause, i + 1
+    return i
+
+
+def make_audio(path: str, seconds: float):
+    subprocess.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-ar", "44100", "-c:a", "libmp3lame", "-b:a", "128k", path
+    ], check=True, capture_output=True)
+
+
+def filter_only(cmd: list[str]) -> list[str]:
+    """Та же команда сборки, но видео не кодируется: rawvideo в null."""
+    out = []
+    args = iter(cmd[:-2])
+    for arg in args:
+        if arg in ("-crf", "-preset"):
+            next(args)
+            continue
+        out.append(arg)
+        if arg == "-c:v":
+            next(args)
+            out.append("rawvideo")
+    return out + ["-f", "null", "-"]
+
+
+def timed_run(cmd: list[str]) -> float:
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def summarize(timings: list[float], frames: int) -> dict:
+    median = statistics.median(timings)
+    return {"median_s": median, "min_s": min(timings), "fps": frames / median, "runs": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="длина входного видео")
+    parser.add_argument("--size", default="1080x1920", help="разрешение входного видео")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--cue-seconds", type=float, default=2.5, help="длина одной реплики")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("Для бенчмарка нужен ffmpeg в PATH")
+
+    os.makedirs("tmp", exist_ok=True)
+    pipeline = VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+    video_path = "tmp/bench_subtitles_input.mp4"
+    audio_path = "tmp/bench_subtitles.mp3"
+    srt_path = "tmp/bench_subtitles.srt"
+    final_path = "tmp/bench_subtitles_out.mp4"
+    make_video(video_path, args.seconds, args.size, args.fps)
+    make_audio(audio_path, args.seconds)
+    cues = write_cues(pipeline, srt_path, args.seconds, args.cue_seconds, pause=0.1)
+    frames = round(args.seconds * args.fps)
+
+    results = {}
+    try:
+        pipeline.subtitle_renderer = "overlay"
+        raster_timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            images = pipeline._render_subtitle_images(video_path, srt_path)
+            raster_timings.append(time.perf_counter() - started)
+        if not images:
+            raise RuntimeError("Картинки реплик не отрисовались")
+        results["raster"] = {"median_s": statistics.median(raster_timings), "cues": cues, "runs": raster_timings}
+
+        commands = {
+            "libass": pipeline._create_video_cmd(audio_path, video_path, final_path, srt_path),
+            "overlay": pipeline._create_video_cmd(audio_path, video_path, final_path, srt_path, images),
+        }
+        for name, cmd in commands.items():
+            results[name] = {
+                "filter": summarize([timed_run(filter_only(cmd)) for _ in range(args.runs)], frames),
+                "encode": summarize([timed_run(cmd) for _ in range(args.runs)], frames),
+            }
+    finally:
+        shutil.rmtree(pipeline._subtitle_images_dir(srt_path), ignore_errors=True)
+        for path in (video_path, audio_path, srt_path, final_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    raster_s = results["raster"]["median_s"]
+    for stage in ("filter", "encode"):
+        libass_s = results["libass"][stage]["median_s"]
+        overlay_s = results["overlay"][stage]["median_s"]
+        results[f"speedup_{stage}"] = libass_s / overlay_s
+        # С учётом отрисовки картинок: то, что реально увидит задача
+        results[f"speedup_{stage}_with_raster"] = libass_s / (overlay_s + raster_s)
+    print(json.dumps({"benchmark": "subtitles", "params": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
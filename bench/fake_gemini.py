@@ -0,0 +1,128 @@
+# bench/fake_gemini.py
+"""
+Локальная подделка Gemini API (Files + generateContent) для офлайн-бенчмарков.
+Файл становится ACTIVE через activation_delay секунд после загрузки.
+
+Отдельный запуск:
+    python -m bench.fake_gemini --port 8081 --activation-delay 0.5
+и затем GEMINI_BASE_URL=http://127.0.0.1:8081 для пайплайна.
+"""
+
+import argparse
+import json
+import re
+import time
+import uuid
+
+from bench.fake_server import FakeServer
+
+DEFAULT_RESPONSE = {
+    "title": "Тестовая сцена",
+    "content": "Это синтетический текст для бенчмарка. Он не требует ключей API, "
+               "но проходит через тот же пайплайн, что и настоящий ответ.",
+}
+
+
+class FakeGeminiServer(FakeServer):
+    """
+    Фейковый Gemini. Кроме параметров FakeServer:
+    - activation_delay: через сколько секунд после загрузки файл станет ACTIVE;
+    - response: JSON, который вернёт generateContent.
+    Ошибками (error_rate, script, quota_rps) отвечает только generateContent.
+    """
+
+    counter_names = ("upload", "get", "generate", "delete")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, activation_delay: float = 0.5,
+                 latency: float = 0.0, error_rate: float = 0.0, response: dict | None = None, **options):
+        super().__init__(host, port, latency, error_rate, **options)
+        self.activation_delay = activation_delay
+        self.response = response or DEFAULT_RESPONSE
+        self.files = {} # name -> время завершения загрузки
+
+    def _file_json(self, name: str) -> dict:
+        ready = time.time() - self.files[name] >= self.activation_delay
+        return {
+            "name": name,
+            "mimeType": "video/mp4",
+            "uri": f"{self.base_url}/v1beta/{name}",
+            "state": "ACTIVE" if ready else "PROCESSING",
+        }
+
+    def handle(self, handler, method: str):
+        if method == "POST":
+            return self._handle_post(handler)
+
+        match = re.search(r"(files/[^/?]+)", handler.path)
+        if method == "DELETE":
+            if match:
+                self.files.pop(match.group(1), None)
+                self.count("delete")
+            return handler.send_json(200, {})
+
+        if match and match.group(1) in self.files:
+            self.count("get")
+            return handler.send_json(200, self._file_json(match.group(1)))
+        handler.send_json(404, {"error": {"code": 404, "message": handler.path}})
+
+    def _handle_post(self, handler):
+        handler.read_body()
+        command = (handler.headers.get("X-Goog-Upload-Command") or "").lower()
+
+        # 1. Начало resumable-загрузки: выдаём URL сессии
+        if command == "start":
+            session = uuid.uuid4().hex
+            return handler.send_json(200, {}, {
+                "X-Goog-Upload-URL": f"{self.base_url}/upload-session/{session}",
+                "X-Goog-Upload-Status": "active",
+            })
+
+        # 2. Загрузка данных; finalize завершает её и создаёт файл
+        if handler.path.startswith("/upload-session/"):
+            if "finalize" not in command:
+                return handler.send_json(200, {}, {"X-Goog-Upload-Status": "active"})
+            name = f"files/{uuid.uuid4().hex[:12]}"
+            self.files[name] = time.time()
+            self.count("upload")
+            return handler.send_json(200, {"file": self._file_json(name)}, {"X-Goog-Upload-Status": "final"})
+
+        # 3. Генерация ответа
+        if ":generateContent" in handler.path:
+            self.count("generate")
+            error = self.error_for_request()
+            if error:
+                return self.send_error_response(handler, error)
+            text = json.dumps(self.response, ensure_ascii=False)
+            return handler.send_json(200, {
+                "candidates": [{
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP",
+                }],
+            })
+
+        handler.send_json(404, {"error": {"code": 404, "message": handler.path}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--activation-delay", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--quota-rps", type=float, default=0.0, help="сверх квоты — 429 с Retry-After")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        port=args.port, activation_delay=args.activation_delay,
+        latency=args.latency, error_rate=args.error_rate, quota_rps=args.quota_rps
+    ).start()
+    print(f"Fake Gemini: {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
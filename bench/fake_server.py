@@ -0,0 +1,143 @@
+# bench/fake_server.py
+"""
+Общая основа локальных фейковых API-серверов для офлайн-бенчмарков:
+HTTP-сервер в фоновом потоке, задержка ответов, доля ошибок, сценарий ответов,
+квота запросов в секунду (429 с Retry-After) и счётчики запросов.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeServer:
+    """
+    Базовый фейковый сервер. Наследники реализуют handle(handler, method).
+    - latency: задержка каждого ответа, с;
+    - error_rate: доля запросов, на которые отвечаем error_status;
+    - script: коды ответов для очередных запросов по порядку (200 — обычный ответ),
+      после сценария — снова error_rate;
+    - retry_after: заголовок Retry-After (с) у сценарных 429 (None — без заголовка);
+    - quota_rps: сколько запросов в секунду принимать, сверх квоты — 429 с Retry-After.
+    Какой ответ отдать, решает error_for_request.
+    """
+
+    counter_names: tuple[str, ...] = ()
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+                 script: list[int] | None = None, retry_after: float | None = None,
+                 quota_rps: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.script = deque(script or ())
+        self.retry_after = retry_after
+        self.quota_rps = quota_rps
+        self._accepted = deque() # время принятых запросов за последнюю секунду (для квоты)
+        self.counters = {name: 0 for name in self.counter_names + ("errors", "throttled")}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def error_for_request(self) -> tuple[int, float | None] | None:
+        """
+        Решает, ответить ли на запрос ошибкой (и учитывает её в счётчиках).
+        Возвращает (код, Retry-After) или None, если отвечаем как обычно.
+        """
+        with self._lock:
+            status = self.script.popleft() if self.script else None
+            retry_after = self.retry_after if status == 429 else None
+            if status is None and self.quota_rps > 0:
+                now = time.monotonic()
+                while self._accepted and now - self._accepted[0] >= 1.0:
+                    self._accepted.popleft()
+                if len(self._accepted) >= self.quota_rps:
+                    # Как у настоящих API: целые секунды до освобождения окна
+                    status = 429
+                    retry_after = max(1, math.ceil(1.0 - (now - self._accepted[0])))
+                    self.counters["throttled"] += 1
+                else:
+                    self._accepted.append(now)
+        if status is None and random.random() < self.error_rate:
+            status = self.error_status
+        if status is None or status < 400:
+            return None
+        self.count("errors")
+        return status, retry_after
+
+    def send_error_response(self, handler: BaseHTTPRequestHandler, error: tuple[int, float | None]):
+        status, retry_after = error
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        handler.send_json(status, {
+            "error": {
+                "code": status, "message": "fake error",
+                "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL",
+            }
+        }, headers)
+
+    def handle(self, handler: BaseHTTPRequestHandler, method: str):
+        raise NotImplementedError
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, как у настоящих API
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status: int, payload: bytes, content_type: str, headers: dict | None = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_json(self, status: int, body: dict, headers: dict | None = None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_body(status, payload, "application/json", headers)
+
+            def read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _dispatch(self, method: str):
+                if server.latency:
+                    time.sleep(server.latency)
+                server.handle(self, method)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+        return Handler
@@ -0,0 +1,101 @@
+# bench/fake_tts.py
+"""
+Локальная подделка ElevenLabs text-to-speech для офлайн-бенчмарков.
+Отдаёт тишину в формате mp3_44100_128 (валидные MPEG-фреймы без ffmpeg),
+длина звука пропорциональна длине текста.
+
+Отдельный запуск:
+    python -m bench.fake_tts --port 8082 --latency 0.3
+и затем ELEVENLABS_BASE_URL=http://127.0.0.1:8082 для пайплайна.
+"""
+
+import argparse
+import base64
+import json
+import time
+
+from bench.fake_server import FakeServer
+
+# MPEG-1 Layer III, 128 кбит/с, 44100 Гц, стерео, без CRC и padding
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+_FRAME_LENGTH = 144 * 128000 // 44100
+_FRAME_SECONDS = 1152 / 44100
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """mp3 из "пустых" фреймов: декодируется как тишина, длительность читается get_mp3_duration."""
+    frames = max(1, round(seconds / _FRAME_SECONDS))
+    frame = _FRAME_HEADER + bytes(_FRAME_LENGTH - len(_FRAME_HEADER))
+    return frame * frames
+
+
+class FakeTTSServer(FakeServer):
+    """
+    Фейковый ElevenLabs. Кроме параметров FakeServer (script, quota_rps и т. д. передаются как есть):
+    - seconds_per_char: сколько секунд звука приходится на символ текста.
+    Поддерживает /v1/text-to-speech/{voice_id} (и /stream) и /with-timestamps.
+    """
+
+    counter_names = ("convert", "with_timestamps", "bytes")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, seconds_per_char: float = 0.06, **options):
+        super().__init__(host, port, latency, error_rate, error_status, **options)
+        self.seconds_per_char = seconds_per_char
+
+    def handle(self, handler, method: str):
+        if method != "POST" or "/text-to-speech/" not in handler.path:
+            return handler.send_json(404, {"detail": {"message": handler.path}})
+
+        body = json.loads(handler.read_body() or b"{}")
+        text = body.get("text") or ""
+        with_timestamps = "/with-timestamps" in handler.path
+        self.count("with_timestamps" if with_timestamps else "convert")
+        error = self.error_for_request()
+        if error:
+            return self.send_error_response(handler, error)
+
+        audio = silent_mp3(len(text) * self.seconds_per_char)
+        with self._lock:
+            self.counters["bytes"] += len(audio)
+
+        if not with_timestamps:
+            return handler.send_body(200, audio, "audio/mpeg")
+
+        # Равномерные посимвольные тайминги по всей длине звука
+        step = len(audio) // _FRAME_LENGTH * _FRAME_SECONDS / max(1, len(text))
+        alignment = {
+            "characters": list(text),
+            "character_start_times_seconds": [i * step for i in range(len(text))],
+            "character_end_times_seconds": [(i + 1) * step for i in range(len(text))],
+        }
+        handler.send_json(200, {
+            "audio_base64": base64.b64encode(audio).decode("ascii"),
+            "alignment": alignment,
+            "normalized_alignment": alignment,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seconds-per-char", type=float, default=0.06)
+    parser.add_argument("--quota-rps", type=float, default=0.0, help="сверх квоты — 429 с Retry-After")
+    args = parser.parse_args()
+
+    server = FakeTTSServer(
+        port=args.port, latency=args.latency, error_rate=args.error_rate,
+        seconds_per_char=args.seconds_per_char, quota_rps=args.quota_rps
+    ).start()
+    print(f"Fake ElevenLabs: {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,24 @@
 import logging
 import os
 import asyncio
-import time # <-- Добавлен time для base_filename
+import shutil
+import time
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message, FSInputFile
 
 # Импортируем ваш класс пайплайна
-from src.pipeline import VideoPipeline 
+from src import metrics
+from src.async_pipeline import AsyncVideoPipeline
+from src.cache import ResultCache, file_sha256
+from src.ffmpeg_progress import RenderProgress
+from src.job_queue import JobQueue, QueuedJob
+from src.journal import JobJournal, JobRecord
+from src.pipeline import SUBTITLE_MODES
+from src.scheduler import JobRejected, JobScheduler
+from src.workspace import Workspace, WorkspaceFull
 
 # --- Настройка ---
 load_dotenv()
@@ -28,6 +38,49 @@ if not TELEGRAM_BOT_TOKEN:
 os.makedirs("tmp", exist_ok=True)
 os.makedirs("results", exist_ok=True)
 
+# Очередь задач: воркеры, размер очереди, лимит на пользователя
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "2"))
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", "20"))
+BOT_PER_USER_LIMIT = int(os.getenv("BOT_PER_USER_LIMIT", "1"))
+
+# Режим субтитров, выбранный пользователем командой /subs (до перезапуска бота)
+USER_SUBTITLE_MODES: dict[int, str] = {}
+
+# Кэш готовых роликов: повторное видео отправляется по Telegram file_id (0 записей — выключен)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+# Журнал задач: после сбоя или перезапуска задача продолжает с последнего этапа
+# (число попыток на задачу; 0 — журнал выключен)
+JOB_JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOB_JOURNAL_MAX_ATTEMPTS", "3"))
+
+# Где рендерить: local — в процессе бота, queue — отдельными процессами worker.py
+# через общую очередь (RENDER_QUEUE_PATH) и хранилище входов/результатов (RENDER_SHARED_DIR)
+RENDER_MODE = os.getenv("RENDER_MODE", "local")
+RENDER_QUEUE_PATH = os.getenv("RENDER_QUEUE_PATH", "shared/queue.sqlite3")
+RENDER_SHARED_DIR = os.getenv("RENDER_SHARED_DIR", "shared/jobs")
+RENDER_POLL_SECONDS = float(os.getenv("RENDER_POLL_SECONDS", "1.0"))
+
+# Статус задачи по этапу, о котором сообщил воркер (режим queue)
+STAGE_MESSAGES = {
+    "text": "Этап 1/3: Анализирую видео... (Gemini) 🧠",
+    "audio": "Этап 2/3: Генерирую озвучку и субтитры... (ElevenLabs + FFmpeg) 🎙️",
+    "render": "Этап 3/3: Собираю финальное видео... (FFmpeg) 🎬",
+}
+
+# Размер блока потокового скачивания (хэш и прокси для Gemini считаются по ходу)
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE_KB", "256")) * 1024
+
+# Прогресс сборки в статусе: не чаще одного редактирования за столько секунд
+# (Telegram ограничивает частоту edit_message_text)
+STATUS_EDIT_INTERVAL = float(os.getenv("STATUS_EDIT_INTERVAL", "3"))
+
+# Выставляется при остановке бота: отменённые задачи остаются в журнале
+SHUTDOWN = asyncio.Event()
+
+# Эндпоинт Prometheus /metrics (0 — выключен)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
 # --- Обработчики Бота (Aiogram) ---
 
 router = Router()
@@ -38,91 +91,522 @@ async def start_handler(message: Message):
     await message.answer(
         "Привет! 👋\n"
         "Отправь мне видео, и я добавлю к нему закадровый голос "
-        "и субтитры."
+        "и субтитры.\n"
+        "Передумал? /cancel отменит обработку.\n"
+        "/subs — выбрать, как показывать субтитры."
     )
 
+@router.message(Command("cancel"))
+async def cancel_handler(message: Message, scheduler: JobScheduler, render_queue: JobQueue | None):
+    """Отменяет видео пользователя в очереди и в обработке (ffmpeg будет остановлен)."""
+    cancelled = await scheduler.cancel_user(message.from_user.id)
+    if render_queue:
+        # Воркер узнает об отмене на следующем heartbeat, статус обновит watch_render_queue
+        cancelled += len(await asyncio.to_thread(render_queue.cancel_user, message.from_user.id))
+    if cancelled:
+        await message.answer(f"Отменено видео: {cancelled} ✋")
+    else:
+        await message.answer("Нет видео в обработке.")
+
+@router.message(Command("subs"))
+async def subtitles_handler(message: Message, pipeline: AsyncVideoPipeline):
+    """Выбор режима субтитров: /subs soft — отдельной дорожкой (быстрее), /subs burn — в кадре."""
+    parts = (message.text or "").split()
+    if len(parts) < 2 or parts[1] not in SUBTITLE_MODES:
+        current = USER_SUBTITLE_MODES.get(message.from_user.id, pipeline.subtitle_mode)
+        await message.answer(
+            f"Сейчас субтитры: {current}.\n"
+            "/subs burn — вжечь в видео (видны везде)\n"
+            "/subs soft — отдельной дорожкой (готово быстрее, включаются в плеере)"
+        )
+        return
+    USER_SUBTITLE_MODES[message.from_user.id] = parts[1]
+    await message.answer(f"Режим субтитров: {parts[1]} ✅")
+
+def format_eta(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} с"
+    return f"{seconds // 60} мин {seconds % 60:02d} с"
+
+class StatusProgress:
+    """
+    Показывает прогресс сборки (процент и ETA) в сообщении о статусе.
+    Редактирует не чаще STATUS_EDIT_INTERVAL и не начинает новое редактирование,
+    пока не закончилось предыдущее. Передаётся в create_video_async как progress.
+    """
+
+    def __init__(self, status_message: Message):
+        self.status_message = status_message
+        self._last_edit = 0.0
+        self._last_text = None
+        self._pending: asyncio.Task | None = None
+
+    def __call__(self, progress: RenderProgress):
+        if progress.done or progress.percent is None:
+            return
+        now = time.monotonic()
+        if now - self._last_edit < STATUS_EDIT_INTERVAL or (self._pending and not self._pending.done()):
+            return
+        text = f"Этап 3/3: Собираю финальное видео... {progress.percent:.0f}%"
+        if progress.eta is not None:
+            text += f", осталось ~{format_eta(progress.eta)}"
+        text += " 🎬"
+        if text == self._last_text:
+            return
+        self._last_edit, self._last_text = now, text
+        self._pending = asyncio.create_task(self._edit(text))
+
+    async def _edit(self, text: str):
+        try:
+            await self.status_message.edit_text(text)
+        except Exception as e:
+            logger.debug(f"Не удалось обновить прогресс: {e}")
+
+    async def close(self):
+        """Дожидается последнего редактирования, чтобы оно не перезаписало следующий статус."""
+        if self._pending:
+            await asyncio.gather(self._pending, return_exceptions=True)
+
+async def send_cached_result(message: Message, result_cache: ResultCache | None,
+                             key: str | None = None, file_unique_id: str | None = None) -> bool:
+    """
+    Отправляет готовый ролик из кэша результатов. False — в кэше нет
+    (или file_id больше не работает и сохранённого файла нет).
+    """
+    if not result_cache:
+        return False
+    cached = result_cache.get(key=key, file_unique_id=file_unique_id)
+    if cached is None:
+        if key:
+            metrics.CACHE_LOOKUPS.inc(cache="result", result="miss")
+        return False
+
+    try:
+        await message.answer_video(video=cached["file_id"], caption=cached["caption"])
+    except TelegramBadRequest as e:
+        if not cached["artifact_path"]:
+            logger.warning(f"file_id из кэша не принят ({e}), обрабатываю видео заново")
+            result_cache.invalidate(cached["key"])
+            return False
+        # file_id не принят — отправляем сохранённый файл и запоминаем новый file_id
+        sent = await message.answer_video(video=FSInputFile(cached["artifact_path"]), caption=cached["caption"])
+        result_cache.update_file_id(cached["key"], sent.video.file_id)
+
+    metrics.CACHE_LOOKUPS.inc(cache="result", result="hit")
+    logger.info(f"Готовый ролик отправлен из кэша (чат {message.chat.id})")
+    return True
+
 @router.message(F.video)
-async def handle_video(message: Message, bot: Bot, pipeline: VideoPipeline):
-    """Обрабатывает полученное видео с пошаговым обновлением статуса."""
+async def handle_video(message: Message, bot: Bot, pipeline: AsyncVideoPipeline, scheduler: JobScheduler,
+                       result_cache: ResultCache | None, journal: JobJournal | None,
+                       render_queue: JobQueue | None):
+    """Ставит полученное видео в очередь на обработку."""
     if not message.video:
         await message.answer("Пожалуйста, отправьте видеофайл.")
         return
 
-    video_file = message.video
-    input_video_path = f"tmp/input_{video_file.file_id}.mp4"
-    final_path = None # Для блока finally
-    
+    # Тот же ролик уже делали с теми же настройками — отвечаем сразу, без скачивания
+    subtitle_mode = USER_SUBTITLE_MODES.get(message.from_user.id)
+    variant = pipeline.result_variant(subtitle_mode)
+    if await send_cached_result(message, result_cache, file_unique_id=f"{message.video.file_unique_id}:{variant}"):
+        return
+
     # 1. Отправляем и сохраняем сообщение о статусе
-    status_message = await message.answer("Видео получено. Скачиваю... 📥")
+    status_message = await message.answer("Видео получено. Ставлю в очередь... ⏳")
+
+    record = JobRecord(
+        job_id=pipeline.new_job_id(),
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        file_id=message.video.file_id,
+        file_unique_id=message.video.file_unique_id,
+        file_size=message.video.file_size or 0,
+        subtitle_mode=subtitle_mode,
+    )
+    if render_queue:
+        await enqueue_render(bot, pipeline, render_queue, status_message, record, result_cache)
+        return
+    await enqueue_job(bot, pipeline, scheduler, status_message, record, result_cache, journal)
+
+async def download_video(bot: Bot, pipeline: AsyncVideoPipeline, file_id: str, path: str,
+                         workdir: str | None = None, proxy: bool = True) -> str | None:
+    """
+    Скачивает видео из Telegram потоком: по ходу считается sha256 (ключ кэшей),
+    а при proxy — собирается прокси для Gemini (см. AsyncVideoPipeline.ingest_async).
+    Недокачанный вход не выглядит скачанным. Возвращает sha256 или None, если он не посчитан.
+    """
+    logger.info(f"Скачиваю видео: {file_id}")
+    with metrics.stage("download"), metrics.api_call("telegram", "download"):
+        file_info = await bot.get_file(file_id)
+        if bot.session.api.is_local:
+            # Локальный Bot API-сервер отдаёт файл с диска — потоковый приём не нужен
+            download_path = path + ".part"
+            await bot.download_file(file_info.file_path, destination=download_path)
+            os.replace(download_path, path)
+            metrics.API_BYTES.inc(os.path.getsize(path), api="telegram", direction="received")
+            content_hash = None
+        else:
+            chunks = bot.session.stream_content(
+                bot.session.api.file_url(bot.token, file_info.file_path), chunk_size=DOWNLOAD_CHUNK_SIZE
+            )
+            content_hash = await pipeline.ingest_async(chunks, path, workdir, proxy)
+    logger.info(f"Видео сохранено: {path}")
+    return content_hash
+
+async def enqueue_render(bot: Bot, pipeline: AsyncVideoPipeline, render_queue: JobQueue,
+                         status_message: Message, record: JobRecord, result_cache: ResultCache | None = None):
+    """
+    Режим queue: скачивает видео в общее хранилище и кладёт задачу в очередь рендеринга.
+    Обрабатывает её worker.py, результат отправляет watch_render_queue.
+    """
+    # Вызовы очереди — в потоке: её блокировку записи могут держать воркеры
+    if await asyncio.to_thread(render_queue.depth) >= BOT_QUEUE_SIZE:
+        logger.warning(f"Очередь рендеринга заполнена, задача отклонена ({record.user_id})")
+        await status_message.edit_text(
+            "Сейчас слишком много видео в обработке. Попробуйте чуть позже. 🙏"
+        )
+        return
+
+    job_dir = os.path.join(RENDER_SHARED_DIR, record.job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    try:
+        await status_message.edit_text("Скачиваю видео... 📥")
+        input_video_path = os.path.join(job_dir, "input.mp4")
+        # Прокси здесь не собираем: бот в этом режиме не должен занимать ядра
+        content_hash = await download_video(bot, pipeline, record.file_id, input_video_path, proxy=False)
+
+        # Другой file_unique_id, но то же содержимое — отвечаем готовым роликом
+        result_key = None
+        if result_cache:
+            content_hash = content_hash or await asyncio.to_thread(file_sha256, input_video_path)
+            result_key = ResultCache.make_key(content_hash, pipeline.result_variant(record.subtitle_mode))
+            if await send_cached_result(status_message, result_cache, key=result_key):
+                shutil.rmtree(job_dir, ignore_errors=True)
+                await status_message.delete()
+                metrics.JOBS.inc(result="cached")
+                return
+
+        await asyncio.to_thread(render_queue.put, record.job_id, record.user_id, {
+            "chat_id": record.chat_id,
+            "status_message_id": status_message.message_id,
+            "file_unique_id": record.file_unique_id,
+            "subtitle_mode": record.subtitle_mode,
+            "job_dir": job_dir,
+            "result_key": result_key,
+            "result_variant": pipeline.result_variant(record.subtitle_mode),
+        })
+    except Exception as e:
+        logger.error(f"Не удалось поставить задачу в очередь рендеринга: {e}", exc_info=True)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        await status_message.edit_text("Произошла критическая ошибка. 🤯")
+        return
+    logger.info(f"Задача {record.job_id} в очереди рендеринга")
+    await status_message.edit_text("Видео в очереди на обработку ⏳")
+
+async def watch_render_queue(bot: Bot, render_queue: JobQueue, result_cache: ResultCache | None):
+    """Режим queue: показывает этапы задач в статусе и отправляет пользователям готовые результаты."""
+    shown_stages: dict[str, str] = {}
+    while True:
+        try:
+            for job in await asyncio.to_thread(render_queue.jobs):
+                await report_render_job(bot, render_queue, job, shown_stages, result_cache)
+        except Exception as e:
+            logger.error(f"Ошибка при разборе очереди рендеринга: {e}", exc_info=True)
+        await asyncio.sleep(RENDER_POLL_SECONDS)
+
+async def report_render_job(bot: Bot, render_queue: JobQueue, job: QueuedJob,
+                            shown_stages: dict[str, str], result_cache: ResultCache | None):
+    """Обновляет статус одной задачи из очереди; завершённую отправляет и удаляет из очереди."""
+    chat_id = job.payload["chat_id"]
+    status_message_id = job.payload["status_message_id"]
+
+    if job.status in ("queued", "leased"):
+        if job.stage in STAGE_MESSAGES and shown_stages.get(job.job_id) != job.stage:
+            shown_stages[job.job_id] = job.stage
+            try:
+                await bot.edit_message_text(STAGE_MESSAGES[job.stage], chat_id=chat_id, message_id=status_message_id)
+            except TelegramBadRequest:
+                pass # Текст не изменился (после перезапуска бота) или сообщение удалено
+        return
+
+    try:
+        if job.status == "done":
+            result_path = job.result["result_path"]
+            caption = job.result.get("title") or "Ваше видео готово!"
+            with metrics.stage("send"), metrics.api_call("telegram", "send_video"):
+                sent = await bot.send_video(chat_id, FSInputFile(result_path), caption=caption)
+            metrics.API_BYTES.inc(os.path.getsize(result_path), api="telegram", direction="sent")
+            if result_cache and job.payload.get("result_key"):
+                result_cache.put(
+                    job.payload["result_key"], sent.video.file_id, caption,
+                    file_unique_id=f"{job.payload['file_unique_id']}:{job.payload['result_variant']}",
+                    artifact_src=result_path
+                )
+            await bot.delete_message(chat_id, status_message_id)
+            metrics.JOBS.inc(result="ok")
+        elif job.status == "failed":
+            logger.error(f"Задача {job.job_id} провалена: {(job.result or {}).get('error')}")
+            await bot.edit_message_text(
+                "Ошибка: Не удалось обработать видео. 😢", chat_id=chat_id, message_id=status_message_id
+            )
+        elif job.status == "cancelled":
+            await bot.edit_message_text("Обработка отменена. ✋", chat_id=chat_id, message_id=status_message_id)
+    except TelegramBadRequest as e:
+        # Чат или сообщение недоступны — повторять бесполезно
+        logger.warning(f"Задача {job.job_id}: не удалось сообщить результат ({e})")
+    # Прочие ошибки (сеть) пробрасываются: задача останется в очереди до следующего опроса
+
+    await asyncio.to_thread(render_queue.remove, job.job_id)
+    shutil.rmtree(job.payload["job_dir"], ignore_errors=True)
+    shown_stages.pop(job.job_id, None)
+
+async def enqueue_job(bot: Bot, pipeline: AsyncVideoPipeline, scheduler: JobScheduler,
+                      status_message: Message, record: JobRecord,
+                      result_cache: ResultCache | None = None, journal: JobJournal | None = None):
+    """
+    Резервирует рабочую папку и ставит задачу в очередь: новую или из журнала после перезапуска.
+    Упавшая попытка повторяется с последнего сохранённого в журнале этапа.
+    """
+    # Резервируем место под файлы задачи заранее: если места нет — отказываем сразу
+    try:
+        workspace = pipeline.workspaces.acquire(pipeline.estimate_job_bytes(record.file_size), record.job_id)
+    except WorkspaceFull as e:
+        logger.warning(f"Нет места под задачу ({record.user_id}): {e}")
+        if journal:
+            journal.finish(record.job_id)
+        await status_message.edit_text(
+            "Сейчас слишком много видео в обработке. Попробуйте чуть позже. 🙏"
+        )
+        return
+
+    if journal and journal.get(record.job_id) is None:
+        journal.add(record)
+
+    async def on_position(position: int):
+        await status_message.edit_text(f"Видео в очереди. Позиция: {position} ⏳")
+
+    async def run():
+        try:
+            while True:
+                job_result = await process_video(bot, pipeline, status_message, workspace, record,
+                                                 result_cache, journal)
+                if job_result != "error" or not journal or not journal.can_retry(record.job_id):
+                    break
+                # Сбой (ffmpeg, сеть): пробуем ещё раз, сохранённые этапы не повторяются
+                logger.warning(f"Задача {record.job_id} упала, повторяю с последнего сохранённого этапа")
+                await status_message.edit_text("Сбой при обработке, пробую ещё раз... 🔁")
+        except asyncio.CancelledError:
+            # При остановке бота задача остаётся в журнале и продолжится после запуска
+            if journal and not SHUTDOWN.is_set():
+                journal.finish(record.job_id)
+            raise
+        else:
+            if journal:
+                journal.finish(record.job_id)
+        finally:
+            # 5. Очистка: вся рабочая папка задачи (вход, промежуточные файлы, результат)
+            workspace.cleanup()
+
+    async def on_cancel():
+        workspace.cleanup()
+        if SHUTDOWN.is_set() and journal:
+            await status_message.edit_text("Бот перезапускается, видео обработаю после запуска. ⏳")
+            return
+        if journal:
+            journal.finish(record.job_id)
+        await status_message.edit_text("Обработка отменена. ✋")
+
+    try:
+        await scheduler.submit(record.user_id, run, on_position, on_cancel)
+    except JobRejected as e:
+        workspace.cleanup()
+        if journal:
+            journal.finish(record.job_id)
+        logger.warning(f"Задача отклонена ({record.user_id}): {e}")
+        await status_message.edit_text(
+            "Сейчас слишком много видео в обработке. Попробуйте чуть позже. 🙏"
+        )
+
+async def process_video(bot: Bot, pipeline: AsyncVideoPipeline, status_message: Message,
+                        workspace: Workspace, record: JobRecord,
+                        result_cache: ResultCache | None = None, journal: JobJournal | None = None) -> str:
+    """
+    Одна попытка обработки видео с пошаговым обновлением статуса (запускается воркером очереди).
+    Все файлы задачи лежат в её рабочей папке; текст, озвучка и SRT сохраняются в журнал,
+    и следующая попытка начинает с того, что уже сделано. Возвращает результат для метрик
+    ("ok", "cached", "failed" или "error" — сбой, который имеет смысл повторить).
+    """
+    input_video_path = workspace.file("input.mp4")
+    prep_task = None
+    result_key = None
+    content_hash = None
+    job_result = "error"
+    job_started = time.perf_counter()
+    # Что сделали прошлые попытки (после сбоя или перезапуска бота)
+    checkpoint = journal.get(record.job_id) if journal else None
+    if journal:
+        journal.begin_attempt(record.job_id)
 
     try:
-        # 2. Скачиваем видео
-        logger.info(f"Скачиваю видео: {video_file.file_id}")
-        file_info = await bot.get_file(video_file.file_id)
-        await bot.download_file(file_info.file_path, destination=input_video_path)
-        logger.info(f"Видео сохранено: {input_video_path}")
+        # 2. Скачиваем видео (при повторе в той же рабочей папке оно уже есть)
+        if not os.path.exists(input_video_path):
+            await status_message.edit_text("Скачиваю видео... 📥")
+            content_hash = await download_video(bot, pipeline, record.file_id, input_video_path, workspace.path)
+
+        # Другой file_unique_id, но то же содержимое — тоже отвечаем готовым роликом
+        if result_cache:
+            content_hash = content_hash or await asyncio.to_thread(file_sha256, input_video_path)
+            result_key = ResultCache.make_key(content_hash, pipeline.result_variant(record.subtitle_mode))
+            if await send_cached_result(status_message, result_cache, key=result_key):
+                job_result = "cached"
+                await status_message.delete()
+                return job_result
+
+        # Подготовка видео (staged-режим) идёт в фоне, пока работают Gemini и TTS
+        prep_task = pipeline.start_prepare(input_video_path, workspace.path, record.subtitle_mode)
 
         # --- 3. Запускаем пайплайн ---
         
         # Шаг 1: Текст
-        await status_message.edit_text("Этап 1/3: Анализирую видео... (Gemini) 🧠")
-        text_data = await asyncio.to_thread(pipeline.get_desc_video, input_video_path)
+        if checkpoint and checkpoint.text_data:
+            text_data = checkpoint.text_data
+            logger.info(f"Задача {record.job_id}: текст взят из журнала")
+        else:
+            await status_message.edit_text("Этап 1/3: Анализирую видео... (Gemini) 🧠")
+            text_data = await pipeline.get_desc_video_async(
+                input_video_path, record.file_unique_id, workspace.path, content_hash
+            )
         
-        if not text_data or not text_data.get("content"):
-            logger.error("Пайплайн не вернул текст.")
-            await status_message.edit_text("Ошибка: Не удалось получить текст из видео. 😢")
-            return
+            if not text_data or not text_data.get("content"):
+                logger.error("Пайплайн не вернул текст.")
+                job_result = "failed"
+                await status_message.edit_text("Ошибка: Не удалось получить текст из видео. 😢")
+                return job_result
+            # Ответ с ошибкой Gemini (пустой title, текст ошибки в content) не озвучиваем
+            # и не кэшируем: это сбой, повтор спросит Gemini снова
+            if not text_data.get("title"):
+                logger.error(f"Gemini не дал описание: {text_data['content']}")
+                await status_message.edit_text("Ошибка: Не удалось получить текст из видео. 😢")
+                return job_result
+            if journal:
+                journal.save_text(record.job_id, text_data)
 
         # Шаг 2: Аудио и Субтитры
-        await status_message.edit_text("Этап 2/3: Генерирую озвучку и субтитры... (ElevenLabs + FFmpeg) 🎙️")
-        base_filename = str(int(time.time()))
-        audio_path, srt_path = await asyncio.to_thread(
-            pipeline.generate_audio_and_srt, text_data["content"], base_filename
-        )
+        restored = None
+        if checkpoint and checkpoint.stage == "audio":
+            restored = await asyncio.to_thread(journal.restore_audio, record.job_id, workspace.path)
+        if restored:
+            audio_path, srt_path = restored
+            logger.info(f"Задача {record.job_id}: озвучка и SRT взяты из журнала")
+        else:
+            await status_message.edit_text("Этап 2/3: Генерирую озвучку и субтитры... (ElevenLabs + FFmpeg) 🎙️")
+            audio_path, srt_path = await pipeline.generate_audio_and_srt_async(
+                text_data["content"], "voice", workspace.path
+            )
 
-        if not audio_path or not srt_path:
-            logger.error("Пайплайн не вернул аудио/srt.")
-            await status_message.edit_text("Ошибка: Не удалось сгенерировать аудио. 😢")
-            return
+            if not audio_path or not srt_path:
+                logger.error("Пайплайн не вернул аудио/srt.")
+                job_result = "failed"
+                await status_message.edit_text("Ошибка: Не удалось сгенерировать аудио. 😢")
+                return job_result
+            if journal:
+                await asyncio.to_thread(
+                    journal.save_audio, record.job_id, audio_path, srt_path, pipeline.audio_chunks(audio_path)
+                )
 
         # Шаг 3: Сборка
         await status_message.edit_text("Этап 3/3: Собираю финальное видео... (FFmpeg) 🎬")
-        final_path = f"results/video_{base_filename}.mp4"
-        created = await asyncio.to_thread(
-            pipeline.create_video, audio_path, input_video_path, final_path, srt_path
-        )
+        final_path = workspace.file("result.mp4")
+        render_input = await pipeline.finish_prepare(prep_task, input_video_path)
+        status_progress = StatusProgress(status_message)
+        try:
+            created = await pipeline.create_video_async(
+                audio_path, render_input, final_path, srt_path, record.subtitle_mode, status_progress
+            )
+        finally:
+            await status_progress.close()
 
         # 4. Отправляем результат
-        if created and final_path:
+        if created:
             logger.info(f"Отправляю готовое видео: {final_path}")
-            caption = text_data.get('title', 'Ваше видео готово!')
+            caption = text_data["title"]
             
             await status_message.edit_text("Готово! Отправляю видео... 🚀")
-            await message.answer_video(
-                video=FSInputFile(final_path), 
-                caption=caption
-            )
+            with metrics.stage("send"), metrics.api_call("telegram", "send_video"):
+                sent = await status_message.answer_video(
+                    video=FSInputFile(final_path), 
+                    caption=caption
+                )
+            metrics.API_BYTES.inc(os.path.getsize(final_path), api="telegram", direction="sent")
+            job_result = "ok"
+            # Запоминаем file_id: повтор этого видео отправится без обработки
+            # (сюда доходит только текст из успешного ответа Gemini — с title)
+            if result_cache and result_key:
+                result_cache.put(
+                    result_key, sent.video.file_id, caption,
+                    file_unique_id=f"{record.file_unique_id}:{pipeline.result_variant(record.subtitle_mode)}",
+                    artifact_src=final_path
+                )
             # Удаляем сообщение о статусе
             await status_message.delete()
         
         else:
+            # Сборка могла упасть на ffmpeg — повтор начнётся с сохранённой озвучки
             logger.error("Пайплайн не смог создать финальное видео.")
             await status_message.edit_text("Ошибка: Не удалось собрать финальное видео. 😢")
 
+    except asyncio.CancelledError:
+        # Пользователь отменил задачу или бот останавливается: ffmpeg уже убит пайплайном
+        logger.info(f"Обработка видео {record.file_id} отменена")
+        job_result = "cancelled"
+        try:
+            if SHUTDOWN.is_set() and journal:
+                await status_message.edit_text("Бот перезапускается, продолжу после запуска. ⏳")
+            else:
+                await status_message.edit_text("Обработка отменена. ✋")
+        except Exception:
+            pass
+        raise
+
     except Exception as e:
-        logger.error(f"Ошибка в handle_video: {e}", exc_info=True)
+        logger.error(f"Ошибка в process_video: {e}", exc_info=True)
         # Проверяем, существует ли еще сообщение, прежде чем его редактировать
         if status_message:
             await status_message.edit_text("Произошла критическая ошибка. 🤯")
     
     finally:
-        # 5. Очистка
-        if os.path.exists(input_video_path):
-            os.remove(input_video_path)
-            logger.info(f"Удален входной файл: {input_video_path}")
-        if final_path and os.path.exists(final_path):
-            os.remove(final_path)
-            logger.info(f"Удален финальный файл: {final_path}")
+        await pipeline.discard_prepare(prep_task)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - job_started, stage="job")
+        metrics.JOBS.inc(result=job_result)
+
+    return job_result
+
+async def resume_jobs(bot: Bot, pipeline: AsyncVideoPipeline, scheduler: JobScheduler,
+                      result_cache: ResultCache | None, journal: JobJournal):
+    """Ставит в очередь задачи, не завершённые до перезапуска; они продолжат с сохранённого этапа."""
+    for record in journal.pending():
+        if record.attempts >= journal.max_attempts:
+            logger.warning(f"Задача {record.job_id}: попытки исчерпаны ({record.attempts}), удаляю из журнала")
+            journal.finish(record.job_id)
+            try:
+                await bot.send_message(
+                    record.chat_id, "Не удалось обработать видео. 😢 Попробуйте отправить его ещё раз."
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось уведомить пользователя {record.user_id}: {e}")
+            continue
+
+        try:
+            status_message = await bot.send_message(
+                record.chat_id, "Бот перезапускался. Продолжаю обработку вашего видео... ⏳"
+            )
+        except Exception as e:
+            logger.warning(f"Задача {record.job_id}: чат недоступен ({e}), удаляю из журнала")
+            journal.finish(record.job_id)
+            continue
+        logger.info(f"Продолжаю задачу {record.job_id} с этапа {record.stage}")
+        await enqueue_job(bot, pipeline, scheduler, status_message, record, result_cache, journal)
 
 @router.message()
 async def handle_other_messages(message: Message):
@@ -136,16 +620,81 @@ async def main():
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
     
     # 1. Создаем один экземпляр пайплайна
-    pipeline_instance = VideoPipeline()
+    pipeline_instance = AsyncVideoPipeline()
     
-    # 2. Передаем его в Dispatcher
-    dp = Dispatcher(pipeline=pipeline_instance)
+    # 2. Очередь задач с ограниченным числом воркеров;
+    # пока Gemini или ElevenLabs недоступны, новые задачи ждут в очереди
+    scheduler = JobScheduler(
+        workers=BOT_WORKERS, max_queue=BOT_QUEUE_SIZE, per_user_limit=BOT_PER_USER_LIMIT,
+        gate=pipeline_instance.wait_providers_async
+    )
+    await scheduler.start()
+
+    # Метрики: глубина очереди и число задач читаются при каждом запросе /metrics
+    # Режим queue: рендерят отдельные процессы worker.py, бот только ставит задачи и отправляет результаты
+    render_queue = None
+    if RENDER_MODE == "queue":
+        render_queue = JobQueue(RENDER_QUEUE_PATH)
+        os.makedirs(RENDER_SHARED_DIR, exist_ok=True)
+
+    metrics.QUEUE_DEPTH.set_function(
+        lambda: scheduler.queue_depth + (render_queue.depth() if render_queue else 0)
+    )
+    metrics.JOBS_RUNNING.set_function(lambda: scheduler.running)
+    metrics_server = metrics.MetricsServer(METRICS_HOST, METRICS_PORT).start() if METRICS_PORT else None
+
+    # Кэш готовых роликов (file_id в Telegram + при желании сами файлы)
+    result_cache = None
+    if RESULT_CACHE_MAX_ENTRIES > 0:
+        result_cache = ResultCache(
+            os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite3"),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", str(30 * 24 * 3600))),
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            artifacts_dir=os.getenv("RESULT_ARTIFACTS_DIR", "cache/results"),
+            max_artifact_bytes=int(os.getenv("RESULT_ARTIFACTS_MAX_MB", "512")) * 1024 * 1024
+        )
+
+    # Журнал задач (текст, озвучка и SRT каждой незавершённой задачи)
+    journal = None
+    if JOB_JOURNAL_MAX_ATTEMPTS > 0:
+        journal = JobJournal(
+            os.getenv("JOB_JOURNAL_PATH", "cache/jobs.sqlite3"),
+            os.getenv("JOB_JOURNAL_DIR", "cache/jobs"),
+            max_attempts=JOB_JOURNAL_MAX_ATTEMPTS
+        )
+
+    # 3. Передаем их в Dispatcher
+    dp = Dispatcher(
+        pipeline=pipeline_instance, scheduler=scheduler, result_cache=result_cache, journal=journal,
+        render_queue=render_queue
+    )
     
     dp.include_router(router)
     
     logger.info("Бот запускается...")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    watcher = None
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        # Задачи, прерванные прошлым запуском, продолжаются с сохранённого этапа
+        if journal:
+            await resume_jobs(bot, pipeline_instance, scheduler, result_cache, journal)
+        if render_queue:
+            watcher = asyncio.create_task(watch_render_queue(bot, render_queue, result_cache))
+        await dp.start_polling(bot)
+    finally:
+        SHUTDOWN.set()
+        if watcher:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        await scheduler.stop()
+        if metrics_server:
+            metrics_server.stop()
+        if result_cache:
+            result_cache.close()
+        if journal:
+            journal.close()
+        if render_queue:
+            render_queue.close()
 
 
 if __name__ == "__main__":
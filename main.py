@@ -1,16 +1,256 @@
-from src.convertToMp3 import convertToMp3
-from src.textFromVideo import getDescVideo
-from src.createVideo import createVideo
+# main.py
+"""
+Пакетная обработка без Telegram: озвучивает все видео из папки или по glob-шаблону
+и складывает готовые ролики в --output (для дозаполнения больших библиотек).
+
+    python main.py library/ "archive/**/*.mov" --output results/batch --jobs 4 --encode-jobs 2
+
+Итог каждого видео (статус, время этапов, путь результата) дописывается в журнал
+JSONL (--manifest, по умолчанию <output>/manifest.jsonl). При повторном запуске
+видео, уже готовые в журнале (тот же файл: размер и время изменения), пропускаются,
+а упавшие и недоделанные (прерванный запуск) обрабатываются заново.
+"""
+import argparse
+import asyncio
+import glob
+import json
 import logging
-import time
 import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from src.async_pipeline import AsyncVideoPipeline
+from src.pipeline import SUBTITLE_MODES
+from src.workspace import WorkspaceFull
+
+# --- Настройка ---
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v")
+
+
+class ItemFailed(Exception):
+    """Видео не обработано (ответ API или сборка); в журнал попадает сообщение."""
+
+
+class Manifest:
+    """
+    Журнал пакетной обработки: по строке JSON на каждое завершённое видео.
+    Файл только дописывается, актуальна последняя строка по входу — так прерванный
+    запуск не портит уже записанное.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        tail = ""
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    tail = line
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Пропускаю повреждённую строку журнала: {line[:80]!r}")
+                        continue
+                    self.entries[entry["input"]] = entry
+
+        self._file = open(path, "a", encoding="utf-8")
+        if tail and not tail.endswith("\n"):
+            # Запись оборвалась посреди строки: новая строка не должна к ней приклеиться
+            self._file.write("\n")
+
+    def is_done(self, input_path: str, input_key: str) -> bool:
+        entry = self.entries.get(input_path)
+        return bool(
+            entry and entry.get("status") == "done" and entry.get("input_key") == input_key
+            and os.path.exists(entry.get("output") or "")
+        )
+
+    def failed(self, input_path: str) -> bool:
+        entry = self.entries.get(input_path)
+        return bool(entry and entry.get("status") == "failed")
+
+    def write(self, entry: dict):
+        self.entries[entry["input"]] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def find_inputs(patterns: list[str], exclude_dir: str) -> list[str]:
+    """Видео из папок (рекурсивно) и glob-шаблонов; результаты прошлых запусков не берём."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                found.update(os.path.join(root, name) for name in names if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            found.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+    exclude_dir = os.path.abspath(exclude_dir) + os.sep
+    return sorted(path for path in map(os.path.abspath, found) if not path.startswith(exclude_dir))
+
+
+def input_key(path: str) -> str:
+    """Признак того, что файл не менялся с прошлого запуска (хэшировать всю библиотеку дорого)."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def output_path_for(path: str, root: str, output_dir: str) -> str:
+    """Результат повторяет структуру папок входа относительно общего корня."""
+    relative = os.path.splitext(os.path.relpath(path, root))[0]
+    return os.path.join(output_dir, relative + ".mp4")
+
+
+@contextmanager
+def stage_timer(stages: dict, name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = round(time.perf_counter() - started, 3)
+
+
+async def process_item(pipeline: AsyncVideoPipeline, path: str, output_path: str, subtitle_mode: str | None,
+                       api_slots: asyncio.Semaphore, encode_slots: asyncio.Semaphore, stages: dict) -> dict:
+    """
+    Те же шаги, что у задачи бота: Gemini и TTS под лимитом api_slots, сборка — под encode_slots.
+    Пока одно видео собирается, следующие уже ждут ответов API.
+    """
+    # Пишем во временный файл: прерванная сборка не оставит "готовый" ролик
+    partial_path = os.path.splitext(output_path)[0] + ".partial.mp4"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    try:
+        workspace = pipeline.workspaces.acquire(pipeline.estimate_job_bytes(os.path.getsize(path)))
+    except WorkspaceFull as e:
+        raise ItemFailed(str(e))
+
+    prep_task = None
+    try:
+        async with api_slots:
+            # Пока Gemini или ElevenLabs недоступны, видео ждёт, а не падает
+            await pipeline.wait_providers_async()
+            # Подготовка видео (staged-режим) идёт в фоне, пока работают Gemini и TTS
+            prep_task = pipeline.start_prepare(path, workspace.path, subtitle_mode)
+
+            with stage_timer(stages, "text"):
+                text_data = await pipeline.get_desc_video_async(path, None, workspace.path)
+            if not text_data or not text_data.get("content"):
+                raise ItemFailed("Не удалось получить текст из видео")
+            # Ответ с ошибкой (пустой title) в библиотеку не озвучиваем: повтор спросит Gemini снова
+            if not text_data.get("title"):
+                raise ItemFailed(text_data["content"])
+
+            with stage_timer(stages, "audio"):
+                audio_path, srt_path = await pipeline.generate_audio_and_srt_async(
+                    text_data["content"], "voice", workspace.path
+                )
+            if not audio_path or not srt_path:
+                raise ItemFailed("Не удалось сгенерировать аудио")
+
+        async with encode_slots:
+            with stage_timer(stages, "render"):
+                render_input = await pipeline.finish_prepare(prep_task, path)
+                if not await pipeline.create_video_async(audio_path, render_input, partial_path, srt_path, subtitle_mode):
+                    raise ItemFailed("Не удалось собрать финальное видео")
+        os.replace(partial_path, output_path)
+
+        return {"title": text_data.get("title"), "content": text_data["content"]}
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        await pipeline.discard_prepare(prep_task)
+        workspace.cleanup()
+
+
+async def run_batch(args) -> int:
+    """Обрабатывает все найденные видео. Возвращает код выхода (1 — были ошибки)."""
+    manifest = Manifest(args.manifest or os.path.join(args.output, "manifest.jsonl"))
+    inputs = find_inputs(args.inputs, args.output)
+    if not inputs:
+        logger.error("Видео не найдены")
+        manifest.close()
+        return 1
+
+    root = os.path.commonpath([os.path.dirname(path) for path in inputs])
+    todo = []
+    for path in inputs:
+        key = input_key(path)
+        if manifest.is_done(path, key) or (args.skip_failed and manifest.failed(path)):
+            continue
+        todo.append((path, key))
+    logger.info(f"Найдено видео: {len(inputs)}, уже обработано: {len(inputs) - len(todo)}, в работе: {len(todo)}")
+
+    pipeline = AsyncVideoPipeline()
+    api_slots = asyncio.Semaphore(max(1, args.jobs))
+    encode_slots = asyncio.Semaphore(max(1, args.encode_jobs))
+    # Видео "в работе" (с рабочей папкой) — не больше, чем влезает в оба этапа сразу
+    in_flight = asyncio.Semaphore(max(1, args.jobs) + max(1, args.encode_jobs))
+    results = {"done": 0, "failed": 0}
+
+    async def run_one(n: int, path: str, key: str):
+        async with in_flight:
+            output_path = output_path_for(path, root, args.output)
+            entry = {"input": path, "input_key": key, "output": output_path, "started_at": time.time()}
+            stages = {}
+            logger.info(f"[{n}/{len(todo)}] {path}")
+            try:
+                with stage_timer(stages, "total"):
+                    entry.update(await process_item(
+                        pipeline, path, output_path, args.subtitle_mode, api_slots, encode_slots, stages
+                    ))
+                entry["status"] = "done"
+            except ItemFailed as e:
+                logger.error(f"{path}: {e}")
+                entry.update(status="failed", error=str(e))
+            except Exception as e:
+                logger.error(f"{path}: ошибка обработки: {e}", exc_info=True)
+                entry.update(status="failed", error=str(e))
+            entry.update(stages=stages, finished_at=time.time())
+            manifest.write(entry)
+            results[entry["status"]] += 1
+
+    try:
+        await asyncio.gather(*(run_one(n, path, key) for n, (path, key) in enumerate(todo, start=1)))
+    finally:
+        manifest.close()
+
+    logger.info(f"Готово: {results['done']}, с ошибкой: {results['failed']}, журнал: {manifest.path}")
+    return 1 if results["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="папки с видео и/или glob-шаблоны (** — рекурсивно)")
+    parser.add_argument("--output", default="results/batch", help="куда складывать готовые ролики")
+    parser.add_argument("--manifest", help="журнал JSONL (по умолчанию <output>/manifest.jsonl)")
+    parser.add_argument("--jobs", type=int, default=int(os.getenv("BATCH_JOBS", "4")),
+                        help="сколько видео одновременно на этапах Gemini и TTS")
+    parser.add_argument("--encode-jobs", type=int, default=int(os.getenv("BATCH_ENCODE_JOBS", "2")),
+                        help="сколько видео одновременно собирается (ядра делит ENCODE_CORES/ENCODE_THREADS)")
+    parser.add_argument("--subtitle-mode", choices=SUBTITLE_MODES, help="режим субтитров (по умолчанию SUBTITLE_MODE)")
+    parser.add_argument("--skip-failed", action="store_true", help="не повторять видео, упавшие в прошлых запусках")
+    args = parser.parse_args()
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        raise SystemExit(asyncio.run(run_batch(args)))
+    except KeyboardInterrupt:
+        logger.info("Остановлено вручную: недоделанные видео обработаются при следующем запуске.")
 
-videoPath = "tmp/video_for.mp4"
-text = getDescVideo(videoPath)
-audioPath = convertToMp3(text)
-final_fileName = str(int(time.time()))
-finalPath = f"results/video_{final_fileName}.mp4"
 
-created = createVideo(audioPath, videoPath, finalPath)
+if __name__ == "__main__":
+    main()
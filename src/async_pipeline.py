@@ -0,0 +1,687 @@
+# src/async_pipeline.py
+
+import asyncio
+import inspect
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+from elevenlabs import AsyncElevenLabs
+
+from src import metrics
+from src.ffmpeg_progress import (
+    STDERR_TAIL_LINES, FFmpegProgress, ProgressParser, ProgressTracker, RenderProgress, with_progress
+)
+from src.ingest import GrowingFile
+from src.mp3_duration import get_mp3_duration
+from src.pipeline import DESC_PROMPT, GEMINI_MODEL, VideoPipeline
+from src.subtitle_overlay import CueImage, CueImageWriter, PamParser, rasterize_cmd, write_cues_srt
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessError(Exception):
+    """Внешний процесс (ffmpeg/ffprobe) завершился с ошибкой."""
+
+    def __init__(self, cmd: list[str], returncode: int, stderr: str):
+        super().__init__(f"{cmd[0]} завершился с кодом {returncode}")
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+async def run_process(cmd: list[str], preexec_fn=None) -> str:
+    """
+    Запускает процесс через asyncio и возвращает его stdout.
+    При отмене задачи процесс убивается — ffmpeg не остаётся висеть после ухода пользователя.
+    """
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, preexec_fn=preexec_fn
+        )
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+                logger.info(f"Процесс {cmd[0]} (pid {proc.pid}) убит при отмене задачи")
+            raise
+    if proc.returncode != 0:
+        raise ProcessError(cmd, proc.returncode, stderr.decode(errors="replace"))
+    return stdout.decode(errors="replace")
+
+
+async def run_ffmpeg_async(cmd: list[str], on_progress: Callable[[FFmpegProgress], None] | None = None,
+                           preexec_fn=None):
+    """
+    Асинхронный аналог run_ffmpeg: прогресс из -progress по мере поступления,
+    от stderr — только хвост. При отмене задачи процесс убивается.
+    """
+    cmd = with_progress(cmd)
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def read_stderr():
+        async for line in proc.stderr:
+            stderr_tail.append(line.decode(errors="replace"))
+
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, preexec_fn=preexec_fn
+        )
+        stderr_task = asyncio.create_task(read_stderr())
+        try:
+            parser = ProgressParser()
+            async for line in proc.stdout:
+                progress = parser.feed(line.decode(errors="replace"))
+                if progress and on_progress:
+                    on_progress(progress)
+            await stderr_task
+            await proc.wait()
+        except asyncio.CancelledError:
+            stderr_task.cancel()
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+                logger.info(f"Процесс {cmd[0]} (pid {proc.pid}) убит при отмене задачи")
+            raise
+    if proc.returncode != 0:
+        raise ProcessError(cmd, proc.returncode, "".join(stderr_tail))
+
+
+@metrics.timed("subtitle_raster")
+async def render_cue_images_async(video_path: str, cues: list[tuple[float, float, str]],
+                                  workdir: str) -> list[CueImage]:
+    """
+    Асинхронный аналог render_cue_images: кадры PAM читаются из stdout по мере поступления,
+    при отмене задачи процесс убивается. Бросает ProcessError, если ffmpeg упал.
+    """
+    if not cues:
+        return []
+    write_cues_srt(cues, workdir)
+    cmd = rasterize_cmd(video_path, len(cues))
+    writer = CueImageWriter(cues, workdir)
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def read_stderr():
+        async for line in proc.stderr:
+            stderr_tail.append(line.decode(errors="replace"))
+
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=workdir, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stderr_task = asyncio.create_task(read_stderr())
+        try:
+            parser = PamParser()
+            while chunk := await proc.stdout.read(1 << 20):
+                for width, height, rgba in parser.feed(chunk):
+                    writer.add(width, height, rgba)
+            await stderr_task
+            await proc.wait()
+        except (asyncio.CancelledError, ValueError):
+            # Отмена или битый поток PAM: ffmpeg дальше не нужен
+            stderr_task.cancel()
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+                logger.info(f"Процесс {cmd[0]} (pid {proc.pid}) убит: отрисовка реплик прервана")
+            raise
+    if proc.returncode != 0:
+        raise ProcessError(cmd, proc.returncode, "".join(stderr_tail))
+    parser.close()
+    # PNG пишутся уже после выхода ffmpeg: сжатие всех реплик — в потоке, не на event loop
+    return await asyncio.to_thread(writer.finish)
+
+
+class AsyncVideoPipeline(VideoPipeline):
+    """
+    Тот же пайплайн, но полностью на asyncio, без asyncio.to_thread:
+    - ffmpeg/ffprobe через asyncio.create_subprocess_exec;
+    - асинхронные клиенты Gemini и ElevenLabs, созданные один раз (общий пул соединений);
+    - ожидание ACTIVE через asyncio.sleep.
+    Отмена задачи (пользователь отменил или бот останавливается) убивает дочерние процессы.
+    Команды ffmpeg и вспомогательная логика общие с VideoPipeline.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        if self.elevenlabs_api_key:
+            self.async_elevenlabs_client = AsyncElevenLabs(
+                base_url=os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io"),
+                api_key=self.elevenlabs_api_key
+            )
+        else:
+            self.async_elevenlabs_client = None
+
+    async def wait_providers_async(self):
+        """Ждёт, пока Gemini и ElevenLabs доступны (цепь замкнута, пауза по Retry-After прошла)."""
+        await self.gemini_limiter.wait_available_async()
+        await self.tts_limiter.wait_available_async()
+
+    async def _run_encode_async(self, cmd: list[str], on_progress: Callable[[FFmpegProgress], None] | None = None):
+        """Асинхронный аналог _run_encode: ожидание ядер не блокирует event loop."""
+        async with self.encoder.slot_async() as slot:
+            await run_ffmpeg_async(self._with_threads(cmd, slot.threads), on_progress, slot.preexec_fn)
+
+    # --- ШАГ 1: ГЕНЕРАЦИЯ ТЕКСТА ---
+
+    @metrics.timed("gemini_proxy")
+    async def make_upload_proxy_async(self, video_path: str, proxy_path: str) -> bool:
+        cmd = self._upload_proxy_cmd(video_path, proxy_path)
+        if not cmd:
+            return False
+        try:
+            await self._run_encode_async(cmd)
+            return True
+        except ProcessError as e:
+            logger.error(f"Ошибка FFmpeg при создании прокси для Gemini: {e.stderr}")
+            if os.path.exists(proxy_path):
+                os.remove(proxy_path)
+            return False
+
+    async def ingest_async(self, chunks: AsyncIterator[bytes], video_path: str,
+                           workdir: str | None = None, proxy: bool = True) -> str:
+        """
+        Потоковый приём видео за один проход: каждый блок сразу пишется на диск
+        и в sha256 (ключ кэшей), а ffmpeg идёт следом по растущему файлу и собирает
+        прокси для Gemini — к концу скачивания первый этап обычно почти готов.
+        Возвращает sha256 содержимого. Файл появляется под video_path только целиком.
+        """
+        part_path = video_path + ".part"
+        growing = GrowingFile(part_path)
+        proxy_task = None
+        if proxy and self._upload_proxy_cmd(video_path, "") is not None:
+            proxy_task = asyncio.create_task(
+                self._proxy_from_stream(growing, self._proxy_path(video_path, workdir))
+            )
+        try:
+            async for block in chunks:
+                growing.write(block)
+            growing.close()
+            # Прокси дочитывает файл до конца — ждём его до переименования.
+            # Его ошибка не должна ронять приём: без прокси Gemini получит оригинал
+            if proxy_task:
+                (outcome,) = await asyncio.gather(proxy_task, return_exceptions=True)
+                if isinstance(outcome, Exception):
+                    logger.warning(f"Прокси из потока не получился: {outcome}")
+        except BaseException:
+            growing.close()
+            if proxy_task:
+                proxy_task.cancel()
+                await asyncio.gather(proxy_task, return_exceptions=True)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        os.replace(part_path, video_path)
+        metrics.API_BYTES.inc(growing.size, api="telegram", direction="received")
+        return growing.hexdigest()
+
+    @metrics.timed("gemini_proxy_stream")
+    async def _proxy_from_stream(self, growing: GrowingFile, proxy_path: str) -> bool:
+        """
+        Прокси для Gemini из stdin ffmpeg, пока видео качается. Не вышло (например,
+        moov-атом в конце файла — такой mp4 не читается из трубы) — прокси не будет,
+        и get_desc_video_async соберёт его из готового файла как обычно.
+        """
+        part_path = f"{os.path.splitext(proxy_path)[0]}.part.mp4"
+        cmd = self._upload_proxy_cmd("pipe:0", part_path)
+        try:
+            async with self.encoder.slot_async() as slot:
+                with metrics.FFMPEG_IN_FLIGHT.track():
+                    proc = await asyncio.create_subprocess_exec(
+                        *self._with_threads(cmd, slot.threads), stdin=asyncio.subprocess.PIPE,
+                        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                        preexec_fn=slot.preexec_fn
+                    )
+                    # stderr читаем параллельно: иначе ffmpeg встанет на полном буфере трубы
+                    stderr_task = asyncio.create_task(proc.stderr.read())
+                    try:
+                        try:
+                            async for block in growing.follow():
+                                proc.stdin.write(block)
+                                await proc.stdin.drain()
+                            proc.stdin.close()
+                        except (BrokenPipeError, ConnectionResetError):
+                            pass # ffmpeg уже завершился с ошибкой, причина — в stderr
+                        stderr = await stderr_task
+                        await proc.wait()
+                    except asyncio.CancelledError:
+                        if proc.returncode is None:
+                            proc.kill()
+                            await proc.wait()
+                        stderr_task.cancel()
+                        raise
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        if proc.returncode != 0:
+            logger.warning(
+                f"Прокси из потока не получился, соберу из файла: {stderr.decode(errors='replace')[-500:]}"
+            )
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return False
+        os.replace(part_path, proxy_path)
+        logger.info(f"Прокси для Gemini собран во время скачивания: {proxy_path}")
+        return True
+
+    @metrics.timed("describe")
+    async def get_desc_video_async(self, videoPath: str, file_unique_id: str | None = None,
+                                   workdir: str | None = None, content_hash: str | None = None) -> dict:
+        """Асинхронный аналог get_desc_video."""
+        if file_unique_id and self.desc_cache:
+            # SQLite — в потоке, как и поиск по содержимому ниже: медленный диск не держит event loop
+            cached = await asyncio.to_thread(
+                self.desc_cache.get, file_unique_id=self._desc_unique_id(file_unique_id)
+            )
+            if cached is not None:
+                metrics.CACHE_LOOKUPS.inc(cache="description", result="hit")
+                logger.info(f"Описание видео взято из кэша: {videoPath}")
+                return cached
+        # Хэш большого файла считаем в потоке: это короткая локальная работа, а не ожидание сети
+        cached, cache_key = await asyncio.to_thread(self._desc_cache_lookup, videoPath, None, content_hash)
+        if cached is not None:
+            logger.info(f"Описание видео взято из кэша: {videoPath}")
+            return cached
+
+        # Тот же долгоживущий клиент, что и в VideoPipeline: client.aio держит пул соединений
+        client = self.gemini_client.aio
+
+        proxy_path = self._proxy_path(videoPath, workdir)
+        upload_path = videoPath
+        # Прокси уже есть, если видео принималось потоком (ingest_async)
+        if os.path.exists(proxy_path) or await self.make_upload_proxy_async(videoPath, proxy_path):
+            upload_path = proxy_path
+
+        logger.info(f"Uploading file: {upload_path}...")
+
+        videoFile = None
+        try:
+            upload_started = time.perf_counter()
+            with metrics.stage("gemini_upload"):
+                videoFile = await self.gemini_limiter.call_async(
+                    lambda: client.files.upload(file=upload_path), "upload"
+                )
+            self._log_upload_stats(videoPath, upload_path, time.perf_counter() - upload_started)
+
+            # Ждём активацию файла
+            with metrics.stage("gemini_active_wait"):
+                await self._wait_file_active_async(client, videoFile.name)
+
+            with metrics.stage("gemini_generate"):
+                response = await self.gemini_limiter.call_async(
+                    lambda: client.models.generate_content(model=GEMINI_MODEL, contents=[videoFile, DESC_PROMPT]),
+                    "generate"
+                )
+            # Разбор ответа пишет в кэш описаний (SQLite) — тоже в потоке
+            return await asyncio.to_thread(self._parse_desc_response, response.text, cache_key, file_unique_id)
+
+        except Exception as e:
+            logger.error(f"Ошибка в get_desc_video_async: {e}", exc_info=True)
+            return {"title": "", "content": f"Ошибка обработки: {e}"}
+
+        finally:
+            # Удаляем файл в Gemini и при успехе, и при ошибке/отмене
+            if videoFile:
+                try:
+                    await self.gemini_limiter.call_async(lambda: client.files.delete(name=videoFile.name), "delete")
+                    logger.info(f"File {videoFile.name} deleted.")
+                except Exception:
+                    pass # Игнорируем ошибку, если файл уже удален
+            if os.path.exists(proxy_path):
+                os.remove(proxy_path)
+
+    async def _wait_file_active_async(self, client, name: str) -> float:
+        """Асинхронный аналог _wait_file_active (client — это genai.Client.aio)."""
+        started = time.perf_counter()
+        for delay in self._poll_delays():
+            file_info = await self.gemini_limiter.call_async(lambda: client.files.get(name=name), "get")
+            activation_time = self._check_file_state(file_info, name, started)
+            if activation_time is not None:
+                return activation_time
+            await asyncio.sleep(delay)
+
+    # --- ШАГ 2: АУДИО И SRT ---
+
+    async def _get_audio_duration_async(self, file_path: str) -> float:
+        try:
+            return float((await run_process(self._ffprobe_duration_cmd(file_path))).strip())
+        except (ProcessError, ValueError) as e:
+            logger.error(f"Ошибка при получении длительности файла {file_path}: {e}")
+            return 0.0
+
+    async def _read_tts_stream(self, stream) -> bytes:
+        """Собирает байты из асинхронного стрима ElevenLabs (в разных версиях SDK — корутина или генератор)."""
+        if inspect.isawaitable(stream):
+            stream = await stream
+        parts = []
+        async for part in stream:
+            parts.append(part)
+        return b"".join(parts)
+
+    @metrics.timed("tts_chunk")
+    async def _synthesize_chunk_async(self, text_chunks: list[str], i: int, base_filename: str,
+                                      workdir: str) -> (str, float): # type: ignore
+        chunk_text = text_chunks[i]
+        previous_text = text_chunks[i - 1] if i > 0 else None
+        next_text = text_chunks[i + 1] if i < len(text_chunks) - 1 else None
+        chunk_path = os.path.join(workdir, f"{base_filename}_chunk_{i}.mp3")
+
+        # Кэш TTS — SQLite и запись фрагмента на диск: в потоке, не на event loop
+        cache_key, duration = await asyncio.to_thread(
+            self._tts_cache_lookup, chunk_text, previous_text, next_text, chunk_path
+        )
+        if duration is not None:
+            return chunk_path, duration
+
+        logger.info(f"Генерирую аудио для: {chunk_text}")
+        audio_bytes = await self.tts_limiter.call_async(
+            lambda: self._read_tts_stream(
+                self.async_elevenlabs_client.text_to_speech.convert(
+                    voice_id=self.VOICE_ID,
+                    output_format=self.TTS_OUTPUT_FORMAT,
+                    text=chunk_text,
+                    model_id=self.TTS_MODEL_ID,
+                    previous_text=previous_text,
+                    next_text=next_text
+                )
+            ),
+            "convert"
+        )
+        metrics.API_BYTES.inc(len(audio_bytes), api="elevenlabs", direction="received")
+
+        with open(chunk_path, "wb") as f:
+            f.write(audio_bytes)
+
+        duration = get_mp3_duration(audio_bytes)
+        if duration is None:
+            logger.warning(f"Не удалось разобрать MP3 в памяти, использую ffprobe: {chunk_path}")
+            duration = await self._get_audio_duration_async(chunk_path)
+
+        await asyncio.to_thread(self._tts_cache_store, cache_key, audio_bytes, duration)
+        return chunk_path, duration
+
+    @metrics.timed("tts_aligned")
+    async def _generate_aligned_async(self, text_chunks: list[str], base_filename: str,
+                                      workdir: str) -> (str, str): # type: ignore
+        full_text = " ".join(text_chunks)
+        logger.info(f"Генерирую аудио одним запросом ({len(full_text)} символов)")
+        response = await self.tts_limiter.call_async(
+            lambda: self.async_elevenlabs_client.text_to_speech.convert_with_timestamps(
+                voice_id=self.VOICE_ID,
+                output_format=self.TTS_OUTPUT_FORMAT,
+                text=full_text,
+                model_id=self.TTS_MODEL_ID
+            ),
+            "with_timestamps"
+        )
+        return self._write_aligned_outputs(response, text_chunks, base_filename, workdir)
+
+    @metrics.timed("tts")
+    async def generate_audio_and_srt_async(self, text: str, base_filename: str,
+                                           workdir: str = "tmp") -> (str | None, str | None): # type: ignore
+        """Асинхронный аналог generate_audio_and_srt (та же логика режимов и очистки)."""
+        if not self.async_elevenlabs_client:
+            logger.error("Клиент ElevenLabs не инициализирован.")
+            return None, None
+
+        text_chunks = self._smart_text_splitter(text)
+        logger.info(f"Текст разделен на {len(text_chunks)} коротких фраз.")
+        if not text_chunks:
+            logger.error("Не удалось разбить текст на фразы.")
+            return None, None
+
+        if self.tts_mode == "aligned":
+            try:
+                return await self._generate_aligned_async(text_chunks, base_filename, workdir)
+            except Exception as e:
+                logger.warning(f"Режим aligned не сработал, перехожу на пофразовую озвучку: {e}")
+
+        srt_path = os.path.join(workdir, f"{base_filename}.srt")
+        audio_chunks_paths = [
+            os.path.join(workdir, f"{base_filename}_chunk_{i}.mp3") for i in range(len(text_chunks))
+        ]
+        pause = self.PAUSE
+        keep_chunks = False
+        # Параллельность одной задачи — tts_workers, общий лимит — tts_limiter
+        job_slots = asyncio.Semaphore(self.tts_workers)
+
+        async def synthesize(i: int):
+            async with job_slots:
+                return await self._synthesize_chunk_async(text_chunks, i, base_filename, workdir)
+
+        try:
+            # TaskGroup отменяет остальные фразы, если одна упала (или задачу отменили)
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(synthesize(i)) for i in range(len(text_chunks))]
+            results = [task.result() for task in tasks]
+
+            self._write_srt(srt_path, text_chunks, results, pause)
+
+            if self.fused_render:
+                durations = [duration for _, duration in results]
+                list_path = self._write_audio_list(audio_chunks_paths, durations, base_filename, pause, workdir)
+                keep_chunks = True
+                return list_path, srt_path
+
+            final_audio_path = os.path.join(workdir, f"{base_filename}_final.mp3")
+            concat_list_path = os.path.join(workdir, f"{base_filename}_concat.txt")
+            try:
+                self._write_concat_list(audio_chunks_paths, concat_list_path, pause)
+                with metrics.stage("audio_concat"):
+                    await run_ffmpeg_async(self._concat_cmd(concat_list_path, final_audio_path))
+            finally:
+                if os.path.exists(concat_list_path):
+                    os.remove(concat_list_path)
+            logger.info(f"Финальное аудио собрано: {final_audio_path}")
+            return final_audio_path, srt_path
+
+        except Exception as e:
+            logger.error(f"Ошибка в generate_audio_and_srt_async: {e}", exc_info=True)
+            return None, None
+        finally:
+            if not keep_chunks:
+                for chunk_path in audio_chunks_paths:
+                    if os.path.exists(chunk_path): os.remove(chunk_path)
+
+    # --- ШАГ 0 и 3: ПОДГОТОВКА И СБОРКА ВИДЕО ---
+
+    @metrics.timed("prepare")
+    async def prepare_video_async(self, video_path: str, prepared_path: str) -> bool:
+        try:
+            logger.info(f"Подготавливаю видео: {video_path}")
+            await self._run_encode_async(self._prepare_cmd(video_path, prepared_path))
+            logger.info(f"Видео подготовлено: {prepared_path}")
+            return True
+        except ProcessError as e:
+            logger.error(f"Ошибка FFmpeg при подготовке видео: {e.stderr}")
+            if os.path.exists(prepared_path):
+                os.remove(prepared_path)
+            return False
+
+    def start_prepare(self, video_path: str, workdir: str | None = None,
+                      subtitle_mode: str | None = None) -> asyncio.Task | None:
+        """Как в VideoPipeline, но подготовка — отменяемая asyncio-задача, а не поток."""
+        if not self.staged or self._resolve_subtitle_mode(subtitle_mode) == "soft":
+            return None
+        if workdir:
+            prepared_path = os.path.join(workdir, "prepared.mp4")
+        else:
+            prepared_path = f"{os.path.splitext(video_path)[0]}_prepared.mp4"
+
+        async def _run():
+            ok = await self.prepare_video_async(video_path, prepared_path)
+            return prepared_path if ok else None
+
+        return asyncio.create_task(_run())
+
+    async def discard_prepare(self, prep_task: asyncio.Task | None):
+        """Отменяет незавершённую подготовку (ffmpeg будет убит) и удаляет результат."""
+        if prep_task is None:
+            return
+        if not prep_task.done():
+            prep_task.cancel()
+        await super().discard_prepare(prep_task)
+
+    @metrics.timed("render")
+    async def create_video_async(self, audio_path: str, video_path: str, final_path: str, srt_path: str,
+                                 subtitle_mode: str | None = None,
+                                 progress: Callable[[RenderProgress], None] | None = None) -> bool:
+        """Асинхронный аналог create_video; progress вызывается в event loop."""
+        if not self._check_render_inputs(audio_path, srt_path):
+            return False
+        tracker = ProgressTracker(self._audio_duration_hint(audio_path), progress)
+        try:
+            if self._resolve_subtitle_mode(subtitle_mode) == "soft":
+                codec = await self._probe_video_codec_async(video_path)
+                if self._soft_compatible(codec):
+                    try:
+                        await run_ffmpeg_async(
+                            self._soft_subtitles_cmd(audio_path, video_path, final_path, srt_path, codec),
+                            tracker.part("soft")
+                        )
+                        logger.info(f"Видео собрано с мягкими субтитрами: {final_path}")
+                        tracker.finish()
+                        return True
+                    except ProcessError as e:
+                        logger.warning(f"Мягкие субтитры не получились, вжигаю: {e.stderr}")
+                        tracker.reset()
+
+            images = await self._render_subtitle_images_async(video_path, srt_path)
+            segments = await self._plan_render_segments_async(video_path, audio_path)
+            if segments:
+                try:
+                    await self._render_segmented_async(
+                        audio_path, video_path, final_path, srt_path, segments, tracker, images
+                    )
+                    logger.info(f"Видео успешно собрано: {final_path}")
+                    tracker.finish()
+                    return True
+                except* ProcessError as group:
+                    logger.warning(
+                        f"Сегментная сборка не удалась, собираю одним проходом: {group.exceptions[0].stderr}"
+                    )
+                    tracker.reset()
+
+            logger.info("Начинаю сборку видео с субтитрами...")
+            await self._run_encode_async(
+                self._create_video_cmd(audio_path, video_path, final_path, srt_path, images),
+                tracker.part("render")
+            )
+            logger.info(f"Видео успешно собрано: {final_path}")
+            tracker.finish()
+            return True
+        except ProcessError as e:
+            logger.error(f"Ошибка FFmpeg при сборке видео: {e.stderr}")
+            return False
+        finally:
+            self._cleanup_render_inputs(audio_path, srt_path)
+
+    async def _render_subtitle_images_async(self, video_path: str, srt_path: str) -> list[CueImage] | None:
+        """Асинхронный аналог _render_subtitle_images: отмена задачи убивает ffmpeg отрисовки."""
+        if self.subtitle_renderer != "overlay":
+            return None
+        workdir = self._subtitle_images_dir(srt_path)
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            return await render_cue_images_async(video_path, self._read_srt(srt_path), workdir)
+        except (ProcessError, ValueError, OSError) as e:
+            logger.warning(f"Не удалось отрисовать субтитры картинками, вжигаю через libass: {getattr(e, 'stderr', None) or e}")
+            return None
+
+    async def _probe_video_codec_async(self, video_path: str) -> str | None:
+        try:
+            return (await run_process(self._video_codec_cmd(video_path))).strip() or None
+        except ProcessError as e:
+            logger.warning(f"Не удалось определить кодек видео {video_path}: {e.stderr}")
+            return None
+
+    async def _plan_render_segments_async(self, video_path: str,
+                                          audio_path: str) -> list[tuple[float, float]] | None:
+        """Асинхронный аналог _plan_render_segments."""
+        if self.segment_render_min_seconds <= 0:
+            return None
+        video_duration = await self._get_audio_duration_async(video_path) # ffprobe format=duration
+        if not self._wants_segments(video_duration):
+            return None
+        try:
+            output = await run_process(self._keyframes_cmd(video_path))
+        except ProcessError as e:
+            logger.warning(f"Не удалось найти ключевые кадры, собираю одним проходом: {e.stderr}")
+            return None
+        return self._segments_for(video_duration, output, audio_path)
+
+    @metrics.timed("render_segmented")
+    async def _render_segmented_async(self, audio_path: str, video_path: str, final_path: str,
+                                      srt_path: str, segments: list[tuple[float, float]],
+                                      tracker: ProgressTracker | None = None,
+                                      images: list[CueImage] | None = None):
+        """
+        Асинхронный аналог _render_segmented. Куски — задачи TaskGroup:
+        ошибка одного куска (или отмена задачи) убивает ffmpeg остальных.
+        """
+        workdir = self._segments_workdir(srt_path)
+        try:
+            jobs = self._segment_jobs(video_path, srt_path, segments, workdir, images)
+            async with asyncio.TaskGroup() as group:
+                for i, (cmd, _) in enumerate(jobs):
+                    group.create_task(
+                        self._run_encode_async(cmd, tracker.part(f"segment_{i}") if tracker else None)
+                    )
+            list_path = self._write_segments_list([output for _, output in jobs], workdir)
+            await run_process(self._segments_mux_cmd(list_path, audio_path, final_path))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # --- ПУБЛИЧНЫЙ МЕТОД-ПАЙПЛАЙН ---
+
+    async def run_async(self, input_video_path: str) -> (str | None, dict | None): #type: ignore
+        """
+        Выполняет весь пайплайн нативно на asyncio.
+        Отмена корутины останавливает все этапы и убивает запущенные ffmpeg.
+        """
+        logger.info(f"[ASYNC] Начинаю обработку видео: {input_video_path}")
+        workspace = None
+        prep_task = None
+        try:
+            job_id = self.new_job_id()
+            workspace = self.workspaces.acquire(
+                self.estimate_job_bytes(os.path.getsize(input_video_path)), job_id
+            )
+            prep_task = self.start_prepare(input_video_path, workspace.path)
+
+            text_data = await self.get_desc_video_async(input_video_path, workdir=workspace.path)
+            if not text_data or not text_data.get("content"):
+                logger.error(f"[ASYNC] Не удалось получить текст.")
+                return None, text_data
+            # Ответ с ошибкой Gemini (пустой title, текст ошибки в content) не озвучиваем
+            if not text_data.get("title"):
+                logger.error(f"[ASYNC] Gemini не дал описание: {text_data['content']}")
+                return None, None
+
+            audio_path, srt_path = await self.generate_audio_and_srt_async(
+                text_data["content"], "voice", workspace.path
+            )
+            if not audio_path or not srt_path:
+                logger.error("[ASYNC] Не удалось сгенерировать аудио и SRT.")
+                return None, text_data
+
+            render_input = await self.finish_prepare(prep_task, input_video_path)
+            final_path = f"results/video_{job_id}.mp4"
+            created = await self.create_video_async(audio_path, render_input, final_path, srt_path)
+
+            return (final_path, text_data) if created else (None, text_data)
+
+        except Exception as e:
+            logger.error(f"[ASYNC] Критическая ошибка в пайплайне: {e}", exc_info=True)
+            return None, None
+        finally:
+            await self.discard_prepare(prep_task)
+            if workspace:
+                workspace.cleanup()
@@ -0,0 +1,433 @@
+# src/cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Дисковый кэш озвученных фраз (SQLite).
+    Ключ — хэш параметров запроса к ElevenLabs, значение — mp3-байты и их длительность.
+    Размер ограничен бюджетом в байтах, вытесняются давно не использованные записи (LRU).
+    Безопасен для одновременного доступа из потоков и процессов.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # Одно соединение на процесс, доступ сериализуем через _lock;
+        # timeout — ожидание блокировки, если в базу пишет другой процесс
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tts_chunks (
+                key TEXT PRIMARY KEY,
+                audio BLOB NOT NULL,
+                duration REAL NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tts_chunks_lru ON tts_chunks(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text: str, previous_text: str | None, next_text: str | None,
+                 voice_id: str, model_id: str, output_format: str) -> str:
+        """Content-addressed ключ: sha256 от всех параметров, влияющих на звук."""
+        payload = json.dumps(
+            [text, previous_text, next_text, voice_id, model_id, output_format],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        """Возвращает (audio, duration) или None, если записи нет."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT audio, duration FROM tts_chunks WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE tts_chunks SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return bytes(row[0]), row[1]
+
+    def put(self, key: str, audio: bytes, duration: float):
+        """Сохраняет фразу и вытесняет старые записи, если превышен бюджет."""
+        if len(audio) > self.max_bytes:
+            return # Запись больше всего кэша — не храним
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tts_chunks (key, audio, duration, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, audio, duration, len(audio), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаляет самые старые по last_access записи, пока не уложимся в max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_chunks").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM tts_chunks ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM tts_chunks WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        logger.info(f"TTS-кэш: вытеснение до {total} байт (всего вытеснено: {self.evictions})")
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов/вытеснений и текущий размер кэша."""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tts_chunks"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """Потоковый sha256 файла (не читает файл в память целиком)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DescriptionCache:
+    """
+    Кэш ответов Gemini ({title, content}) по хэшу содержимого видео (SQLite).
+    Дополнительно можно искать по Telegram file_unique_id — без хэширования файла.
+    Записи живут ttl секунд, общее число записей ограничено max_entries (LRU).
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                key TEXT PRIMARY KEY,
+                file_unique_id TEXT,
+                data TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS descriptions_unique_id ON descriptions(file_unique_id)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS descriptions_lru ON descriptions(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str | None = None, file_unique_id: str | None = None) -> dict | None:
+        """
+        Ищет запись по хэшу содержимого или по file_unique_id. Просроченные удаляет.
+        Поиск только по file_unique_id промахом не считается — дальше обычно идёт поиск по хэшу.
+        """
+        with self._lock:
+            row = None
+            if file_unique_id:
+                row = self._conn.execute(
+                    "SELECT key, data, created FROM descriptions WHERE file_unique_id = ?",
+                    (file_unique_id,)
+                ).fetchone()
+            if row is None and key:
+                row = self._conn.execute(
+                    "SELECT key, data, created FROM descriptions WHERE key = ?", (key,)
+                ).fetchone()
+
+            if row is None:
+                if key:
+                    self.misses += 1
+                return None
+
+            now = time.time()
+            if now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM descriptions WHERE key = ?", (row[0],))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE descriptions SET last_access = ? WHERE key = ?", (now, row[0])
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def put(self, key: str, data: dict, file_unique_id: str | None = None):
+        """Сохраняет ответ и вытесняет лишние записи (сначала просроченные, затем LRU)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, file_unique_id, data, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, file_unique_id, json.dumps(data, ensure_ascii=False), now, now)
+            )
+            self._conn.execute("DELETE FROM descriptions WHERE created < ?", (now - self.ttl,))
+            count = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+            if count > self.max_entries:
+                cur = self._conn.execute(
+                    "DELETE FROM descriptions WHERE key IN "
+                    "(SELECT key FROM descriptions ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += cur.rowcount
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов/вытеснений и текущее число записей."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": count,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """
+    Готовые ролики (SQLite): Telegram file_id и подпись по ключу входного видео.
+    Повторное видео отправляется по file_id — без обработки и повторной загрузки в Telegram.
+    Ключ — хэш содержимого + настройки сборки; дополнительно ищем по file_unique_id.
+    Опционально хранит сами mp4 (на случай, если file_id перестал работать):
+    файлы живут не дольше ttl, их общий размер ограничен max_artifact_bytes (LRU).
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int,
+                 artifacts_dir: str | None = None, max_artifact_bytes: int = 0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.artifacts_dir = artifacts_dir if max_artifact_bytes > 0 else None
+        self.max_artifact_bytes = max_artifact_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.artifacts_dir:
+            os.makedirs(self.artifacts_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                file_unique_id TEXT,
+                file_id TEXT NOT NULL,
+                caption TEXT,
+                artifact_path TEXT,
+                artifact_size INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_unique_id ON results(file_unique_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_lru ON results(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content_hash: str, variant: str) -> str:
+        """Ключ результата: содержимое входа + всё, что влияет на готовый ролик."""
+        return hashlib.sha256(f"{content_hash}:{variant}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str | None = None, file_unique_id: str | None = None) -> dict | None:
+        """
+        {"key", "file_id", "caption", "artifact_path"} или None. Просроченные записи удаляет.
+        Как и в DescriptionCache, поиск только по file_unique_id промахом не считается.
+        """
+        with self._lock:
+            row = None
+            columns = "key, file_id, caption, artifact_path, created"
+            if file_unique_id:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM results WHERE file_unique_id = ?", (file_unique_id,)
+                ).fetchone()
+            if row is None and key:
+                row = self._conn.execute(f"SELECT {columns} FROM results WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                if key:
+                    self.misses += 1
+                return None
+
+            now = time.time()
+            if now - row[4] > self.ttl:
+                self._delete(row[0])
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            self.hits += 1
+            artifact_path = row[3] if row[3] and os.path.exists(row[3]) else None
+            return {"key": row[0], "file_id": row[1], "caption": row[2], "artifact_path": artifact_path}
+
+    def put(self, key: str, file_id: str, caption: str | None, file_unique_id: str | None = None,
+            artifact_src: str | None = None):
+        """
+        Сохраняет file_id отправленного ролика. Если хранение файлов включено,
+        artifact_src переносится в artifacts_dir (исходный файл после этого не существует).
+        """
+        artifact_path, artifact_size = None, 0
+        if self.artifacts_dir and artifact_src and os.path.exists(artifact_src):
+            artifact_size = os.path.getsize(artifact_src)
+            if artifact_size <= self.max_artifact_bytes:
+                artifact_path = os.path.join(self.artifacts_dir, f"{key}.mp4")
+                # move, а не rename: рабочая папка может быть в tmpfs, а кэш — на диске
+                shutil.move(artifact_src, artifact_path)
+            else:
+                artifact_size = 0
+
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT artifact_path FROM results WHERE key = ?", (key,)).fetchone()
+            if old and old[0] and old[0] != artifact_path:
+                self._remove_file(old[0])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, file_unique_id, file_id, caption, artifact_path, artifact_size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, file_unique_id, file_id, caption, artifact_path, artifact_size, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def update_file_id(self, key: str, file_id: str):
+        """Новый file_id после повторной отправки сохранённого файла."""
+        with self._lock:
+            self._conn.execute("UPDATE results SET file_id = ? WHERE key = ?", (file_id, key))
+            self._conn.commit()
+
+    def invalidate(self, key: str):
+        """Удаляет запись (например, Telegram больше не принимает её file_id)."""
+        with self._lock:
+            self._delete(key)
+            self._conn.commit()
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _delete(self, key: str):
+        """Удаляет запись и её файл. Вызывать под _lock."""
+        row = self._conn.execute("SELECT artifact_path FROM results WHERE key = ?", (key,)).fetchone()
+        if row and row[0]:
+            self._remove_file(row[0])
+        self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def _evict(self, now: float):
+        """
+        Просроченные записи — целиком; лишние по max_entries — целиком (LRU);
+        файлы сверх max_artifact_bytes — только файлы (file_id ещё пригодится).
+        """
+        expired = self._conn.execute(
+            "SELECT key FROM results WHERE created < ?", (now - self.ttl,)
+        ).fetchall()
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - len(expired)
+        extra = self._conn.execute(
+            "SELECT key FROM results WHERE created >= ? ORDER BY last_access ASC LIMIT ?",
+            (now - self.ttl, max(count - self.max_entries, 0))
+        ).fetchall()
+        for (key,) in expired + extra:
+            self._delete(key)
+            self.evictions += 1
+
+        total = self._conn.execute("SELECT COALESCE(SUM(artifact_size), 0) FROM results").fetchone()[0]
+        if total <= self.max_artifact_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, artifact_path, artifact_size FROM results "
+            "WHERE artifact_path IS NOT NULL ORDER BY last_access ASC"
+        ).fetchall()
+        for key, artifact_path, artifact_size in rows:
+            if total <= self.max_artifact_bytes:
+                break
+            self._remove_file(artifact_path)
+            self._conn.execute(
+                "UPDATE results SET artifact_path = NULL, artifact_size = 0 WHERE key = ?", (key,)
+            )
+            total -= artifact_size
+        logger.info(f"Кэш результатов: файлы ужаты до {total} байт")
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов/вытеснений, число записей и размер файлов."""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(artifact_size), 0) FROM results"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": count,
+            "artifact_bytes": size,
+            "max_entries": self.max_entries,
+            "max_artifact_bytes": self.max_artifact_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
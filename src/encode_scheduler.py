@@ -0,0 +1,181 @@
+# src/encode_scheduler.py
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Callable
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EncodeSlot:
+    """Выданный кодированию бюджет: число потоков и (опционально) закреплённые ядра."""
+    threads: int
+    cpus: list[int] | None = None
+
+    @property
+    def preexec_fn(self) -> Callable[[], None] | None:
+        """Функция для subprocess: закрепляет дочерний ffmpeg за ядрами слота."""
+        if not self.cpus:
+            return None
+        cpus = set(self.cpus)
+        return lambda: os.sched_setaffinity(0, cpus)
+
+
+@dataclass
+class _Waiter:
+    # Синхронный ожидающий ждёт event, асинхронный — future в своём event loop
+    event: threading.Event | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+    future: asyncio.Future | None = None
+    slot: EncodeSlot | None = None
+
+
+class EncodeScheduler:
+    """
+    Общий бюджет ядер для кодирований ffmpeg (libx264) всех задач:
+    - каждому кодированию выдаётся threads потоков (-threads/-filter_threads);
+    - одновременно работает не больше cores // threads кодирований, остальные ждут в FIFO;
+    - при pin_cpus каждое кодирование закрепляется за своими ядрами (sched_setaffinity).
+    Работает и из потоков (slot), и из asyncio (slot_async).
+    """
+
+    def __init__(self, cores: int | None = None, threads: int | None = None, pin_cpus: bool = False):
+        available = self._available_cpus()
+        self.cores = max(1, min(cores or len(available), len(available)))
+        self.threads = max(1, min(threads or 4, self.cores))
+        self.capacity = max(1, self.cores // self.threads)
+        # Закрепление имеет смысл, только если ОС его поддерживает
+        self.pin_cpus = pin_cpus and hasattr(os, "sched_setaffinity")
+
+        self._free_cpus = available[:self.cores]
+        self._active = 0
+        self._waiters: deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+        logger.info(
+            f"Планировщик кодирования: ядер={self.cores}, потоков на ffmpeg={self.threads}, "
+            f"одновременно={self.capacity}, закрепление={'да' if self.pin_cpus else 'нет'}"
+        )
+
+    @staticmethod
+    def _available_cpus() -> list[int]:
+        """Ядра, доступные процессу (учитывает ограничения контейнера/taskset)."""
+        if hasattr(os, "sched_getaffinity"):
+            return sorted(os.sched_getaffinity(0))
+        return list(range(os.cpu_count() or 1))
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _grant(self) -> EncodeSlot:
+        """Выдаёт слот. Вызывать под _lock, когда _active < capacity."""
+        self._active += 1
+        cpus = None
+        if self.pin_cpus:
+            cpus, self._free_cpus = self._free_cpus[:self.threads], self._free_cpus[self.threads:]
+        self._update_metrics()
+        return EncodeSlot(threads=self.threads, cpus=cpus)
+
+    def _update_metrics(self):
+        metrics.ENCODES_ACTIVE.set(self._active)
+        metrics.ENCODES_WAITING.set(len(self._waiters))
+
+    def _try_acquire(self, waiter: _Waiter) -> EncodeSlot | None:
+        """Слот сразу, если есть место и никто не ждёт раньше; иначе ставит waiter в очередь."""
+        with self._lock:
+            if self._active < self.capacity and not self._waiters:
+                return self._grant()
+            self._waiters.append(waiter)
+            self._update_metrics()
+            return None
+
+    def release(self, slot: EncodeSlot):
+        """Возвращает слот; следующий ожидающий получает его сразу (передача из рук в руки)."""
+        with self._lock:
+            self._active -= 1
+            if slot.cpus:
+                self._free_cpus = sorted(self._free_cpus + slot.cpus)
+            while self._waiters and self._active < self.capacity:
+                waiter = self._waiters.popleft()
+                if waiter.future is not None and waiter.future.cancelled():
+                    continue # Асинхронный ожидающий ушёл (задачу отменили)
+                waiter.slot = self._grant()
+                if waiter.event is not None:
+                    waiter.event.set()
+                else:
+                    waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+            self._update_metrics()
+
+    def _resolve(self, waiter: _Waiter):
+        """В потоке event loop: отдаёт слот future или сразу возвращает, если ждать уже некому."""
+        if waiter.future.cancelled():
+            self.release(waiter.slot)
+        else:
+            waiter.future.set_result(waiter.slot)
+
+    def _cancel_waiter(self, waiter: _Waiter):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._update_metrics()
+
+    @contextmanager
+    def slot(self):
+        """Синхронно ждёт слот (для потоков VideoPipeline)."""
+        waiter = _Waiter(event=threading.Event())
+        slot = self._try_acquire(waiter)
+        if slot is None:
+            logger.info(f"Кодирование ждёт свободные ядра (в очереди: {self.waiting})")
+            with metrics.stage("encode_wait"):
+                waiter.event.wait()
+            slot = waiter.slot
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Асинхронно ждёт слот; отмена задачи во время ожидания снимает её с очереди."""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop=loop, future=loop.create_future())
+        slot = self._try_acquire(waiter)
+        if slot is None:
+            logger.info(f"Кодирование ждёт свободные ядра (в очереди: {self.waiting})")
+            try:
+                with metrics.stage("encode_wait"):
+                    slot = await waiter.future
+            except asyncio.CancelledError:
+                self._cancel_waiter(waiter)
+                # Слот мог быть выдан в тот же момент, когда задачу отменили
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self.release(waiter.future.result())
+                raise
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cores": self.cores,
+                "threads": self.threads,
+                "capacity": self.capacity,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "pin_cpus": self.pin_cpus,
+            }
@@ -0,0 +1,163 @@
+# src/ffmpeg_progress.py
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# Машиночитаемый прогресс в stdout (блоки key=value) вместо строки статистики в stderr
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+# Сколько последних строк stderr ffmpeg хранить для сообщения об ошибке
+STDERR_TAIL_LINES = 50
+
+
+def with_progress(cmd: list[str]) -> list[str]:
+    """Добавляет -progress сразу после имени программы (это глобальная опция ffmpeg)."""
+    return [cmd[0], *PROGRESS_ARGS, *cmd[1:]]
+
+
+def _float(value: str | None) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0 # "N/A" в начале кодирования
+
+
+def _out_time(fields: dict) -> float:
+    """Позиция результата в секундах: out_time_us (микросекунды) или out_time (ЧЧ:ММ:СС.мкс)."""
+    if fields.get("out_time_us", "N/A") != "N/A":
+        return max(_float(fields["out_time_us"]) / 1_000_000, 0.0)
+    hours, _, rest = fields.get("out_time", "").partition(":")
+    minutes, _, seconds = rest.partition(":")
+    try:
+        return max(int(hours) * 3600 + int(minutes) * 60 + float(seconds), 0.0)
+    except ValueError:
+        return 0.0
+
+
+@dataclass
+class FFmpegProgress:
+    """Один блок -progress одного процесса ffmpeg."""
+    out_time: float = 0.0 # Секунд результата уже записано
+    fps: float = 0.0
+    speed: float = 0.0    # Во сколько раз быстрее реального времени
+    done: bool = False
+
+
+class ProgressParser:
+    """Разбирает поток -progress построчно; feed возвращает снимок в конце каждого блока."""
+
+    def __init__(self):
+        self._fields = {}
+
+    def feed(self, line: str) -> FFmpegProgress | None:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._fields[key] = value.strip()
+            return None
+        fields, self._fields = self._fields, {}
+        return FFmpegProgress(
+            out_time=_out_time(fields),
+            fps=_float(fields.get("fps")),
+            speed=_float(fields.get("speed", "").rstrip("x")),
+            done=value.strip() == "end",
+        )
+
+
+@dataclass
+class RenderProgress:
+    """Прогресс сборки целиком (по всем её процессам ffmpeg)."""
+    out_time: float
+    total: float | None
+    elapsed: float
+    fps: float
+    done: bool = False
+
+    @property
+    def speed(self) -> float:
+        """Секунд видео за секунду работы (для нескольких кусков параллельно — суммарно)."""
+        return self.out_time / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def percent(self) -> float | None:
+        if self.done:
+            return 100.0
+        if not self.total:
+            return None
+        return min(self.out_time / self.total * 100, 99.9)
+
+    @property
+    def eta(self) -> float | None:
+        """Оставшиеся секунды при текущей скорости."""
+        if self.done:
+            return 0.0
+        if not self.total or self.speed <= 0:
+            return None
+        return max(self.total - self.out_time, 0.0) / self.speed
+
+
+class ProgressTracker:
+    """
+    Прогресс одной сборки, которая может состоять из нескольких ffmpeg
+    (сегменты параллельно): складывает out_time частей и отдаёт RenderProgress в callback.
+    Части обновляются из потоков или event loop — под блокировкой.
+    """
+
+    def __init__(self, total: float | None, callback: Callable[[RenderProgress], None] | None = None):
+        self.total = total
+        self.callback = callback
+        self._parts: dict[str, FFmpegProgress] = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def part(self, name: str) -> Callable[[FFmpegProgress], None]:
+        """Функция on_progress для одного процесса ffmpeg."""
+        def update(progress: FFmpegProgress):
+            with self._lock:
+                self._parts[name] = progress
+            self._emit(self.snapshot())
+        return update
+
+    def reset(self):
+        """Начать заново (сборка перешла на запасной способ)."""
+        with self._lock:
+            self._parts = {}
+            self._started = time.perf_counter()
+
+    def snapshot(self, done: bool = False) -> RenderProgress:
+        with self._lock:
+            parts = list(self._parts.values())
+            elapsed = time.perf_counter() - self._started
+        return RenderProgress(
+            out_time=sum(part.out_time for part in parts),
+            total=self.total,
+            elapsed=elapsed,
+            fps=sum(part.fps for part in parts if not part.done),
+            done=done,
+        )
+
+    def finish(self) -> RenderProgress:
+        """Сборка завершена: последний снимок (100%) и скорость в метрику."""
+        progress = self.snapshot(done=True)
+        if progress.out_time > 0:
+            metrics.RENDER_SPEED.observe(progress.speed)
+            logger.info(f"Скорость сборки: {progress.speed:.2f}x ({progress.out_time:.1f} с за {progress.elapsed:.1f} с)")
+        self._emit(progress)
+        return progress
+
+    def _emit(self, progress: RenderProgress):
+        if not self.callback:
+            return
+        try:
+            self.callback(progress)
+        except Exception as e:
+            # Ошибка показа прогресса не должна ронять сборку
+            logger.warning(f"Ошибка в обработчике прогресса: {e}")
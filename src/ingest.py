@@ -0,0 +1,59 @@
+# src/ingest.py
+
+import asyncio
+import hashlib
+from typing import AsyncIterator
+
+
+class GrowingFile:
+    """
+    Файл, который ещё скачивается. Писатель добавляет блоки (сразу на диск и в sha256),
+    читатели идут следом по файлу и ждут новых данных, пока он не закрыт.
+    Читатели берут данные с диска (из page cache), поэтому медленный читатель
+    (ffmpeg) не тормозит скачивание и не копит блоки в памяти.
+    Все методы вызываются из одного event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.closed = False
+        self.digest = hashlib.sha256()
+        self._file = open(path, "wb")
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        # Будим всех ждущих читателей, следующие будут ждать новый event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def write(self, block: bytes):
+        self._file.write(block)
+        self._file.flush()
+        self.digest.update(block)
+        self.size += len(block)
+        self._wake()
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        self.closed = True
+        self._wake()
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+    async def follow(self, block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """Отдаёт содержимое файла с начала, дожидаясь новых блоков, пока файл не закрыт."""
+        with open(self.path, "rb") as f:
+            offset = 0
+            while True:
+                if offset < self.size:
+                    block = f.read(min(block_size, self.size - offset))
+                    offset += len(block)
+                    yield block
+                    continue
+                if self.closed:
+                    return
+                await self._changed.wait()
@@ -0,0 +1,217 @@
+# src/job_queue.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedJob:
+    """Задача из очереди рендеринга."""
+    job_id: str
+    user_id: int
+    payload: dict
+    status: str = "queued"
+    stage: str | None = None
+    attempts: int = 0
+    result: dict | None = None
+
+
+class JobQueue:
+    """
+    Надёжная очередь задач рендеринга между ботом и воркерами (SQLite, WAL).
+    Бот кладёт задачи (put) и забирает результаты (finished), воркеры
+    берут задачи в аренду (lease) и продлевают её (heartbeat) пока работают.
+    Если воркер умер и аренда истекла, задачу получит другой воркер;
+    после max_attempts попыток задача считается проваленной.
+    База должна лежать там, где её видят и бот, и все воркеры (локальный диск
+    хоста или общий том; SQLite по NFS ненадёжен — для нескольких хостов нужен общий блочный том).
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None — транзакции открываем сами (BEGIN IMMEDIATE в lease)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS render_jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL,
+                stage TEXT,
+                result TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS render_jobs_status ON render_jobs(status, created)")
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция с блокировкой записи сразу: два воркера не возьмут одну задачу."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _job(row) -> QueuedJob:
+        return QueuedJob(
+            job_id=row[0], user_id=row[1], payload=json.loads(row[2]), status=row[3],
+            stage=row[4], attempts=row[5], result=json.loads(row[6]) if row[6] else None,
+        )
+
+    def put(self, job_id: str, user_id: int, payload: dict):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO render_jobs VALUES (?, ?, ?, 'queued', NULL, NULL, 0, NULL, NULL, ?, ?)",
+                (job_id, user_id, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+
+    def lease(self, worker: str) -> QueuedJob | None:
+        """
+        Берёт самую старую задачу: ожидающую или с истёкшей арендой (воркер умер).
+        Задачи, исчерпавшие попытки, по пути помечаются проваленными.
+        """
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT job_id, user_id, payload, status, stage, attempts, result FROM render_jobs "
+                    "WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY created LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                job = self._job(row)
+                if job.attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE render_jobs SET status = 'failed', worker = NULL, result = ?, updated = ? "
+                        "WHERE job_id = ?",
+                        (json.dumps({"error": "попытки исчерпаны"}, ensure_ascii=False), now, job.job_id)
+                    )
+                    logger.warning(f"Задача {job.job_id}: попытки исчерпаны ({job.attempts})")
+                    continue
+                if job.status == "leased":
+                    logger.warning(f"Задача {job.job_id}: аренда истекла, выдаю повторно")
+                conn.execute(
+                    "UPDATE render_jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE job_id = ?",
+                    (worker, now + self.lease_seconds, now, job.job_id)
+                )
+            job.status = "leased"
+            job.attempts += 1
+            return job
+
+    def heartbeat(self, job_id: str, worker: str, stage: str | None = None) -> bool:
+        """
+        Продлевает аренду (и при желании отмечает этап). False — аренда потеряна
+        (истекла и задача ушла другому воркеру или задачу отменили): работу надо прекратить.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE render_jobs SET lease_expires = ?, stage = COALESCE(?, stage), updated = ? "
+                "WHERE job_id = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_seconds, stage, now, job_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: dict) -> bool:
+        """Отмечает задачу выполненной (если воркер всё ещё её владелец)."""
+        return self._finish(job_id, worker, "done", result)
+
+    def fail(self, job_id: str, worker: str, error: str, retry: bool = True) -> bool:
+        """Ошибка попытки: при retry задача возвращается в очередь, пока есть попытки."""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM render_jobs WHERE job_id = ? AND worker = ? AND status = 'leased'",
+                (job_id, worker)
+            ).fetchone()
+            if row is None:
+                return False
+            if retry and row[0] < self.max_attempts:
+                conn.execute(
+                    "UPDATE render_jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                    "updated = ? WHERE job_id = ?", (time.time(), job_id)
+                )
+                return True
+        return self._finish(job_id, worker, "failed", {"error": error})
+
+    def release(self, job_id: str, worker: str):
+        """Возвращает задачу в очередь без траты попытки (воркер останавливается)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE render_jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                "attempts = attempts - 1, updated = ? WHERE job_id = ? AND worker = ? AND status = 'leased'",
+                (time.time(), job_id, worker)
+            )
+
+    def _finish(self, job_id: str, worker: str, status: str, result: dict) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE render_jobs SET status = ?, worker = NULL, result = ?, updated = ? "
+                "WHERE job_id = ? AND worker = ? AND status = 'leased'",
+                (status, json.dumps(result, ensure_ascii=False), time.time(), job_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def cancel_user(self, user_id: int) -> list[str]:
+        """Отменяет ожидающие и выполняемые задачи пользователя; воркер узнает об этом на heartbeat."""
+        with self._transaction() as conn:
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT job_id FROM render_jobs WHERE user_id = ? AND status IN ('queued', 'leased')",
+                (user_id,)
+            )]
+            conn.executemany(
+                "UPDATE render_jobs SET status = 'cancelled', worker = NULL, updated = ? WHERE job_id = ?",
+                [(time.time(), job_id) for job_id in job_ids]
+            )
+        return job_ids
+
+    def jobs(self) -> list[QueuedJob]:
+        """Все задачи в очереди (для бота: этапы для статуса и готовые результаты)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, user_id, payload, status, stage, attempts, result FROM render_jobs "
+                "ORDER BY created"
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def remove(self, job_id: str):
+        """Удаляет задачу, результат которой бот уже отправил пользователю."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM render_jobs WHERE job_id = ?", (job_id,))
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM render_jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
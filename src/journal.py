@@ -0,0 +1,198 @@
+# src/journal.py
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Этапы задачи по порядку: этап означает, что его результат уже сохранён в журнале
+STAGES = ("queued", "text", "audio")
+
+
+@dataclass
+class JobRecord:
+    """Задача бота: всё, что нужно, чтобы выполнить её заново после перезапуска."""
+    job_id: str
+    user_id: int
+    chat_id: int
+    file_id: str
+    file_unique_id: str
+    file_size: int = 0
+    subtitle_mode: str | None = None
+    stage: str = "queued"
+    text_data: dict | None = None
+    attempts: int = 0
+
+
+class JobJournal:
+    """
+    Журнал задач на диске (SQLite + папка с файлами этапов).
+    После каждого оплачиваемого этапа сохраняет его результат: текст от Gemini,
+    озвучку (фрагменты с длительностями) и SRT. Задача, упавшая в ffmpeg или
+    прерванная перезапуском бота, продолжает с последнего сохранённого этапа —
+    без повторных запросов к Gemini и ElevenLabs.
+    Завершённые задачи удаляются из журнала вместе с файлами.
+    """
+
+    def __init__(self, path: str, files_dir: str, max_attempts: int = 3):
+        self.path = path
+        self.files_dir = files_dir
+        self.max_attempts = max(1, max_attempts)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.makedirs(files_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                subtitle_mode TEXT,
+                stage TEXT NOT NULL,
+                text_data TEXT,
+                audio TEXT,
+                attempts INTEGER NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.files_dir, job_id)
+
+    @staticmethod
+    def _record(row) -> JobRecord:
+        return JobRecord(
+            job_id=row[0], user_id=row[1], chat_id=row[2], file_id=row[3], file_unique_id=row[4],
+            file_size=row[5], subtitle_mode=row[6], stage=row[7],
+            text_data=json.loads(row[8]) if row[8] else None, attempts=row[9],
+        )
+
+    def add(self, record: JobRecord):
+        """Записывает новую задачу (этап queued)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL, 0, ?, ?)",
+                (record.job_id, record.user_id, record.chat_id, record.file_id, record.file_unique_id,
+                 record.file_size, record.subtitle_mode, "queued", now, now)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> JobRecord | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, user_id, chat_id, file_id, file_unique_id, file_size, subtitle_mode, "
+                "stage, text_data, attempts FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def pending(self) -> list[JobRecord]:
+        """Незавершённые задачи в порядке поступления (для продолжения после перезапуска)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, user_id, chat_id, file_id, file_unique_id, file_size, subtitle_mode, "
+                "stage, text_data, attempts FROM jobs ORDER BY created"
+            ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def begin_attempt(self, job_id: str) -> int:
+        """
+        Отмечает начало попытки и возвращает её номер. Считается до работы,
+        чтобы задача, которая роняет весь бот, не запускалась бесконечно.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET attempts = attempts + 1, updated = ? WHERE job_id = ?",
+                (time.time(), job_id)
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def can_retry(self, job_id: str) -> bool:
+        record = self.get(job_id)
+        return record is not None and record.attempts < self.max_attempts
+
+    def save_text(self, job_id: str, text_data: dict):
+        """Сохраняет ответ Gemini ({title, content})."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, text_data = ?, updated = ? WHERE job_id = ?",
+                ("text", json.dumps(text_data, ensure_ascii=False), time.time(), job_id)
+            )
+            self._conn.commit()
+        logger.info(f"Задача {job_id}: текст сохранён в журнале")
+
+    def save_audio(self, job_id: str, audio_path: str, srt_path: str, chunks: list[tuple[str, float]]):
+        """
+        Копирует озвучку и SRT в папку журнала и записывает их описание.
+        chunks — фрагменты озвучки с длительностями; для ffconcat-списка это его файлы,
+        для склеенного mp3 — он сам. Файлы копируются (а не переносятся):
+        create_video удаляет свои входы после сборки.
+        """
+        job_dir = self._job_dir(job_id)
+        partial_dir = job_dir + ".partial"
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        os.makedirs(partial_dir)
+        for path in {audio_path, srt_path, *(chunk_path for chunk_path, _ in chunks)}:
+            shutil.copyfile(path, os.path.join(partial_dir, os.path.basename(path)))
+        # Папка появляется целиком: после сбоя посередине копирования остаётся только .partial
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.replace(partial_dir, job_dir)
+
+        audio = {
+            "audio": os.path.basename(audio_path),
+            "srt": os.path.basename(srt_path),
+            "chunks": [[os.path.basename(chunk_path), duration] for chunk_path, duration in chunks],
+        }
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, audio = ?, updated = ? WHERE job_id = ?",
+                ("audio", json.dumps(audio), time.time(), job_id)
+            )
+            self._conn.commit()
+        logger.info(f"Задача {job_id}: озвучка ({len(chunks)} фрагм.) и SRT сохранены в журнале")
+
+    def restore_audio(self, job_id: str, workdir: str) -> tuple[str, str] | None:
+        """Копирует сохранённые озвучку и SRT в рабочую папку; None — сохранённых нет."""
+        with self._lock:
+            row = self._conn.execute("SELECT audio FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row or not row[0]:
+            return None
+        audio = json.loads(row[0])
+        job_dir = self._job_dir(job_id)
+        names = {audio["audio"], audio["srt"], *(name for name, _ in audio["chunks"])}
+        try:
+            for name in names:
+                shutil.copyfile(os.path.join(job_dir, name), os.path.join(workdir, name))
+        except OSError as e:
+            logger.warning(f"Задача {job_id}: файлы озвучки из журнала недоступны ({e})")
+            return None
+        return os.path.join(workdir, audio["audio"]), os.path.join(workdir, audio["srt"])
+
+    def finish(self, job_id: str):
+        """Удаляет задачу из журнала вместе с сохранёнными файлами (успех, отмена, окончательная ошибка)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        shutil.rmtree(self._job_dir(job_id) + ".partial", ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
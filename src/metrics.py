@@ -0,0 +1,331 @@
+# src/metrics.py
+
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию, в секундах: от быстрых запросов до долгого рендера
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и потокобезопасное хранилище значений."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 registry: "Registry | None" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонный счётчик (вызовы API, байты, попадания в кэш)."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение (глубина очереди, число ffmpeg в работе).
+    set_function позволяет читать значение при каждом запросе /metrics.
+    """
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        if self._function:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение берётся из function (только для метрик без меток)."""
+        self._function = function
+
+    @contextmanager
+    def track(self, **labels):
+        """+1 на время выполнения блока."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> list[str]:
+        if self._function:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать метрику {self.name}: {e}")
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Распределение длительностей: _bucket (накопительно), _sum и _count, как в Prometheus."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry: "Registry | None" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока (в том числе блока с await внутри)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(v[0]), v[1], v[2])) for key, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик, которые отдаёт /metrics."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Метрики бота и пайплайна ---
+
+STAGE_SECONDS = Histogram(
+    "yshorts_stage_seconds", "Длительность этапов обработки видео", ("stage",)
+)
+API_CALLS = Counter(
+    "yshorts_api_calls_total", "Вызовы внешних API", ("api", "call", "status")
+)
+API_BYTES = Counter(
+    "yshorts_api_bytes_total", "Байты, переданные во внешние API и полученные из них", ("api", "direction")
+)
+CACHE_LOOKUPS = Counter(
+    "yshorts_cache_lookups_total", "Обращения к кэшам", ("cache", "result")
+)
+JOBS = Counter(
+    "yshorts_jobs_total", "Завершённые задачи по результату", ("result",)
+)
+FFMPEG_IN_FLIGHT = Gauge(
+    "yshorts_ffmpeg_in_flight", "Запущенные сейчас процессы ffmpeg/ffprobe"
+)
+QUEUE_DEPTH = Gauge(
+    "yshorts_queue_depth", "Задачи, ожидающие в очереди"
+)
+JOBS_RUNNING = Gauge(
+    "yshorts_jobs_running", "Задачи, которые сейчас выполняются"
+)
+ENCODES_ACTIVE = Gauge(
+    "yshorts_encodes_active", "Кодирования ffmpeg, получившие ядра"
+)
+ENCODES_WAITING = Gauge(
+    "yshorts_encodes_waiting", "Кодирования ffmpeg, ждущие свободных ядер"
+)
+API_RETRIES = Counter(
+    "yshorts_api_retries_total", "Повторы запросов к внешним API по причине (код ответа или network)",
+    ("api", "call", "reason")
+)
+API_THROTTLED_SECONDS = Counter(
+    "yshorts_api_throttled_seconds_total", "Время ожидания клиентского лимита запросов", ("api",)
+)
+API_BREAKER_STATE = Gauge(
+    "yshorts_api_breaker_state", "Размыкатель провайдера: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут",
+    ("api",)
+)
+RENDER_SPEED = Histogram(
+    "yshorts_render_speed_factor", "Скорость финальной сборки: секунд видео за секунду работы",
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Замер этапа: пишет в STAGE_SECONDS и в debug-лог."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        logger.debug(f"Этап {name}: {elapsed:.3f} с")
+
+
+def timed(name: str):
+    """Декоратор: вся функция (обычная или корутина) замеряется как этап name."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def api_call(api: str, call: str):
+    """Считает вызов API со статусом ok/error (исключение пробрасывается дальше)."""
+    try:
+        yield
+    except BaseException:
+        API_CALLS.inc(api=api, call=call, status="error")
+        raise
+    API_CALLS.inc(api=api, call=call, status="ok")
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics в фоновом потоке (не зависит от event loop бота)."""
+
+    def __init__(self, host: str, port: int, registry: Registry | None = None):
+        registry = registry or REGISTRY
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        host, port = self.address
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
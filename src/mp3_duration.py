@@ -0,0 +1,164 @@
+# src/mp3_duration.py
+
+import struct
+
+# Битрейты (кбит/с) по индексу: [версия MPEG1 / MPEG2 и 2.5][слой]
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Частоты дискретизации по индексу для MPEG1 / MPEG2 / MPEG2.5
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+
+def _parse_header(data: bytes, pos: int) -> dict | None:
+    """
+    Разбирает 4-байтовый заголовок MPEG-фрейма.
+    Возвращает None, если по этому смещению нет валидного заголовка.
+    """
+    if pos + 4 > len(data):
+        return None
+    b1, b2, b3, b4 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b1 != 0xFF or (b2 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b2 >> 3) & 0x03
+    layer_bits = (b2 >> 1) & 0x03
+    bitrate_index = (b3 >> 4) & 0x0F
+    sample_rate_index = (b3 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # Зарезервированные значения и "free format" не поддерживаем
+        return None
+
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    padding = (b3 >> 1) & 0x01
+    channel_mode = (b4 >> 6) & 0x03
+
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 1152 if version == 1 else 576
+        length = (144 if version == 1 else 72) * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "length": length,
+        "mono": channel_mode == 3,
+    }
+
+
+def _skip_id3v2(data: bytes) -> int:
+    """Возвращает смещение сразу за ID3v2-тегом (или 0, если тега нет)."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F) # syncsafe integer
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _find_first_frame(data: bytes, pos: int) -> (int, dict | None): # type: ignore
+    """
+    Ищет первый фрейм, за которым сразу идёт ещё один совместимый фрейм
+    (защита от ложной синхронизации внутри мусора/тегов).
+    """
+    while pos < len(data) - 4:
+        header = _parse_header(data, pos)
+        if header:
+            next_pos = pos + header["length"]
+            if next_pos >= len(data):
+                return pos, header # Единственный фрейм в файле
+            following = _parse_header(data, next_pos)
+            if following and following["sample_rate"] == header["sample_rate"] and following["layer"] == header["layer"]:
+                return pos, header
+        pos += 1
+    return pos, None
+
+
+def _duration_from_vbr_header(data: bytes, pos: int, header: dict) -> float | None:
+    """Читает количество фреймов из заголовка Xing/Info или VBRI, если он есть."""
+    if header["version"] == 1:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+
+    xing_pos = pos + 4 + side_info
+    tag = data[xing_pos:xing_pos + 4]
+    if tag in (b"Xing", b"Info") and xing_pos + 12 <= len(data):
+        flags = struct.unpack(">I", data[xing_pos + 4:xing_pos + 8])[0]
+        if flags & 0x01: # Поле с количеством фреймов присутствует
+            frames = struct.unpack(">I", data[xing_pos + 8:xing_pos + 12])[0]
+            if frames:
+                return frames * header["samples"] / header["sample_rate"]
+
+    # VBRI всегда лежит через 32 байта после заголовка фрейма
+    vbri_pos = pos + 4 + 32
+    if data[vbri_pos:vbri_pos + 4] == b"VBRI" and vbri_pos + 18 <= len(data):
+        frames = struct.unpack(">I", data[vbri_pos + 14:vbri_pos + 18])[0]
+        if frames:
+            return frames * header["samples"] / header["sample_rate"]
+
+    return None
+
+
+def get_mp3_duration(data: bytes) -> float | None:
+    """
+    Определяет длительность MP3 прямо по байтам в памяти, без ffprobe.
+    Сначала ищет Xing/Info/VBRI-заголовок, иначе проходит по всем фреймам.
+    Возвращает None, если данные не удалось разобрать.
+    """
+    if not data:
+        return None
+
+    pos, header = _find_first_frame(data, _skip_id3v2(data))
+    if not header:
+        return None
+
+    duration = _duration_from_vbr_header(data, pos, header)
+    if duration is not None:
+        return duration
+
+    # Нет VBR-заголовка: суммируем сэмплы по всем фреймам
+    total_samples = 0
+    sample_rate = header["sample_rate"]
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128 # ID3v1 в конце файла
+
+    while pos < end - 4:
+        header = _parse_header(data, pos)
+        if not header or header["sample_rate"] != sample_rate:
+            # Потеряли синхронизацию — ищем следующий фрейм
+            pos, header = _find_first_frame(data[:end], pos + 1)
+            if not header:
+                break
+            continue
+        if pos + header["length"] > end:
+            break # Обрезанный последний фрейм не считаем
+        total_samples += header["samples"]
+        pos += header["length"]
+
+    if not total_samples:
+        return None
+    return total_samples / sample_rate
@@ -4,64 +4,40 @@ import logging
 import os
 import time
 import json
+import base64
+import hashlib
 import re
+import shutil
 import subprocess
 import asyncio
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 from dotenv import load_dotenv
 from google import genai
-from elevenlabs import ElevenLabs, save
+from google.genai import types as genai_types
+from elevenlabs import ElevenLabs
+
+from src import metrics
+from src.cache import DescriptionCache, TTSCache, file_sha256
+from src.encode_scheduler import EncodeScheduler
+from src.ffmpeg_progress import (
+    STDERR_TAIL_LINES, FFmpegProgress, ProgressParser, ProgressTracker, RenderProgress, with_progress
+)
+from src.mp3_duration import get_mp3_duration
+from src.rate_limit import ProviderLimiter
+from src.subtitle_overlay import SUBTITLE_STYLE, CueImage, overlay_args, render_cue_images, shift_cue_images
+from src.workspace import WorkspaceManager
 
 # Загружаем .env
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-class VideoPipeline:
-    """
-    Инкапсулирует полный пайплайн:
-    1. Gemini: Текст из видео
-    2. ElevenLabs + FFprobe: Контекстная озвучка по фразам + .SRT субтитры
-    3. FFmpeg: Сборка видео, замена аудио и вжигание субтитров
-    """
-    
-    def __init__(self):
-        os.makedirs("tmp", exist_ok=True)
-        os.makedirs("results", exist_ok=True)
-        
-        # Инициализируем клиент ElevenLabs один раз
-        self.elevenlabs_api_key = os.getenv("ELEVEN_LAB_API")
-        if not self.elevenlabs_api_key:
-            logger.error("ELEVEN_LAB_API не найден в .env!")
-            self.elevenlabs_client = None
-        else:
-            self.elevenlabs_client = ElevenLabs(
-                base_url="https://api.elevenlabs.io",
-                api_key=self.elevenlabs_api_key
-            )
+GEMINI_MODEL = "gemini-2.5-flash"
 
-    # --- ШАГ 1: ГЕНЕРАЦИЯ ТЕКСТА ---
-    def get_desc_video(self, videoPath: str) -> dict:
-        """
-        [Логика из textFromVideo.py]
-        Получает JSON с title и content из видео.
-        """
-        client = genai.Client(api_key=os.getenv("GEMENI_API_KEY"))
-        logger.info(f"Uploading file: {videoPath}...")
-        
-        videoFile = None
-        try:
-            videoFile = client.files.upload(file=videoPath)
-
-            # Ждём активацию файла
-            for _ in range(10):
-                file_info = client.files.get(name=videoFile.name)
-                if file_info.state == "ACTIVE":
-                    break
-                logger.info(f"Файл {videoFile.name} ещё не активен, ожидаем...")
-                time.sleep(2)
-            else:
-                raise RuntimeError(f"Файл {videoFile.name} не стал ACTIVE.")
-
-            prompt = """
+DESC_PROMPT = """
 Ты — сценарист, диктор и автор кинематографичных текстов.
 
 Я отправлю тебе видео или отрывок фильма.  
@@ -95,22 +71,345 @@ class VideoPipeline:
 }
 """
 
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[videoFile, prompt]
+# Пресеты прокси-клипа для загрузки в Gemini: для понимания сцены
+# не нужен оригинал 1080p+, достаточно маленького клипа с низким fps
+GEMINI_PROXY_PRESETS = {
+    "off": None, # Загружать оригинал
+    "small": {"height": 480, "fps": 2, "crf": 32, "audio_bitrate": "48k"},
+    "tiny": {"height": 360, "fps": 1, "crf": 36, "audio_bitrate": "32k"},
+}
+
+SUBTITLE_MODES = ("burn", "soft")
+
+# Кодеки, которые можно скопировать в mp4 без перекодирования (и дополнительные флаги для них)
+SOFT_SUBTITLE_CODECS = {
+    "h264": [],
+    "hevc": ["-tag:v", "hvc1"], # Иначе плееры Apple не открывают HEVC в mp4
+}
+
+
+def run_cmd(cmd: list[str], preexec_fn=None) -> subprocess.CompletedProcess:
+    """subprocess.run для ffmpeg/ffprobe с учётом в метрике запущенных процессов."""
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        return subprocess.run(cmd, check=True, capture_output=True, text=True, preexec_fn=preexec_fn)
+
+
+def run_ffmpeg(cmd: list[str], on_progress: Callable[[FFmpegProgress], None] | None = None,
+               preexec_fn=None):
+    """
+    Запускает ffmpeg с -progress: прогресс разбирается по мере поступления и отдаётся
+    в on_progress, а от stderr хранится только хвост (для сообщения об ошибке).
+    Бросает CalledProcessError, как run_cmd.
+    """
+    cmd = with_progress(cmd)
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, preexec_fn=preexec_fn
+        )
+        # stderr читаем в отдельном потоке: иначе ffmpeg встанет на полном буфере трубы
+        reader = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+        reader.start()
+        parser = ProgressParser()
+        for line in proc.stdout:
+            progress = parser.feed(line)
+            if progress and on_progress:
+                on_progress(progress)
+        proc.wait()
+        reader.join()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr="".join(stderr_tail))
+
+
+class VideoPipeline:
+    """
+    Инкапсулирует полный пайплайн:
+    1. Gemini: Текст из видео
+    2. ElevenLabs + FFprobe: Контекстная озвучка по фразам + .SRT субтитры
+    3. FFmpeg: Сборка видео, замена аудио и вжигание субтитров
+    """
+    
+    # Параметры озвучки (входят в ключ TTS-кэша)
+    VOICE_ID = "FGY2WhTYpPnrIDTdsKH5"
+    TTS_MODEL_ID = "eleven_multilingual_v2"
+    TTS_OUTPUT_FORMAT = "mp3_44100_128"
+    PAUSE = 0.1 # Пауза между субтитрами в секундах
+
+    def __init__(self, tts_workers: int | None = None, tts_max_in_flight: int | None = None,
+                 tts_cache_max_bytes: int | None = None, desc_cache_max_entries: int | None = None,
+                 fused_render: bool | None = None, tts_mode: str | None = None,
+                 staged: bool | None = None, gemini_proxy_preset: str | None = None,
+                 workspaces: WorkspaceManager | None = None, encoder: EncodeScheduler | None = None,
+                 segment_render_min_seconds: float | None = None, subtitle_mode: str | None = None):
+        os.makedirs("tmp", exist_ok=True)
+        os.makedirs("results", exist_ok=True)
+        
+        # Клиент Gemini тоже создаётся один раз: переиспользуем keep-alive соединения
+        self.gemini_client = genai.Client(**self._gemini_client_args())
+
+        # Адаптивное ожидание ACTIVE: первая проверка через десятки мс, затем шаг растёт
+        self.gemini_poll_initial = float(os.getenv("GEMINI_POLL_INITIAL", "0.05"))
+        self.gemini_poll_max = float(os.getenv("GEMINI_POLL_MAX", "2.0"))
+        self.gemini_active_timeout = float(os.getenv("GEMINI_ACTIVE_TIMEOUT", "30"))
+        # Общий на все задачи лимит запросов к Gemini (частота, параллельность, повторы 429/5xx)
+        self.gemini_limiter = ProviderLimiter.from_env(
+            "gemini", "GEMINI", max_in_flight=int(os.getenv("GEMINI_MAX_IN_FLIGHT", "0"))
+        )
+
+        # Инициализируем клиент ElevenLabs один раз
+        self.elevenlabs_api_key = os.getenv("ELEVEN_LAB_API")
+        if not self.elevenlabs_api_key:
+            logger.error("ELEVEN_LAB_API не найден в .env!")
+            self.elevenlabs_client = None
+        else:
+            # base_url можно переопределить (например, локальный фейковый TTS-сервер для тестов)
+            self.elevenlabs_client = ElevenLabs(
+                base_url=os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io"),
+                api_key=self.elevenlabs_api_key
+            )
+
+        # Параллельная озвучка: сколько фраз одной задачи синтезируется одновременно
+        self.tts_workers = max(1, tts_workers or int(os.getenv("TTS_WORKERS", "4")))
+        # Общий лимит одновременных запросов к ElevenLabs (на все задачи сразу),
+        # чтобы не выходить за квоту API по параллельным запросам
+        self.tts_max_in_flight = max(1, tts_max_in_flight or int(os.getenv("TTS_MAX_IN_FLIGHT", "4")))
+        # Тот же лимитер держит и частоту запросов (TTS_RPS), повторяет 429/5xx и размыкает цепь
+        self.tts_limiter = ProviderLimiter.from_env("elevenlabs", "TTS", max_in_flight=self.tts_max_in_flight)
+
+        # Дисковый кэш фраз: повторы не оплачиваются повторно (0 — кэш выключен)
+        if tts_cache_max_bytes is None:
+            tts_cache_max_bytes = int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024
+        if tts_cache_max_bytes > 0:
+            self.tts_cache = TTSCache(
+                os.getenv("TTS_CACHE_PATH", "cache/tts.sqlite3"), tts_cache_max_bytes
             )
+        else:
+            self.tts_cache = None
+
+        # Кэш ответов Gemini по содержимому видео (0 — кэш выключен)
+        if desc_cache_max_entries is None:
+            desc_cache_max_entries = int(os.getenv("DESC_CACHE_MAX_ENTRIES", "1000"))
+        if desc_cache_max_entries > 0:
+            self.desc_cache = DescriptionCache(
+                os.getenv("DESC_CACHE_PATH", "cache/descriptions.sqlite3"),
+                ttl=float(os.getenv("DESC_CACHE_TTL", str(7 * 24 * 3600))),
+                max_entries=desc_cache_max_entries
+            )
+        else:
+            self.desc_cache = None
+
+        # Однопроходная сборка: фрагменты аудио с паузами подаются прямо в финальный ffmpeg
+        # (без промежуточной склейки в _final.mp3)
+        if fused_render is None:
+            fused_render = os.getenv("FUSED_RENDER", "0") == "1"
+        self.fused_render = fused_render
+
+        # Режим озвучки: "chunks" — запрос на каждую фразу,
+        # "aligned" — один запрос на весь текст с посимвольными таймингами
+        self.tts_mode = tts_mode or os.getenv("TTS_MODE", "chunks")
+
+        # Конвейер: подготовка видео (9:16, fps) идёт параллельно с Gemini и TTS
+        if staged is None:
+            staged = os.getenv("STAGED_PIPELINE", "0") == "1"
+        self.staged = staged
+        self.prep_width = int(os.getenv("PREP_WIDTH", "1080"))
+        self.prep_height = int(os.getenv("PREP_HEIGHT", "1920"))
+        self.prep_fps = int(os.getenv("PREP_FPS", "30"))
+
+        # Прокси-клип для Gemini вместо оригинала
+        self.gemini_proxy_preset = gemini_proxy_preset or os.getenv("GEMINI_PROXY_PRESET", "small")
+        if self.gemini_proxy_preset not in GEMINI_PROXY_PRESETS:
+            logger.warning(f"Неизвестный пресет прокси {self.gemini_proxy_preset}, использую оригинал")
+            self.gemini_proxy_preset = "off"
+
+        # Рабочие папки задач: tmpfs (/dev/shm), пока хватает бюджета, иначе диск
+        self.workspaces = workspaces or WorkspaceManager(
+            ram_root=os.getenv("WORKSPACE_RAM_ROOT", "/dev/shm/yshorts"),
+            disk_root=os.getenv("WORKSPACE_DISK_ROOT", "tmp"),
+            ram_budget=int(os.getenv("WORKSPACE_RAM_BUDGET_MB", "512")) * 1024 * 1024,
+            disk_budget=int(os.getenv("WORKSPACE_DISK_BUDGET_MB", "4096")) * 1024 * 1024
+        )
+
+        # Общий бюджет ядер для libx264: лишние кодирования ждут, а не делят ядра между собой
+        self.encoder = encoder or EncodeScheduler(
+            cores=int(os.getenv("ENCODE_CORES", "0")) or None,
+            threads=int(os.getenv("ENCODE_THREADS", "4")),
+            pin_cpus=os.getenv("ENCODE_PIN_CPUS", "0") == "1"
+        )
+
+        # Сегментная сборка длинных видео: куски по ключевым кадрам кодируются параллельно
+        # (0 — выключено; иначе включается для видео не короче порога)
+        if segment_render_min_seconds is None:
+            segment_render_min_seconds = float(os.getenv("SEGMENT_RENDER_MIN_SECONDS", "90"))
+        self.segment_render_min_seconds = segment_render_min_seconds
+        self.segment_seconds = float(os.getenv("SEGMENT_SECONDS", "20"))
+
+        # Субтитры: "burn" — вжигаются (перекодирование), "soft" — отдельная дорожка mov_text,
+        # видео копируется без перекодирования (если кодек подходит)
+        self.subtitle_mode = self._check_subtitle_mode(subtitle_mode or os.getenv("SUBTITLE_MODE", "burn"))
+        # Вжигание: "overlay" — реплики один раз рисуются в картинки и накладываются в своих окнах,
+        # "libass" — фильтр subtitles рисует их на каждом кадре (и запасной путь для overlay)
+        self.subtitle_renderer = os.getenv("SUBTITLE_RENDERER", "overlay")
+
+    # --- ШАГ 1: ГЕНЕРАЦИЯ ТЕКСТА ---
+
+    @staticmethod
+    def _with_threads(cmd: list[str], threads: int | None) -> list[str]:
+        """
+        Ограничивает потоки ffmpeg: -filter_threads и -filter_complex_threads (глобально)
+        и -threads (кодировщик). Все команды кодирования пайплайна заканчиваются на "<выходной файл> -y".
+        """
+        if not threads:
+            return cmd
+        return [
+            cmd[0], "-filter_threads", str(threads), "-filter_complex_threads", str(threads),
+            *cmd[1:-2], "-threads", str(threads), *cmd[-2:]
+        ]
+
+    def _run_encode(self, cmd: list[str], on_progress: Callable[[FFmpegProgress], None] | None = None):
+        """Запускает кодирование ffmpeg, когда планировщик выделит ядра."""
+        with self.encoder.slot() as slot:
+            run_ffmpeg(self._with_threads(cmd, slot.threads), on_progress, slot.preexec_fn)
+
+    def _upload_proxy_cmd(self, video_path: str, proxy_path: str) -> list[str] | None:
+        """Команда ffmpeg для прокси-клипа Gemini (None — пресет выключен)."""
+        preset = GEMINI_PROXY_PRESETS.get(self.gemini_proxy_preset)
+        if not preset:
+            return None
+        return [
+            "ffmpeg",
+            "-i", video_path,
+            "-vf", f"scale=-2:'min({preset['height']},ih)',fps={preset['fps']}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", str(preset["crf"]),
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-ac", "1",
+            "-b:a", preset["audio_bitrate"],
+            proxy_path,
+            "-y"
+        ]
+
+    @metrics.timed("gemini_proxy")
+    def make_upload_proxy(self, video_path: str, proxy_path: str) -> bool:
+        """
+        Создаёт маленький клип для загрузки в Gemini по пресету gemini_proxy_preset:
+        низкое разрешение, низкий fps и битрейт, моно-звук. Длительность не меняется.
+        """
+        cmd = self._upload_proxy_cmd(video_path, proxy_path)
+        if not cmd:
+            return False
+        try:
+            self._run_encode(cmd)
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Ошибка FFmpeg при создании прокси для Gemini: {e.stderr}")
+            if os.path.exists(proxy_path):
+                os.remove(proxy_path)
+            return False
+
+    def _proxy_path(self, videoPath: str, workdir: str | None) -> str:
+        if workdir:
+            return os.path.join(workdir, "gemini_proxy.mp4")
+        return f"{os.path.splitext(videoPath)[0]}_proxy.mp4"
+
+    def _desc_cache_lookup(self, videoPath: str, file_unique_id: str | None,
+                           content_hash: str | None = None) -> (dict | None, str | None): # type: ignore
+        """
+        Ищет описание в кэше. Возвращает (данные или None, ключ для сохранения).
+        content_hash — sha256 видео, если он уже посчитан (при потоковом приёме).
+        """
+        if not self.desc_cache:
+            return None, None
+        # Сначала дешёвый поиск по file_unique_id (без чтения файла)
+        cached = self.desc_cache.get(file_unique_id=self._desc_unique_id(file_unique_id)) if file_unique_id else None
+        if cached is not None:
+            metrics.CACHE_LOOKUPS.inc(cache="description", result="hit")
+            return cached, None
+        # Ключ учитывает модель и промпт: при их смене старые ответы не используются
+        content_hash = content_hash or file_sha256(videoPath)
+        cache_key = hashlib.sha256(
+            f"{content_hash}:{GEMINI_MODEL}:{DESC_PROMPT}".encode("utf-8")
+        ).hexdigest()
+        cached = self.desc_cache.get(key=cache_key)
+        metrics.CACHE_LOOKUPS.inc(cache="description", result="miss" if cached is None else "hit")
+        return cached, cache_key
+
+    @staticmethod
+    def _desc_unique_id(file_unique_id: str) -> str:
+        """
+        file_unique_id для кэша описаний: как и ключ по содержимому, учитывает модель и промпт,
+        иначе после их смены по Telegram-id отдавались бы старые ответы.
+        """
+        fingerprint = hashlib.sha256(f"{GEMINI_MODEL}:{DESC_PROMPT}".encode("utf-8")).hexdigest()[:16]
+        return f"{file_unique_id}:{fingerprint}"
+
+    def _parse_desc_response(self, response_text: str, cache_key: str | None,
+                             file_unique_id: str | None) -> dict:
+        """Разбирает JSON из ответа Gemini и кэширует корректный результат."""
+        text = response_text.strip()
+        text = re.sub(r"^```(?:json)?\s*", "", text)
+        text = re.sub(r"\s*```$", "", text)
+
+        data = json.loads(text)
+
+        # Кэшируем только корректный ответ (ошибки сюда не доходят)
+        if self.desc_cache and cache_key and isinstance(data, dict) and data.get("content"):
+            self.desc_cache.put(
+                cache_key, data, file_unique_id=self._desc_unique_id(file_unique_id) if file_unique_id else None
+            )
+        return data
+
+    @metrics.timed("describe")
+    def get_desc_video(self, videoPath: str, file_unique_id: str | None = None,
+                       workdir: str | None = None, content_hash: str | None = None) -> dict:
+        """
+        [Логика из textFromVideo.py]
+        Получает JSON с title и content из видео.
+        Повторное видео (тот же file_unique_id или то же содержимое)
+        берётся из кэша без загрузки в Gemini.
+        """
+        cached, cache_key = self._desc_cache_lookup(videoPath, file_unique_id, content_hash)
+        if cached is not None:
+            logger.info(f"Описание видео взято из кэша: {videoPath}")
+            return cached
+
+        client = self.gemini_client
+
+        # Загружаем прокси-клип вместо оригинала (если пресет включён и ffmpeg справился);
+        # при потоковом приёме он уже собран во время скачивания
+        proxy_path = self._proxy_path(videoPath, workdir)
+        upload_path = videoPath
+        if os.path.exists(proxy_path) or self.make_upload_proxy(videoPath, proxy_path):
+            upload_path = proxy_path
+
+        logger.info(f"Uploading file: {upload_path}...")
+        
+        videoFile = None
+        try:
+            upload_started = time.perf_counter()
+            with metrics.stage("gemini_upload"):
+                videoFile = self.gemini_limiter.call(lambda: client.files.upload(file=upload_path), "upload")
+            upload_time = time.perf_counter() - upload_started
+            self._log_upload_stats(videoPath, upload_path, upload_time)
+
+            # Ждём активацию файла
+            with metrics.stage("gemini_active_wait"):
+                self._wait_file_active(client, videoFile.name)
+
+            with metrics.stage("gemini_generate"):
+                response = self.gemini_limiter.call(
+                    lambda: client.models.generate_content(model=GEMINI_MODEL, contents=[videoFile, DESC_PROMPT]),
+                    "generate"
+                )
 
             # Удаляем файл сразу после получения ответа
             logger.info(f"Deleting file {videoFile.name}...")
-            client.files.delete(name=videoFile.name)
+            self.gemini_limiter.call(lambda: client.files.delete(name=videoFile.name), "delete")
             logger.info("File deleted.")
 
-            text = response.text.strip()
-            text = re.sub(r"^```(?:json)?\s*", "", text)
-            text = re.sub(r"\s*```$", "", text)
-
-            data = json.loads(text)
-            return data
+            return self._parse_desc_response(response.text, cache_key, file_unique_id)
             
         except Exception as e:
             logger.error(f"Ошибка в get_desc_video: {e}", exc_info=True)
@@ -123,6 +422,64 @@ class VideoPipeline:
                     client.files.delete(name=videoFile.name)
                 except Exception:
                     pass # Игнорируем ошибку, если файл уже удален
+            if os.path.exists(proxy_path):
+                os.remove(proxy_path)
+
+    @staticmethod
+    def _gemini_client_args() -> dict:
+        """Аргументы genai.Client; GEMINI_BASE_URL позволяет указать локальный фейковый сервер."""
+        args = {"api_key": os.getenv("GEMENI_API_KEY")}
+        base_url = os.getenv("GEMINI_BASE_URL")
+        if base_url:
+            args["http_options"] = genai_types.HttpOptions(base_url=base_url)
+        return args
+
+    def _poll_delays(self):
+        """Паузы между проверками ACTIVE: экспоненциально от gemini_poll_initial до gemini_poll_max."""
+        delay = self.gemini_poll_initial
+        while True:
+            yield delay
+            delay = min(delay * 2, self.gemini_poll_max)
+
+    def _check_file_state(self, file_info, name: str, started: float) -> float | None:
+        """Время активации, если файл ACTIVE; ошибка при FAILED или по таймауту; иначе None."""
+        elapsed = time.perf_counter() - started
+        if file_info.state == "ACTIVE":
+            logger.info(f"Файл {name} стал ACTIVE за {elapsed:.3f} с")
+            return elapsed
+        if file_info.state == "FAILED":
+            raise RuntimeError(f"Gemini не смог обработать файл {name}.")
+        if elapsed > self.gemini_active_timeout:
+            raise RuntimeError(f"Файл {name} не стал ACTIVE.")
+        return None
+
+    def _wait_file_active(self, client, name: str) -> float:
+        """Ждёт ACTIVE с адаптивной паузой. Возвращает время активации в секундах."""
+        started = time.perf_counter()
+        for delay in self._poll_delays():
+            file_info = self.gemini_limiter.call(lambda: client.files.get(name=name), "get")
+            activation_time = self._check_file_state(file_info, name, started)
+            if activation_time is not None:
+                return activation_time
+            time.sleep(delay)
+
+    def _log_upload_stats(self, video_path: str, upload_path: str, upload_time: float):
+        """Логирует, сколько байт и времени загрузки сэкономил прокси-клип."""
+        original_bytes = os.path.getsize(video_path)
+        uploaded_bytes = os.path.getsize(upload_path)
+        metrics.API_BYTES.inc(uploaded_bytes, api="gemini", direction="sent")
+        if upload_path == video_path:
+            logger.info(f"Загружен оригинал: {original_bytes} байт за {upload_time:.2f} с")
+            return
+        # Время загрузки оригинала оцениваем по фактической скорости загрузки прокси
+        throughput = uploaded_bytes / upload_time if upload_time > 0 else 0
+        estimated_original = original_bytes / throughput if throughput else 0.0
+        logger.info(
+            f"Прокси для Gemini ({self.gemini_proxy_preset}): {uploaded_bytes} байт вместо "
+            f"{original_bytes} (сэкономлено {original_bytes - uploaded_bytes} байт), "
+            f"загрузка {upload_time:.2f} с вместо ~{estimated_original:.2f} с "
+            f"(-{max(estimated_original - upload_time, 0):.2f} с)"
+        )
 
     # --- ШАГ 2: Генерация Аудио и SRT (Вспомогательные функции) ---
 
@@ -138,19 +495,22 @@ class VideoPipeline:
 
     def _get_audio_duration(self, file_path: str) -> float:
         """Получает длительность аудиофайла с помощью ffprobe."""
-        cmd = [
+        cmd = self._ffprobe_duration_cmd(file_path)
+        try:
+            result = run_cmd(cmd)
+            return float(result.stdout.strip())
+        except Exception as e:
+            logger.error(f"Ошибка при получении длительности файла {file_path}: {e}")
+            return 0.0
+
+    def _ffprobe_duration_cmd(self, file_path: str) -> list[str]:
+        return [
             "ffprobe",
             "-v", "error",
             "-show_entries", "format=duration",
             "-of", "default=noprint_wrappers=1:nokey=1",
             file_path
         ]
-        try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            return float(result.stdout.strip())
-        except Exception as e:
-            logger.error(f"Ошибка при получении длительности файла {file_path}: {e}")
-            return 0.0
 
     def _smart_text_splitter(self, text: str, max_chars: int = 45) -> list[str]:
         """
@@ -200,12 +560,231 @@ class VideoPipeline:
         # Финальная очистка от пустых строк
         return [chunk for chunk in final_chunks if chunk]
 
+    @metrics.timed("tts_chunk")
+    def _synthesize_chunk(self, text_chunks: list[str], i: int, base_filename: str,
+                          workdir: str = "tmp") -> (str, float): # type: ignore
+        """
+        Синтезирует одну фразу с контекстом соседних фраз.
+        Возвращает путь к mp3-фрагменту и его длительность.
+        """
+        chunk_text = text_chunks[i]
+
+        # Получаем контекст для ElevenLabs
+        previous_text = text_chunks[i - 1] if i > 0 else None
+        next_text = text_chunks[i + 1] if i < len(text_chunks) - 1 else None
+
+        chunk_path = os.path.join(workdir, f"{base_filename}_chunk_{i}.mp3")
+
+        # Сначала смотрим в кэш
+        cache_key, duration = self._tts_cache_lookup(chunk_text, previous_text, next_text, chunk_path)
+        if duration is not None:
+            return chunk_path, duration
+
+        logger.info(f"Генерирую аудио для: {chunk_text}")
+
+        def convert() -> bytes:
+            response = self.elevenlabs_client.text_to_speech.convert(
+                voice_id=self.VOICE_ID,
+                output_format=self.TTS_OUTPUT_FORMAT,
+                text=chunk_text,
+                model_id=self.TTS_MODEL_ID,
+                previous_text=previous_text,
+                next_text=next_text
+            )
+            # convert возвращает генератор — скачивание тоже идёт внутри слота и повторяется целиком
+            return b"".join(response)
+
+        # Общий лимит запросов "в полёте", частота и повторы при 429/5xx
+        audio_bytes = self.tts_limiter.call(convert, "convert")
+        metrics.API_BYTES.inc(len(audio_bytes), api="elevenlabs", direction="received")
+
+        with open(chunk_path, "wb") as f:
+            f.write(audio_bytes)
+
+        # Длительность считаем по байтам в памяти; ffprobe — только если не разобрали
+        duration = get_mp3_duration(audio_bytes)
+        if duration is None:
+            logger.warning(f"Не удалось разобрать MP3 в памяти, использую ffprobe: {chunk_path}")
+            duration = self._get_audio_duration(chunk_path)
+
+        self._tts_cache_store(cache_key, audio_bytes, duration)
+        return chunk_path, duration
+
+    def _tts_cache_lookup(self, chunk_text: str, previous_text: str | None, next_text: str | None,
+                          chunk_path: str) -> (str | None, float | None): # type: ignore
+        """
+        Ищет фразу в TTS-кэше. При попадании пишет mp3 в chunk_path.
+        Возвращает (ключ кэша, длительность или None при промахе).
+        """
+        if not self.tts_cache:
+            return None, None
+        cache_key = TTSCache.make_key(
+            chunk_text, previous_text, next_text,
+            self.VOICE_ID, self.TTS_MODEL_ID, self.TTS_OUTPUT_FORMAT
+        )
+        cached = self.tts_cache.get(cache_key)
+        metrics.CACHE_LOOKUPS.inc(cache="tts", result="hit" if cached else "miss")
+        if not cached:
+            return cache_key, None
+        audio_bytes, duration = cached
+        logger.info(f"Аудио из кэша для: {chunk_text}")
+        with open(chunk_path, "wb") as f:
+            f.write(audio_bytes)
+        return cache_key, duration
+
+    def _tts_cache_store(self, cache_key: str | None, audio_bytes: bytes, duration: float):
+        # Кэшируем только фрагменты с известной длительностью
+        if self.tts_cache and cache_key and duration > 0:
+            self.tts_cache.put(cache_key, audio_bytes, duration)
+
+    def _write_concat_list(self, audio_chunks_paths: list[str], concat_list_path: str, pause: float):
+        with open(concat_list_path, "w") as f:
+            for chunk_path in audio_chunks_paths:
+                f.write(f"file '{os.path.basename(chunk_path)}'\n") 
+                # Добавляем "тишину" между файлами, чтобы аудио совпадало с паузами в SRT
+                f.write(f"duration {pause}\n")
+
+    def _concat_cmd(self, concat_list_path: str, final_audio_path: str) -> list[str]:
+        # Запускаем ffmpeg для склейки. -safe 0 нужен для путей
+        return [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", concat_list_path,
+            "-c", "copy",
+            final_audio_path,
+            "-y"
+        ]
+
+    @metrics.timed("audio_concat")
+    def _concat_audio(self, audio_chunks_paths: list[str], base_filename: str, pause: float,
+                      workdir: str = "tmp") -> str:
+        """Склеивает аудио-фрагменты в один mp3 отдельным процессом ffmpeg."""
+        final_audio_path = os.path.join(workdir, f"{base_filename}_final.mp3")
+        concat_list_path = os.path.join(workdir, f"{base_filename}_concat.txt")
+
+        try:
+            self._write_concat_list(audio_chunks_paths, concat_list_path, pause)
+            # Пути в списке разрешаются относительно папки самого списка (workdir)
+            concat_cmd = self._concat_cmd(concat_list_path, final_audio_path)
+            run_ffmpeg(concat_cmd)
+        finally:
+            if os.path.exists(concat_list_path):
+                os.remove(concat_list_path)
+
+        logger.info(f"Финальное аудио собрано: {final_audio_path}")
+        return final_audio_path
+
+    def _write_audio_list(self, audio_chunks_paths: list[str], durations: list[float],
+                          base_filename: str, pause: float, workdir: str = "tmp") -> str:
+        """
+        Режим fused_render: вместо склейки пишет ffconcat-список фрагментов для create_video.
+        duration = длина фрагмента + пауза; разрыв во времени заполнит тишиной aresample.
+        """
+        list_path = os.path.join(workdir, f"{base_filename}_audio.ffconcat")
+        with open(list_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for chunk_path, duration in zip(audio_chunks_paths, durations):
+                if duration == 0.0:
+                    continue # Как и в SRT, фрагмент без длительности пропускаем
+                f.write(f"file '{os.path.basename(chunk_path)}'\n")
+                f.write(f"duration {duration + pause:.6f}\n")
+        logger.info(f"Список аудио-фрагментов для однопроходной сборки: {list_path}")
+        return list_path
+
+    @metrics.timed("tts_aligned")
+    def _generate_aligned(self, text_chunks: list[str], base_filename: str,
+                          workdir: str = "tmp") -> (str, str): # type: ignore
+        """
+        Режим "aligned": озвучивает весь текст ОДНИМ запросом (with timestamps)
+        и раскладывает фразы из _smart_text_splitter по посимвольным таймингам.
+        Бросает исключение, если ответ нельзя сопоставить с текстом.
+        """
+        # Фразы склеиваются через пробел — так смещения символов известны заранее
+        full_text = " ".join(text_chunks)
+        logger.info(f"Генерирую аудио одним запросом ({len(full_text)} символов)")
+
+        response = self.tts_limiter.call(
+            lambda: self.elevenlabs_client.text_to_speech.convert_with_timestamps(
+                voice_id=self.VOICE_ID,
+                output_format=self.TTS_OUTPUT_FORMAT,
+                text=full_text,
+                model_id=self.TTS_MODEL_ID
+            ),
+            "with_timestamps"
+        )
+
+        return self._write_aligned_outputs(response, text_chunks, base_filename, workdir)
+
+    def _write_aligned_outputs(self, response, text_chunks: list[str], base_filename: str,
+                               workdir: str) -> (str, str): # type: ignore
+        """Пишет mp3 и SRT по ответу with-timestamps (таймингам символов)."""
+        full_text = " ".join(text_chunks)
+        alignment = response.alignment
+        if alignment is None or len(alignment.characters) != len(full_text):
+            raise ValueError("Посимвольные тайминги не совпадают с текстом")
+        starts = alignment.character_start_times_seconds
+        ends = alignment.character_end_times_seconds
+
+        audio_path = os.path.join(workdir, f"{base_filename}_final.mp3")
+        srt_path = os.path.join(workdir, f"{base_filename}.srt")
+        audio_bytes = base64.b64decode(response.audio_base_64)
+        metrics.API_BYTES.inc(len(audio_bytes), api="elevenlabs", direction="received")
+        with open(audio_path, "wb") as f:
+            f.write(audio_bytes)
+
+        try:
+            with open(srt_path, "w", encoding="utf-8") as srt_file:
+                offset = 0
+                for i, chunk_text in enumerate(text_chunks):
+                    # Границы реплики — первый и последний символ фразы
+                    start_time = starts[offset]
+                    end_time = ends[offset + len(chunk_text) - 1]
+                    offset += len(chunk_text) + 1 # + пробел-разделитель
+
+                    srt_file.write(f"{i + 1}\n")
+                    srt_file.write(f"{self._format_srt_time(start_time)} --> {self._format_srt_time(end_time)}\n")
+                    srt_file.write(f"{chunk_text}\n\n")
+        except Exception:
+            os.remove(audio_path)
+            raise
+
+        logger.info(f"Аудио и субтитры получены одним запросом: {audio_path}")
+        return audio_path, srt_path
+
+    def _write_srt(self, srt_path: str, text_chunks: list[str], results: list[tuple[str, float]], pause: float):
+        """Пишет SRT по списку (путь фрагмента, длительность) в исходном порядке фраз."""
+        current_time = 0.0
+        with open(srt_path, "w", encoding="utf-8") as srt_file:
+            for i, (chunk_text, (chunk_path, duration)) in enumerate(zip(text_chunks, results)):
+                # Проверяем длительность фрагмента
+                if duration == 0.0:
+                    logger.warning(f"Не удалось получить длительность для {chunk_path}")
+                    continue
+                
+                start_time_str = self._format_srt_time(current_time)
+                end_time = current_time + duration
+                end_time_str = self._format_srt_time(end_time)
+                
+                srt_file.write(f"{i + 1}\n")
+                srt_file.write(f"{start_time_str} --> {end_time_str}\n")
+                srt_file.write(f"{chunk_text}\n\n")
+                
+                # Двигаем "курсор" времени вперед + пауза
+                current_time = end_time + pause
+
     # --- ШАГ 2 (Основной): Генерация Аудио и SRT ---
     
-    def generate_audio_and_srt(self, text: str, base_filename: str) -> (str | None, str | None): # type: ignore
+    @metrics.timed("tts")
+    def generate_audio_and_srt(self, text: str, base_filename: str,
+                               workdir: str = "tmp") -> (str | None, str | None): # type: ignore
         """
         Генерирует аудио по коротким фразам С УЧЕТОМ КОНТЕКСТА,
-        склеивает его и создает SRT-файл на лету.
+        склеивает его и создает SRT-файл.
+        Фразы синтезируются параллельно (tts_workers), тайминги
+        считаются после получения всех длительностей — порядок сохраняется.
+        В режиме tts_mode="aligned" весь текст озвучивается одним запросом,
+        а при ошибке выполняется обычный пофразовый режим.
         """
         if not self.elevenlabs_client:
             logger.error("Клиент ElevenLabs не инициализирован.")
@@ -219,94 +798,235 @@ class VideoPipeline:
             logger.error("Не удалось разбить текст на фразы.")
             return None, None
 
-        srt_path = f"tmp/{base_filename}.srt"
-        audio_chunks_paths = []
-        current_time = 0.0
-        pause = 0.1 # Пауза между субтитрами в секундах
+        if self.tts_mode == "aligned":
+            try:
+                return self._generate_aligned(text_chunks, base_filename, workdir)
+            except Exception as e:
+                logger.warning(f"Режим aligned не сработал, перехожу на пофразовую озвучку: {e}")
+
+        srt_path = os.path.join(workdir, f"{base_filename}.srt")
+        audio_chunks_paths = [
+            os.path.join(workdir, f"{base_filename}_chunk_{i}.mp3") for i in range(len(text_chunks))
+        ]
+        pause = self.PAUSE
+        keep_chunks = False # В режиме fused_render фрагменты нужны create_video
 
         try:
-            with open(srt_path, "w", encoding="utf-8") as srt_file:
-                for i, chunk_text in enumerate(text_chunks):
-                    
-                    # Получаем контекст для ElevenLabs
-                    previous_text = text_chunks[i - 1] if i > 0 else None
-                    next_text = text_chunks[i + 1] if i < len(text_chunks) - 1 else None
-                    
-                    logger.info(f"Генерирую аудио для: {chunk_text}")
-                    
-                    # 2. Генерируем аудио-фрагмент с контекстом
-                    response = self.elevenlabs_client.text_to_speech.convert(
-                        voice_id="FGY2WhTYpPnrIDTdsKH5",
-                        output_format="mp3_44100_128",
-                        text=chunk_text,
-                        model_id="eleven_multilingual_v2",
-                        previous_text=previous_text,
-                        next_text=next_text
-                    )
-                    
-                    chunk_path = f"tmp/{base_filename}_chunk_{i}.mp3"
-                    save(response, chunk_path)
-                    audio_chunks_paths.append(chunk_path)
-                    
-                    # 3. Получаем длительность фрагмента
-                    duration = self._get_audio_duration(chunk_path)
-                    if duration == 0.0:
-                        logger.warning(f"Не удалось получить длительность для {chunk_path}")
-                        continue
-                    
-                    # 4. Пишем в SRT-файл
-                    start_time_str = self._format_srt_time(current_time)
-                    end_time = current_time + duration
-                    end_time_str = self._format_srt_time(end_time)
-                    
-                    srt_file.write(f"{i + 1}\n")
-                    srt_file.write(f"{start_time_str} --> {end_time_str}\n")
-                    srt_file.write(f"{chunk_text}\n\n")
-                    
-                    # Двигаем "курсор" времени вперед + пауза
-                    current_time = end_time + pause
+            # 2. Генерируем аудио-фрагменты параллельно
+            workers = min(self.tts_workers, len(text_chunks))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts") as executor:
+                futures = [
+                    executor.submit(self._synthesize_chunk, text_chunks, i, base_filename, workdir)
+                    for i in range(len(text_chunks))
+                ]
+                # result() в исходном порядке: ждём все фрагменты, ошибка любого — ошибка задачи
+                results = [future.result() for future in futures]
 
-            # 5. Склеиваем все аудио-фрагменты в один файл
-            final_audio_path = f"tmp/{base_filename}_final.mp3"
-            concat_list_path = f"tmp/{base_filename}_concat.txt"
-            
-            with open(concat_list_path, "w") as f:
-                for chunk_path in audio_chunks_paths:
-                    f.write(f"file '{os.path.basename(chunk_path)}'\n") 
-                    # Добавляем "тишину" между файлами, чтобы аудио совпадало с паузами в SRT
-                    f.write(f"duration {pause}\n")
-            
-            # Запускаем ffmpeg для склейки. -safe 0 нужен для путей
-            concat_cmd = [
-                "ffmpeg",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", concat_list_path,
-                "-c", "copy",
-                final_audio_path,
-                "-y"
-            ]
-            # cwd="tmp" гарантирует, что ffmpeg найдет файлы из concat_list_path
-            subprocess.run(concat_cmd, check=True, capture_output=True, text=True)
-            
-            logger.info(f"Финальное аудио собрано: {final_audio_path}")
-            return final_audio_path, srt_path
+            # 3-4. Пишем SRT-файл по известным длительностям
+            self._write_srt(srt_path, text_chunks, results, pause)
+
+            # 5. Аудио: список фрагментов для однопроходной сборки или склейка в один файл
+            if self.fused_render:
+                durations = [duration for _, duration in results]
+                list_path = self._write_audio_list(audio_chunks_paths, durations, base_filename, pause, workdir)
+                keep_chunks = True
+                return list_path, srt_path
+            return self._concat_audio(audio_chunks_paths, base_filename, pause, workdir), srt_path
 
         except Exception as e:
             logger.error(f"Ошибка в generate_audio_and_srt: {e}", exc_info=True)
             return None, None
         finally:
             # Очистка временных файлов (chunk'ов и txt)
-            for chunk_path in audio_chunks_paths:
-                if os.path.exists(chunk_path): os.remove(chunk_path)
-            if 'concat_list_path' in locals() and os.path.exists(concat_list_path):
-                os.remove(concat_list_path)
+            if not keep_chunks:
+                for chunk_path in audio_chunks_paths:
+                    if os.path.exists(chunk_path): os.remove(chunk_path)
+
+    # --- ШАГ 0 (опционально): ПОДГОТОВКА ВИДЕО ---
+
+    @metrics.timed("prepare")
+    def prepare_video(self, video_path: str, prepared_path: str) -> bool:
+        """
+        Работа над видео, не зависящая от текста: декодирование, масштаб/кроп
+        до 9:16 и нормализация fps. Результат — промежуточный файл без аудио
+        в почти без потерь качестве, который create_video только дополняет субтитрами и звуком.
+        """
+        cmd = self._prepare_cmd(video_path, prepared_path)
+        try:
+            logger.info(f"Подготавливаю видео: {video_path}")
+            self._run_encode(cmd)
+            logger.info(f"Видео подготовлено: {prepared_path}")
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Ошибка FFmpeg при подготовке видео: {e.stderr}")
+            if os.path.exists(prepared_path):
+                os.remove(prepared_path)
+            return False
+
+    def _prepare_cmd(self, video_path: str, prepared_path: str) -> list[str]:
+        w, h = self.prep_width, self.prep_height
+        return [
+            "ffmpeg",
+            "-i", video_path,
+            "-vf", f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},setsar=1,fps={self.prep_fps}",
+            "-c:v", "libx264",
+            "-preset", "ultrafast", # Промежуточный файл: важна скорость, не размер
+            "-crf", "14",
+            "-pix_fmt", "yuv420p",
+            "-an",
+            prepared_path,
+            "-y"
+        ]
+
+    def start_prepare(self, video_path: str, workdir: str | None = None,
+                      subtitle_mode: str | None = None) -> asyncio.Task | None:
+        """
+        Если включён staged-режим, запускает prepare_video в фоне сразу после скачивания.
+        Задача возвращает путь к подготовленному видео или None при ошибке.
+        В режиме мягких субтитров подготовка не нужна: видео копируется как есть.
+        """
+        if not self.staged or self._resolve_subtitle_mode(subtitle_mode) == "soft":
+            return None
+        if workdir:
+            prepared_path = os.path.join(workdir, "prepared.mp4")
+        else:
+            prepared_path = f"{os.path.splitext(video_path)[0]}_prepared.mp4"
+
+        async def _run():
+            ok = await asyncio.to_thread(self.prepare_video, video_path, prepared_path)
+            return prepared_path if ok else None
+
+        return asyncio.create_task(_run())
+
+    async def finish_prepare(self, prep_task: asyncio.Task | None, video_path: str) -> str:
+        """Дожидается подготовки и возвращает видео для сборки (исходник, если подготовки нет)."""
+        if prep_task is None:
+            return video_path
+        try:
+            return await prep_task or video_path
+        except Exception as e:
+            logger.error(f"Подготовка видео не удалась, собираю из исходника: {e}")
+            return video_path
+
+    async def discard_prepare(self, prep_task: asyncio.Task | None):
+        """Дожидается фоновой подготовки (поток не прервать) и удаляет её результат."""
+        if prep_task is None:
+            return
+        results = await asyncio.gather(prep_task, return_exceptions=True)
+        prepared_path = results[0]
+        if isinstance(prepared_path, str) and os.path.exists(prepared_path):
+            os.remove(prepared_path)
 
     # --- ШАГ 3: СБОРКА ВИДЕО ---
-    def create_video(self, audio_path: str, video_path: str, final_path: str, srt_path: str) -> bool:
+
+    def _read_ffconcat_files(self, list_path: str) -> list[str]:
+        """Возвращает пути аудио-фрагментов из ffconcat-списка (относительно его папки)."""
+        base_dir = os.path.dirname(list_path)
+        files = []
+        with open(list_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("file "):
+                    files.append(os.path.join(base_dir, line[len("file "):].strip("'")))
+        return files
+
+    def audio_chunks(self, audio_path: str) -> list[tuple[str, float]]:
+        """
+        Фрагменты озвучки с длительностями (для журнала задач): для ffconcat-списка —
+        его файлы и duration (вместе с паузой), для склеенного mp3 — он сам.
+        """
+        if not audio_path.endswith(".ffconcat"):
+            return [(audio_path, self._audio_duration_hint(audio_path) or 0.0)]
+        durations = []
+        with open(audio_path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("duration "):
+                    durations.append(float(line.split()[1]))
+        return list(zip(self._read_ffconcat_files(audio_path), durations))
+
+    def _audio_input_args(self, audio_path: str) -> (list[str], list[str]): # type: ignore
+        """
+        Аргументы ffmpeg для аудио-входа (вход 1) и аудио-фильтра.
+        ffconcat-список (режим fused_render) читается concat-демультиплексором,
+        а паузы между фрагментами заполняются тишиной в aresample.
+        """
+        if audio_path.endswith(".ffconcat"):
+            return (
+                ["-f", "concat", "-safe", "0", "-i", audio_path],
+                ["-af", "aresample=async=1:min_hard_comp=0.01:first_pts=0"],
+            )
+        return ["-i", audio_path], []
+
+    def _remove_audio(self, audio_path: str):
+        """Удаляет аудио (а для ffconcat-списка — и все его фрагменты)."""
+        if audio_path.endswith(".ffconcat") and os.path.exists(audio_path):
+            for chunk_path in self._read_ffconcat_files(audio_path):
+                if os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+            logging.info("Временный аудиофайл удалён: %s", audio_path)
+
+    @metrics.timed("render")
+    def create_video(self, audio_path: str, video_path: str, final_path: str, srt_path: str,
+                     subtitle_mode: str | None = None,
+                     progress: Callable[[RenderProgress], None] | None = None) -> bool:
         """
         Собирает видео, заменяет аудио и "вжигает" субтитры.
+        audio_path — готовый аудиофайл или ffconcat-список фрагментов (fused_render).
+        subtitle_mode="soft" — видео без перекодирования, субтитры отдельной дорожкой
+        (при несовместимом кодеке — обычная сборка).
+        progress — вызывается по ходу сборки (процент, ETA, скорость) из потока сборки.
         """
+        if not self._check_render_inputs(audio_path, srt_path):
+            return False
+
+        # Результат обрезается по звуку (-shortest) — его длина и есть 100%
+        tracker = ProgressTracker(self._audio_duration_hint(audio_path), progress)
+
+        try:
+            if self._resolve_subtitle_mode(subtitle_mode) == "soft":
+                codec = self._probe_video_codec(video_path)
+                if self._soft_compatible(codec):
+                    try:
+                        run_ffmpeg(
+                            self._soft_subtitles_cmd(audio_path, video_path, final_path, srt_path, codec),
+                            tracker.part("soft")
+                        )
+                        logging.info("Видео собрано с мягкими субтитрами: %s", final_path)
+                        tracker.finish()
+                        return True
+                    except subprocess.CalledProcessError as e:
+                        logger.warning(f"Мягкие субтитры не получились, вжигаю: {e.stderr}")
+                        tracker.reset()
+
+            images = self._render_subtitle_images(video_path, srt_path)
+            segments = self._plan_render_segments(video_path, audio_path)
+            if segments:
+                try:
+                    self._render_segmented(audio_path, video_path, final_path, srt_path, segments, tracker, images)
+                    logging.info("Видео успешно собрано: %s", final_path)
+                    tracker.finish()
+                    return True
+                except subprocess.CalledProcessError as e:
+                    logger.warning(f"Сегментная сборка не удалась, собираю одним проходом: {e.stderr}")
+                    tracker.reset()
+
+            logger.info("Начинаю сборку видео с субтитрами...")
+            self._run_encode(
+                self._create_video_cmd(audio_path, video_path, final_path, srt_path, images), tracker.part("render")
+            )
+            logging.info("Видео успешно собрано: %s", final_path)
+            tracker.finish()
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Ошибка FFmpeg при сборке видео: {e.stderr}")
+            return False
+        finally:
+            # Очищаем финальные временные файлы
+            self._cleanup_render_inputs(audio_path, srt_path)
+
+    def _check_render_inputs(self, audio_path: str, srt_path: str) -> bool:
         if not audio_path or not os.path.exists(audio_path):
             logger.error(f"Аудиофайл не найден: {audio_path}")
             return False
@@ -315,25 +1035,68 @@ class VideoPipeline:
             logger.error(f"SRT-файл не найден: {srt_path}")
             # Не можем продолжать без субтитров, т.к. команда ffmpeg их требует
             return False
+        return True
 
-        # Экранирование пути для Windows (если вдруг понадобится)
-        # В Linux/Docker это не обязательно, но и не мешает
-        srt_path_escaped = srt_path.replace(':', '\\\\:')
+    def _cleanup_render_inputs(self, audio_path: str, srt_path: str):
+        self._remove_audio(audio_path)
+        if os.path.exists(srt_path):
+            os.remove(srt_path)
+            logging.info("Временный SRT-файл удалён: %s", srt_path)
+        shutil.rmtree(self._subtitle_images_dir(srt_path), ignore_errors=True)
+
+    def _subtitle_images_dir(self, srt_path: str) -> str:
+        """Папка картинок реплик — рядом с SRT, то есть в рабочей папке задачи."""
+        return f"{os.path.splitext(srt_path)[0]}_cues"
+
+    def _render_subtitle_images(self, video_path: str, srt_path: str) -> list[CueImage] | None:
+        """
+        Реплики SRT, заранее отрисованные в картинки (SUBTITLE_RENDERER=overlay).
+        None — вжигать фильтром libass: так настроено или отрисовка не удалась.
+        """
+        if self.subtitle_renderer != "overlay":
+            return None
+        workdir = self._subtitle_images_dir(srt_path)
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            return render_cue_images(video_path, self._read_srt(srt_path), workdir)
+        except (subprocess.CalledProcessError, ValueError, OSError) as e:
+            logger.warning(f"Не удалось отрисовать субтитры картинками, вжигаю через libass: {getattr(e, 'stderr', None) or e}")
+            return None
+
+    def _burn_subtitles_args(self, srt_path: str, images: list[CueImage] | None,
+                             first_input: int, list_path: str | None = None) -> (list[str], list[str]): # type: ignore
+        """
+        Входы и фильтры вжигания субтитров в видео входа 0: готовые картинки реплик
+        (вход first_input — их ffconcat-список, пишется в list_path) или, если их нет, фильтр libass.
+        """
+        if images is None:
+            return [], ["-vf", self._subtitles_filter(srt_path), "-map", "0:v:0"]
+        return overlay_args(images, first_input, list_path)
+
+    def _create_video_cmd(self, audio_path: str, video_path: str, final_path: str, srt_path: str,
+                          images: list[CueImage] | None = None) -> list[str]:
+        """Команда ffmpeg финальной сборки (images — картинки реплик из _render_subtitle_images)."""
+        audio_input, audio_filter = self._audio_input_args(audio_path)
+        # Вход 2: картинки реплик одним потоком
+        image_inputs, video_args = self._burn_subtitles_args(
+            srt_path, images, first_input=2,
+            list_path=os.path.join(self._subtitle_images_dir(srt_path), "overlay.ffconcat")
+        )
 
-        cmd = [
+        return [
             "ffmpeg",
             "-i", video_path,    # Вход 0: Видео
-            "-i", audio_path,    # Вход 1: Аудио
+            *audio_input,        # Вход 1: Аудио (файл или список фрагментов)
+            *image_inputs,
+            *audio_filter,
             
-            # vf (video filter) "subtitles" вжигает субтитры
-            # Добавляем стиль: тень/обводка для читаемости
-            "-vf", f"subtitles={srt_path_escaped}:force_style='FontName=Arial,FontSize=18,PrimaryColour=&HFFFFFF,BorderStyle=3,BackColour=&H80000000,Shadow=0,MarginV=25'",            
+            # Вжигаем субтитры и берём видео из входа 0
+            *video_args,
             "-c:v", "libx264",   # Перекодируем видео (обязательно для вжигания)
             "-crf", "23",        # Качество (18-28, чем ниже, тем лучше)
             "-preset", "fast",   # Скорость кодирования (ultrafast, superfast, fast, medium)
             "-c:a", "aac",       # Кодек для аудио
             
-            "-map", "0:v:0",     # Берем видео из входа 0
             "-map", "1:a:0",     # Берем аудио из входа 1
             
             "-shortest",         # Заканчиваем, когда самый короткий поток (аудио) закончится
@@ -341,78 +1104,394 @@ class VideoPipeline:
             "-y"                 # Перезаписывать без вопроса
         ]
 
+    # --- ШАГ 3 (без перекодирования): МЯГКИЕ СУБТИТРЫ ---
+
+    @staticmethod
+    def _check_subtitle_mode(mode: str) -> str:
+        if mode not in SUBTITLE_MODES:
+            logger.warning(f"Неизвестный режим субтитров {mode}, использую burn")
+            return "burn"
+        return mode
+
+    def _resolve_subtitle_mode(self, subtitle_mode: str | None) -> str:
+        """Режим задачи (выбор пользователя) или режим из конфигурации."""
+        return self._check_subtitle_mode(subtitle_mode) if subtitle_mode else self.subtitle_mode
+
+    def _video_codec_cmd(self, video_path: str) -> list[str]:
+        return [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name",
+            "-of", "csv=p=0",
+            video_path
+        ]
+
+    def _probe_video_codec(self, video_path: str) -> str | None:
         try:
-            logger.info("Начинаю сборку видео с субтитрами...")
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            logging.info("Видео успешно собрано: %s", final_path)
+            return run_cmd(self._video_codec_cmd(video_path)).stdout.strip() or None
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Не удалось определить кодек видео {video_path}: {e.stderr}")
+            return None
+
+    def _soft_compatible(self, codec: str | None) -> bool:
+        if codec in SOFT_SUBTITLE_CODECS:
             return True
+        logger.info(f"Кодек {codec} нельзя скопировать в mp4, субтитры будут вжиты")
+        return False
+
+    def _soft_subtitles_cmd(self, audio_path: str, video_path: str, final_path: str, srt_path: str,
+                            codec: str) -> list[str]:
+        """Команда ffmpeg: видео копируется, звук — новый, SRT — дорожка mov_text."""
+        audio_input, audio_filter = self._audio_input_args(audio_path)
+        # -shortest учитывает и дорожку субтитров: ролик обрезался бы по концу последней реплики.
+        # Поэтому режем по длине озвучки, а -shortest — только если она неизвестна
+        audio_duration = self._audio_duration_hint(audio_path)
+        length_args = ["-t", f"{audio_duration:.6f}"] if audio_duration else ["-shortest"]
+        return [
+            "ffmpeg",
+            "-i", video_path,    # Вход 0: Видео
+            *audio_input,        # Вход 1: Аудио (файл или список фрагментов)
+            "-i", srt_path,      # Вход 2: Субтитры
+            *audio_filter,
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-map", "2:s:0",
+            "-c:v", "copy",      # Без перекодирования
+            *SOFT_SUBTITLE_CODECS[codec],
+            "-c:a", "aac",
+            "-c:s", "mov_text",  # Единственный формат текстовых субтитров в mp4
+            "-metadata:s:s:0", "language=rus",
+            "-disposition:s:0", "default", # Плеер покажет дорожку сразу
+            "-movflags", "+faststart",
+            *length_args,
+            final_path,
+            "-y"
+        ]
+
+    def _subtitles_filter(self, srt_path: str) -> str:
+        """Фильтр libass для SUBTITLE_RENDERER=libass (и запасного пути, если картинки не отрисовались)."""
+        # Экранирование пути для Windows (если вдруг понадобится)
+        # В Linux/Docker это не обязательно, но и не мешает
+        srt_path_escaped = srt_path.replace(':', '\\\\:')
+        return f"subtitles={srt_path_escaped}:force_style='{SUBTITLE_STYLE}'"
+
+    # --- ШАГ 3 (длинные видео): СЕГМЕНТНАЯ СБОРКА ---
+
+    # Сдвиг точки входа перед ключевым кадром: pts_time в выводе ffprobe округлён,
+    # и без запаса точный поиск мог бы пропустить сам ключевой кадр
+    SEGMENT_SEEK_EPSILON = 0.001
+
+    def _keyframes_cmd(self, video_path: str) -> list[str]:
+        """ffprobe по пакетам (без декодирования): время и флаги каждого видеопакета."""
+        return [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            video_path
+        ]
+
+    @staticmethod
+    def _parse_keyframes(output: str) -> list[float]:
+        keyframes = []
+        for line in output.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                keyframes.append(float(pts_time))
+        return sorted(keyframes)
+
+    def _audio_duration_hint(self, audio_path: str) -> float | None:
+        """Длина озвучки без ffprobe: сумма duration из ffconcat-списка или разбор mp3 в памяти."""
+        try:
+            if audio_path.endswith(".ffconcat"):
+                with open(audio_path, encoding="utf-8") as f:
+                    return sum(float(line.split()[1]) for line in f if line.startswith("duration "))
+            with open(audio_path, "rb") as f:
+                return get_mp3_duration(f.read())
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _segment_limit(self, video_duration: float, audio_path: str) -> float:
+        """До какого момента кодировать видео: -shortest всё равно обрежет его по концу звука."""
+        audio_duration = self._audio_duration_hint(audio_path)
+        if not audio_duration:
+            return video_duration
+        return min(video_duration, audio_duration + 1.0) # Запас на округления
+
+    def _plan_segments(self, keyframes: list[float], limit: float) -> list[tuple[float, float]]:
+        """
+        Делит [0, limit) на куски примерно по segment_seconds,
+        каждый кусок начинается с ключевого кадра (кроме первого — он с нуля).
+        """
+        boundaries = [0.0]
+        for keyframe in keyframes:
+            if keyframe >= limit:
+                break
+            if keyframe - boundaries[-1] >= self.segment_seconds:
+                boundaries.append(keyframe)
+        # Слишком короткий хвост присоединяем к предыдущему куску
+        if len(boundaries) > 1 and limit - boundaries[-1] < self.segment_seconds / 2:
+            boundaries.pop()
+        return list(zip(boundaries, boundaries[1:] + [limit]))
+
+    def _segments_for(self, video_duration: float, keyframes_output: str | None,
+                      audio_path: str) -> list[tuple[float, float]] | None:
+        if keyframes_output is None:
+            return None
+        segments = self._plan_segments(
+            self._parse_keyframes(keyframes_output), self._segment_limit(video_duration, audio_path)
+        )
+        if len(segments) < 2:
+            return None
+        logger.info(f"Сегментная сборка: {len(segments)} кусков по ~{self.segment_seconds:.0f} с")
+        return segments
+
+    def _wants_segments(self, video_duration: float) -> bool:
+        return 0 < self.segment_render_min_seconds <= video_duration
+
+    def _plan_render_segments(self, video_path: str, audio_path: str) -> list[tuple[float, float]] | None:
+        """Куски для сегментной сборки или None, если видео короче порога (или режим выключен)."""
+        if self.segment_render_min_seconds <= 0:
+            return None
+        video_duration = self._get_audio_duration(video_path) # ffprobe format=duration
+        if not self._wants_segments(video_duration):
+            return None
+        try:
+            output = run_cmd(self._keyframes_cmd(video_path)).stdout
         except subprocess.CalledProcessError as e:
-            logger.error(f"Ошибка FFmpeg при сборке видео: {e.stderr}")
-            return False
+            logger.warning(f"Не удалось найти ключевые кадры, собираю одним проходом: {e.stderr}")
+            return None
+        return self._segments_for(video_duration, output, audio_path)
+
+    @staticmethod
+    def _parse_srt_time(value: str) -> float:
+        hours, minutes, rest = value.strip().split(":")
+        seconds, millis = rest.split(",")
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+    def _read_srt(self, srt_path: str) -> list[tuple[float, float, str]]:
+        """Реплики SRT как (начало, конец, текст)."""
+        with open(srt_path, encoding="utf-8") as f:
+            blocks = f.read().strip().split("\n\n")
+        cues = []
+        for block in blocks:
+            lines = block.strip().splitlines()
+            if len(lines) < 3 or "-->" not in lines[1]:
+                continue
+            start, end = lines[1].split("-->")
+            cues.append((self._parse_srt_time(start), self._parse_srt_time(end), "\n".join(lines[2:])))
+        return cues
+
+    def _write_srt_slice(self, cues: list[tuple[float, float, str]], start: float, end: float, path: str) -> int:
+        """SRT для куска [start, end): реплики обрезаны по границам и сдвинуты к нулю. Возвращает их число."""
+        with open(path, "w", encoding="utf-8") as f:
+            index = 1
+            for cue_start, cue_end, text in cues:
+                if cue_end <= start or cue_start >= end:
+                    continue
+                f.write(f"{index}\n")
+                f.write(
+                    f"{self._format_srt_time(max(cue_start, start) - start)} --> "
+                    f"{self._format_srt_time(min(cue_end, end) - start)}\n"
+                )
+                f.write(f"{text}\n\n")
+                index += 1
+        return index - 1
+
+    def _segment_jobs(self, video_path: str, srt_path: str, segments: list[tuple[float, float]],
+                      workdir: str, images: list[CueImage] | None = None) -> list[tuple[list[str], str]]:
+        """
+        Команды кодирования кусков и пути результатов. Картинки реплик (images) делятся
+        между кусками; без них в workdir пишутся SRT-срезы для libass.
+        """
+        cues = self._read_srt(srt_path) if images is None else None
+        jobs = []
+        for i, (start, end) in enumerate(segments):
+            # Вход ищем чуть раньше ключевого кадра: кадр start попадает в кусок, кадр end — уже нет
+            seek = max(start - self.SEGMENT_SEEK_EPSILON, 0.0)
+            slice_path = os.path.join(workdir, f"segment_{i}.srt")
+            output_path = os.path.join(workdir, f"segment_{i}.mp4")
+            # Время в куске отсчитывается от точки входа — от неё и сдвигаем субтитры
+            if images is None:
+                if self._write_srt_slice(cues, seek, seek + (end - start), slice_path):
+                    image_inputs, video_args = self._burn_subtitles_args(slice_path, None, first_input=1)
+                else:
+                    # Кусок без реплик: пустой SRT фильтр subtitles не открывает
+                    image_inputs, video_args = [], ["-map", "0:v:0"]
+            else:
+                image_inputs, video_args = self._burn_subtitles_args(
+                    slice_path, shift_cue_images(images, seek, seek + (end - start)), first_input=1,
+                    list_path=os.path.join(workdir, f"segment_{i}_cues.ffconcat")
+                )
+            jobs.append(([
+                "ffmpeg",
+                "-ss", f"{seek:.6f}",
+                "-i", video_path,
+                *image_inputs,       # Картинки реплик этого куска (ffconcat-список)
+                "-t", f"{end - start:.6f}",
+                *video_args,
+                "-c:v", "libx264",   # Те же параметры, что у сборки одним проходом
+                "-crf", "23",
+                "-preset", "fast",
+                "-an",
+                output_path,
+                "-y"
+            ], output_path))
+        return jobs
+
+    def _segments_mux_cmd(self, list_path: str, audio_path: str, final_path: str) -> list[str]:
+        """Склейка кусков без перекодирования (concat + copy) и добавление звука."""
+        audio_input, audio_filter = self._audio_input_args(audio_path)
+        return [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,     # Вход 0: куски видео
+            *audio_input,        # Вход 1: Аудио
+            *audio_filter,
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-shortest",
+            final_path,
+            "-y"
+        ]
+
+    def _write_segments_list(self, outputs: list[str], workdir: str) -> str:
+        list_path = os.path.join(workdir, "segments.ffconcat")
+        with open(list_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for output_path in outputs:
+                f.write(f"file '{os.path.basename(output_path)}'\n")
+        return list_path
+
+    def _segments_workdir(self, srt_path: str) -> str:
+        """Папка под куски — рядом с SRT, то есть в рабочей папке задачи."""
+        workdir = os.path.join(os.path.dirname(srt_path) or ".", f"segments_{uuid.uuid4().hex[:8]}")
+        os.makedirs(workdir, exist_ok=True)
+        return workdir
+
+    @metrics.timed("render_segmented")
+    def _render_segmented(self, audio_path: str, video_path: str, final_path: str, srt_path: str,
+                          segments: list[tuple[float, float]], tracker: ProgressTracker | None = None,
+                          images: list[CueImage] | None = None):
+        """
+        Сегментная сборка: куски кодируются параллельно (число одновременных ffmpeg
+        ограничивает EncodeScheduler), затем склеиваются copy-режимом, и добавляется звук.
+        Бросает CalledProcessError, если какой-то ffmpeg упал.
+        """
+        workdir = self._segments_workdir(srt_path)
+        try:
+            jobs = self._segment_jobs(video_path, srt_path, segments, workdir, images)
+            with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="segment") as executor:
+                # result() пробрасывает ошибку любого куска
+                futures = [
+                    executor.submit(self._run_encode, cmd, tracker.part(f"segment_{i}") if tracker else None)
+                    for i, (cmd, _) in enumerate(jobs)
+                ]
+                for future in futures:
+                    future.result()
+            list_path = self._write_segments_list([output for _, output in jobs], workdir)
+            run_cmd(self._segments_mux_cmd(list_path, audio_path, final_path))
         finally:
-            # Очищаем финальные временные файлы
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-                logging.info("Временный аудиофайл удалён: %s", audio_path)
-            if os.path.exists(srt_path):
-                os.remove(srt_path)
-                logging.info("Временный SRT-файл удалён: %s", srt_path)
+            shutil.rmtree(workdir, ignore_errors=True)
 
     # --- ПУБЛИЧНЫЕ МЕТОДЫ-ПАЙПЛАЙНЫ ---
 
+    def estimate_job_bytes(self, input_bytes: int) -> int:
+        """
+        Оценка места под промежуточные файлы задачи: прокси для Gemini,
+        подготовленное видео и результат — каждый не больше нескольких входов.
+        """
+        return input_bytes * 4 + 32 * 1024 * 1024
+
+    def result_variant(self, subtitle_mode: str | None = None) -> str:
+        """Настройки, от которых зависит готовый ролик (часть ключа кэша результатов)."""
+        return ":".join([
+            self._resolve_subtitle_mode(subtitle_mode), self.tts_mode,
+            self.VOICE_ID, self.TTS_MODEL_ID, GEMINI_MODEL,
+        ])
+
+    @staticmethod
+    def new_job_id() -> str:
+        """Уникальное имя задачи (вместо секундной метки времени, которая совпадала у параллельных задач)."""
+        return uuid.uuid4().hex[:16]
+
     def run_sync(self, input_video_path: str) -> (str | None, dict | None): #type: ignore
         """
         Выполняет весь пайплайн СИНХРОННО.
+        Промежуточные файлы живут в отдельной рабочей папке задачи.
         """
         logger.info(f"[SYNC] Начинаю обработку видео: {input_video_path}")
-        srt_path = None
-        audio_path = None
+        workspace = None
         try:
+            job_id = self.new_job_id()
+            workspace = self.workspaces.acquire(
+                self.estimate_job_bytes(os.path.getsize(input_video_path)), job_id
+            )
+
             # 1. Текст
-            text_data = self.get_desc_video(input_video_path)
+            text_data = self.get_desc_video(input_video_path, workdir=workspace.path)
             if not text_data or not text_data.get("content"):
                 logger.error(f"[SYNC] Не удалось получить текст.")
                 return None, text_data
+            # Ответ с ошибкой Gemini (пустой title, текст ошибки в content) не озвучиваем
+            if not text_data.get("title"):
+                logger.error(f"[SYNC] Gemini не дал описание: {text_data['content']}")
+                return None, None
             
             # 2. Аудио + SRT (Новый метод)
-            base_filename = str(int(time.time()))
-            audio_path, srt_path = self.generate_audio_and_srt(text_data["content"], base_filename)
+            audio_path, srt_path = self.generate_audio_and_srt(
+                text_data["content"], "voice", workspace.path
+            )
             
             if not audio_path or not srt_path:
                 logger.error("[SYNC] Не удалось сгенерировать аудио и SRT.")
                 return None, text_data
 
             # 3. Видео
-            final_path = f"results/video_{base_filename}.mp4"
+            final_path = f"results/video_{job_id}.mp4"
             created = self.create_video(audio_path, input_video_path, final_path, srt_path)
             
             return (final_path, text_data) if created else (None, text_data)
         
         except Exception as e:
             logger.error(f"[SYNC] Критическая ошибка в пайплайне: {e}", exc_info=True)
-            # Доп. очистка на случай падения
-            if audio_path and os.path.exists(audio_path): os.remove(audio_path)
-            if srt_path and os.path.exists(srt_path): os.remove(srt_path)
             return None, None
+        finally:
+            # Очистка всех промежуточных файлов задачи
+            if workspace:
+                workspace.cleanup()
 
     async def run_async(self, input_video_path: str) -> (str | None, dict | None): #type: ignore
         """
         Выполняет весь пайплайн АСИНХРОННО (в потоках).
+        В staged-режиме подготовка видео идёт параллельно с Gemini и TTS.
         """
         logger.info(f"[ASYNC] Начинаю обработку видео: {input_video_path}")
-        srt_path = None
-        audio_path = None
+        workspace = None
+        prep_task = None
         try:
+            job_id = self.new_job_id()
+            workspace = self.workspaces.acquire(
+                self.estimate_job_bytes(os.path.getsize(input_video_path)), job_id
+            )
+            prep_task = self.start_prepare(input_video_path, workspace.path)
+
             # 1. Текст (в потоке)
-            text_data = await asyncio.to_thread(self.get_desc_video, input_video_path)
+            text_data = await asyncio.to_thread(
+                self.get_desc_video, input_video_path, None, workspace.path
+            )
             if not text_data or not text_data.get("content"):
                 logger.error(f"[ASYNC] Не удалось получить текст.")
                 return None, text_data
             
             # 2. Аудио + SRT (в потоке)
-            base_filename = str(int(time.time()))
             audio_path, srt_path = await asyncio.to_thread(
-                self.generate_audio_and_srt, text_data["content"], base_filename
+                self.generate_audio_and_srt, text_data["content"], "voice", workspace.path
             )
             
             if not audio_path or not srt_path:
@@ -420,18 +1499,21 @@ class VideoPipeline:
                 return None, text_data
 
             # 3. Видео (в потоке)
-            final_path = f"results/video_{base_filename}.mp4"
+            render_input = await self.finish_prepare(prep_task, input_video_path)
+            final_path = f"results/video_{job_id}.mp4"
             created = await asyncio.to_thread(
-                self.create_video, audio_path, input_video_path, final_path, srt_path
+                self.create_video, audio_path, render_input, final_path, srt_path
             )
             
             return (final_path, text_data) if created else (None, text_data)
         
         except Exception as e:
             logger.error(f"[ASYNC] Критическая ошибка в пайплайне: {e}", exc_info=True)
-            if audio_path and os.path.exists(audio_path): os.remove(audio_path)
-            if srt_path and os.path.exists(srt_path): os.remove(srt_path)
             return None, None
+        finally:
+            await self.discard_prepare(prep_task)
+            if workspace:
+                workspace.cleanup()
 
 # --- БЛОК ДЛЯ ТЕСТИРОВАНИЯ ---
 if __name__ == "__main__":
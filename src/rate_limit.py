@@ -0,0 +1,366 @@
+# src/rate_limit.py
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, TypeVar
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ответы, после которых запрос стоит повторить: квота и временные сбои сервера
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Сетевые ошибки SDK (httpx, requests) узнаём по имени класса, чтобы не импортировать их здесь
+_NETWORK_ERRORS = frozenset({"TransportError", "ConnectionError", "Timeout"})
+
+
+def error_status(error: BaseException) -> int | None:
+    """HTTP-код из исключения SDK: ElevenLabs — status_code, google-genai — code."""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_transient(error: BaseException) -> bool:
+    """Стоит ли повторять запрос: 429/5xx или обрыв соединения (4xx — ошибка самого запроса)."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return any(cls.__name__ in _NETWORK_ERRORS for cls in type(error).__mro__)
+
+
+def _parse_seconds(value) -> float | None:
+    """Retry-After в секундах или HTTP-датой; retryDelay Gemini вида "30s"."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(float(value.removesuffix("s")), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Сколько сервер просит подождать: заголовок Retry-After или RetryInfo в теле ошибки Gemini."""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        for key, value in headers.items():
+            if key.lower() == "retry-after":
+                return _parse_seconds(value)
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details")
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            return _parse_seconds(detail["retryDelay"])
+    return None
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов: rate токенов в секунду, не больше burst подряд.
+    Токен берётся "в долг" — reserve сразу возвращает, сколько ждать до его появления,
+    поэтому одно ведро годится и для потоков, и для event loop.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0 # Ограничение выключено
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после failures временных ошибок подряд провайдер считается недоступным
+    на cooldown секунд (или дольше, если так просит Retry-After). Затем пропускается один
+    пробный запрос: успех замыкает цепь, ошибка снова размыкает её.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failures: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self._errors = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.API_BREAKER_STATE.set(0, api=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._open_until == 0.0:
+            return self.CLOSED
+        if time.monotonic() < self._open_until:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def open_for(self) -> float:
+        """Сколько секунд цепь ещё разомкнута (0 — можно пробовать)."""
+        with self._lock:
+            return max(self._open_until - time.monotonic(), 0.0) if self._open_until else 0.0
+
+    def admit(self) -> tuple[float, bool]:
+        """(сколько подождать перед новой проверкой, это пробный запрос)."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return 0.0, False
+            if state == self.OPEN:
+                return self._open_until - time.monotonic(), False
+            if self._probing:
+                # Пробный запрос уже идёт — ждём его результата
+                return min(self.cooldown, 1.0), False
+            self._probing = True
+            metrics.API_BREAKER_STATE.set(1, api=self.name)
+            return 0.0, True
+
+    def success(self):
+        with self._lock:
+            if self._open_until:
+                logger.info(f"{self.name}: провайдер снова отвечает, цепь замкнута")
+            self._errors = 0
+            self._open_until = 0.0
+            self._probing = False
+        metrics.API_BREAKER_STATE.set(0, api=self.name)
+
+    def failure(self, delay: float | None = None):
+        with self._lock:
+            self._errors += 1
+            if not self._probing and self._errors < self.failures:
+                return
+            self._probing = False
+            cooldown = max(self.cooldown, delay or 0.0)
+            self._open_until = time.monotonic() + cooldown
+            logger.warning(f"{self.name}: {self._errors} ошибок подряд, цепь разомкнута на {cooldown:.1f} с")
+        metrics.API_BREAKER_STATE.set(2, api=self.name)
+
+    def release_probe(self):
+        """Пробный запрос прерван без ответа (отмена): следующий запрос станет пробным."""
+        with self._lock:
+            self._probing = False
+
+
+class ProviderLimiter:
+    """
+    Общий для всех задач процесса клиентский лимит одного провайдера API:
+    - ведро токенов (запросов в секунду) и лимит одновременных запросов;
+    - повторы 429/5xx с экспоненциальной задержкой со случайным разбросом,
+      не раньше, чем просит Retry-After (пауза действует на все запросы провайдера);
+    - размыкатель: пока провайдер недоступен, запросы и новые задачи ждут, а не падают.
+    Синхронный (call) и асинхронный (call_async) пути делят ведро, паузу и размыкатель;
+    лимиты одновременных запросов у них свои (семафор потоков и семафор event loop).
+    """
+
+    def __init__(self, name: str, rate: float = 0.0, burst: int = 1, max_in_flight: int = 0,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 breaker_failures: int = 5, breaker_cooldown: float = 30.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, breaker_failures, breaker_cooldown)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._async_slots = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, max_in_flight: int = 0) -> "ProviderLimiter":
+        """Лимитер с настройками из окружения: {prefix}_RPS, {prefix}_BURST и общие API_*."""
+        rate = float(os.getenv(f"{prefix}_RPS", "0"))
+        return cls(
+            name,
+            rate=rate,
+            burst=int(os.getenv(f"{prefix}_BURST", str(max(1, round(rate))))),
+            max_in_flight=max_in_flight,
+            max_retries=int(os.getenv("API_MAX_RETRIES", "4")),
+            backoff_base=float(os.getenv("API_BACKOFF_BASE", "1.0")),
+            backoff_max=float(os.getenv("API_BACKOFF_MAX", "30")),
+            breaker_failures=int(os.getenv("API_BREAKER_FAILURES", "5")),
+            breaker_cooldown=float(os.getenv("API_BREAKER_COOLDOWN", "30")),
+        )
+
+    # --- Допуск запроса ---
+
+    def _blocked_for(self) -> tuple[float, bool]:
+        """(сколько ещё ждать паузы по Retry-After или размыкателя, запрос пробный)."""
+        with self._lock:
+            paused = self._paused_until - time.monotonic()
+        if paused > 0:
+            return paused, False
+        return self.breaker.admit()
+
+    def _throttled(self, seconds: float):
+        metrics.API_THROTTLED_SECONDS.inc(seconds, api=self.name)
+
+    @contextmanager
+    def limit(self):
+        """Слот для одного запроса (без повторов): пауза, размыкатель, лимит параллельности, ведро."""
+        waited = 0.0
+        while True:
+            delay, probe = self._blocked_for()
+            if delay <= 0:
+                break
+            waited += delay
+            time.sleep(delay)
+        try:
+            if self._slots:
+                self._slots.acquire()
+            try:
+                delay = self.bucket.reserve()
+                if delay > 0:
+                    waited += delay
+                    time.sleep(delay)
+                self._throttled(waited)
+                yield
+            finally:
+                if self._slots:
+                    self._slots.release()
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    @asynccontextmanager
+    async def limit_async(self):
+        """Асинхронный аналог limit: ожидание не блокирует event loop."""
+        waited = 0.0
+        while True:
+            delay, probe = self._blocked_for()
+            if delay <= 0:
+                break
+            waited += delay
+            await asyncio.sleep(delay)
+        try:
+            if self._async_slots:
+                await self._async_slots.acquire()
+            try:
+                delay = self.bucket.reserve()
+                if delay > 0:
+                    waited += delay
+                    await asyncio.sleep(delay)
+                self._throttled(waited)
+                yield
+            finally:
+                if self._async_slots:
+                    self._async_slots.release()
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    # --- Повторы ---
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка с полным случайным разбросом (запросы не идут волной)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_delay(self, error: Exception, attempt: int, call: str) -> float | None:
+        """Учитывает ошибку в размыкателе. Задержка до повтора или None, если повторять нельзя."""
+        if not is_transient(error):
+            # Провайдер ответил (400, 401...): он доступен, а запрос повторять бессмысленно
+            self.breaker.success()
+            return None
+
+        status = error_status(error)
+        wait = retry_after(error)
+        self.breaker.failure(wait)
+        if wait is not None and status == 429:
+            # Квота общая: Retry-After останавливает все запросы к провайдеру, а не только этот
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + wait)
+
+        if attempt >= self.max_retries:
+            return None
+        metrics.API_RETRIES.inc(api=self.name, call=call, reason=str(status or "network"))
+        delay = max(wait or 0.0, self._backoff(attempt))
+        logger.warning(
+            f"{self.name}.{call}: {status or type(error).__name__}, "
+            f"повтор {attempt + 1}/{self.max_retries} через {delay:.2f} с"
+        )
+        return delay
+
+    def call(self, fn: Callable[[], T], call: str) -> T:
+        """Выполняет запрос fn с лимитами и повторами. fn должна целиком читать ответ (стримы тоже)."""
+        attempt = 0
+        while True:
+            with self.limit():
+                try:
+                    with metrics.api_call(self.name, call):
+                        result = fn()
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, call)
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker.success()
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], call: str) -> T:
+        """Асинхронный аналог call: fn возвращает новую корутину на каждую попытку."""
+        attempt = 0
+        while True:
+            async with self.limit_async():
+                try:
+                    with metrics.api_call(self.name, call):
+                        result = await fn()
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, call)
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker.success()
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # --- Допуск задач ---
+
+    async def wait_available_async(self):
+        """Ждёт, пока провайдер не перестанет быть недоступным (цепь разомкнута или действует Retry-After)."""
+        while True:
+            with self._lock:
+                paused = self._paused_until - time.monotonic()
+            delay = max(paused, self.breaker.open_for())
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
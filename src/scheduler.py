@@ -0,0 +1,186 @@
+# src/scheduler.py
+
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class JobRejected(Exception):
+    """Задача не принята в очередь (очередь заполнена или превышен лимит пользователя)."""
+
+
+@dataclass
+class Job:
+    user_id: int
+    run: Callable[[], Awaitable[None]]
+    # Вызывается при изменении позиции в очереди (1 — следующая на запуск)
+    on_position: Callable[[int], Awaitable[None]] | None = None
+    # Вызывается, если задача снята из очереди до запуска (отмена или остановка бота)
+    on_cancel: Callable[[], Awaitable[None]] | None = None
+    position: int = 0
+    task: asyncio.Task | None = None
+
+
+class JobScheduler:
+    """
+    Очередь задач между роутером бота и VideoPipeline:
+    - ограниченная очередь и фиксированное число воркеров;
+    - лимит одновременно выполняемых задач на пользователя;
+    - отказ в приёме, если очередь заполнена;
+    - уведомления о позиции в очереди;
+    - отмена задач пользователя (из очереди и уже выполняемых);
+    - gate: воркер не берёт новую задачу, пока он не вернёт управление
+      (например, внешний API недоступен — задачи ждут в очереди, а не падают).
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 20, per_user_limit: int = 1,
+                 gate: Callable[[], Awaitable[None]] | None = None):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.per_user_limit = max(1, per_user_limit)
+        self.gate = gate
+
+        self._pending: list[Job] = []
+        self._running = Counter() # user_id -> число выполняемых задач
+        self._active: list[Job] = []
+        self._cond: asyncio.Condition | None = None
+        self._tasks: list[asyncio.Task] = []
+        # Уведомления о позиции в полёте: ссылка нужна, иначе задачу может собрать GC
+        self._notify_tasks: set[asyncio.Task] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    async def start(self):
+        """Запускает воркеры (вызывать внутри работающего event loop)."""
+        self._cond = asyncio.Condition()
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"job-worker-{n}")
+            for n in range(self.workers)
+        ]
+        logger.info(
+            f"Планировщик запущен: воркеров={self.workers}, очередь={self.max_queue}, "
+            f"лимит на пользователя={self.per_user_limit}"
+        )
+
+    async def stop(self):
+        """Останавливает воркеры: выполняемые задачи отменяются, ожидающие снимаются с очереди."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        notify_tasks, self._notify_tasks = self._notify_tasks, set()
+        for task in notify_tasks:
+            task.cancel()
+        await asyncio.gather(*notify_tasks, return_exceptions=True)
+        dropped, self._pending = self._pending, []
+        for job in dropped:
+            await self._safe_cancel_callback(job)
+
+    async def cancel_user(self, user_id: int) -> int:
+        """Снимает задачи пользователя с очереди и отменяет выполняемые. Возвращает их число."""
+        async with self._cond:
+            dropped = [job for job in self._pending if job.user_id == user_id]
+            for job in dropped:
+                self._pending.remove(job)
+            self._notify_positions()
+            running = [job for job in self._active if job.user_id == user_id and job.task]
+        for job in dropped:
+            await self._safe_cancel_callback(job)
+        for job in running:
+            job.task.cancel()
+        return len(dropped) + len(running)
+
+    async def _safe_cancel_callback(self, job: Job):
+        if not job.on_cancel:
+            return
+        try:
+            await job.on_cancel()
+        except Exception as e:
+            logger.warning(f"Ошибка при отмене задачи из очереди: {e}")
+
+    async def submit(self, user_id: int, run: Callable[[], Awaitable[None]],
+                     on_position: Callable[[int], Awaitable[None]] | None = None,
+                     on_cancel: Callable[[], Awaitable[None]] | None = None) -> Job:
+        """
+        Ставит задачу в очередь. Бросает JobRejected, если места нет.
+        Ошибки внутри run логируются воркером, но лучше обрабатывать их в самой задаче.
+        """
+        async with self._cond:
+            if len(self._pending) >= self.max_queue:
+                raise JobRejected("Очередь заполнена")
+            user_pending = sum(1 for job in self._pending if job.user_id == user_id)
+            # Пользователь не может занять больше своей доли очереди
+            if user_pending >= self.per_user_limit:
+                raise JobRejected("Слишком много видео от пользователя в очереди")
+
+            job = Job(user_id=user_id, run=run, on_position=on_position, on_cancel=on_cancel)
+            self._pending.append(job)
+            self._notify_positions()
+            self._cond.notify_all()
+        return job
+
+    def _next_runnable(self) -> Job | None:
+        """Первая в очереди задача, пользователь которой не исчерпал лимит."""
+        for job in self._pending:
+            if self._running[job.user_id] < self.per_user_limit:
+                return job
+        return None
+
+    def _notify_positions(self):
+        """Пересчитывает позиции и уведомляет задачи, у которых позиция изменилась."""
+        for index, job in enumerate(self._pending, start=1):
+            if job.position != index:
+                job.position = index
+                if job.on_position:
+                    task = asyncio.create_task(self._safe_position_update(job, index))
+                    self._notify_tasks.add(task)
+                    task.add_done_callback(self._notify_tasks.discard)
+
+    async def _safe_position_update(self, job: Job, position: int):
+        # Задача могла уже стартовать или сдвинуться, пока ждали своей очереди в loop
+        if job not in self._pending or job.position != position:
+            return
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить позицию в очереди: {e}")
+
+    async def _worker(self, n: int):
+        while True:
+            if self.gate:
+                await self.gate()
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._next_runnable() is not None)
+                job = self._next_runnable()
+                self._pending.remove(job)
+                self._running[job.user_id] += 1
+                # Отдельная задача, чтобы её можно было отменить, не останавливая воркер
+                job.task = asyncio.create_task(job.run())
+                self._active.append(job)
+                self._notify_positions()
+
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise # Останавливают сам воркер (stop)
+                logger.info(f"Задача пользователя {job.user_id} отменена (воркер {n})")
+            except Exception as e:
+                logger.error(f"Ошибка в задаче воркера {n}: {e}", exc_info=True)
+            finally:
+                async with self._cond:
+                    self._active.remove(job)
+                    self._running[job.user_id] -= 1
+                    if self._running[job.user_id] <= 0:
+                        del self._running[job.user_id]
+                    self._cond.notify_all()
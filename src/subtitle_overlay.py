@@ -0,0 +1,337 @@
+# src/subtitle_overlay.py
+
+import logging
+import os
+import struct
+import subprocess
+import threading
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# Стиль субтитров для libass (force_style): и для вжигания фильтром subtitles, и для отрисовки реплик
+SUBTITLE_STYLE = (
+    "FontName=Arial,FontSize=18,PrimaryColour=&HFFFFFF,"
+    "BorderStyle=3,BackColour=&H80000000,Shadow=0,MarginV=25"
+)
+
+# Имя служебного SRT в папке картинок: ffmpeg запускается из неё, поэтому путь не нужно экранировать
+CUES_SRT_NAME = "cues.srt"
+
+# Прозрачная картинка размера реплик: заполняет паузы в потоке картинок
+BLANK_NAME = "blank.png"
+
+# Окно реплики i в служебном SRT: вокруг кадра t = i с, на котором она рисуется
+_CUE_HALF_WINDOW = 0.4
+
+
+@dataclass
+class CueImage:
+    """Реплика, один раз отрисованная в RGBA-картинку: видна с start по end (с) в точке (x, y)."""
+    start: float
+    end: float
+    path: str
+    x: int
+    y: int
+
+
+def _srt_time(seconds: float) -> str:
+    millis = round(seconds * 1000)
+    return f"{millis // 3_600_000:02}:{millis // 60_000 % 60:02}:{millis // 1000 % 60:02},{millis % 1000:03}"
+
+
+def rasterize_cmd(video_path: str, count: int) -> list[str]:
+    """
+    Команда ffmpeg (запускать из папки с CUES_SRT_NAME): рисует count реплик, по одной
+    на кадр t = 0, 1, 2... с, и выдаёт их в stdout потоком PAM (RGBA без сжатия).
+    Холст — первый кадр самого видео: размер и поворот те же, что при сборке,
+    значит, и кегль с отступами у libass те же.
+    Прозрачность восстанавливается по двум отрисовкам — на чёрном и на белом холсте:
+    libass смешивает цвета линейно, поэтому alpha = 1 - (белый - чёрный),
+    а чёрная отрисовка — это цвет, уже умноженный на alpha.
+    """
+    subtitles = f"subtitles={CUES_SRT_NAME}:force_style='{SUBTITLE_STYLE}'"
+    graph = ";".join([
+        f"[0:v]trim=end_frame=1,format=gbrp,loop=loop={count - 1}:size=1:start=0,setpts=N/TB,split[c0][c1]",
+        f"[c0]lutrgb=r=0:g=0:b=0,{subtitles},split[black][premultiplied]",
+        f"[c1]lutrgb=r=255:g=255:b=255,{subtitles},lutrgb=r=negval:g=negval:b=negval[inverted]",
+        # 255 - белый + чёрный = 255 * alpha
+        "[inverted][black]blend=all_mode=addition,extractplanes=g[alpha]",
+        "[premultiplied][alpha]alphamerge,unpremultiply=inplace=1,format=rgba[out]",
+    ])
+    return [
+        "ffmpeg",
+        "-v", "error",
+        "-t", "1",           # Нужен только первый кадр — остальное видео не декодируем
+        "-i", os.path.abspath(video_path),
+        "-filter_complex", graph,
+        "-map", "[out]",
+        "-fps_mode", "passthrough", # Ровно count кадров, без дублирования под частоту кадров
+        "-f", "image2pipe",
+        "-c:v", "pam",
+        "pipe:1"
+    ]
+
+
+class PamParser:
+    """
+    Пошаговый разбор потока PAM: feed() принимает байты в любой нарезке и возвращает
+    готовые кадры (ширина, высота, RGBA-байты). В буфере — не больше одного кадра.
+    Общий для синхронного чтения из Popen и асинхронного из asyncio-процесса.
+    """
+
+    _MAX_HEADER = 1024
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._size: tuple[int, int] | None = None
+
+    def feed(self, data: bytes) -> list[tuple[int, int, bytes]]:
+        self._buffer += data
+        frames = []
+        while True:
+            if self._size is None:
+                end = self._buffer.find(b"ENDHDR\n")
+                if end < 0:
+                    if len(self._buffer) > self._MAX_HEADER:
+                        raise ValueError(f"Неожиданный заголовок PAM: {bytes(self._buffer[:20])!r}")
+                    return frames
+                self._size = self._parse_header(bytes(self._buffer[:end]))
+                del self._buffer[:end + len(b"ENDHDR\n")]
+            width, height = self._size
+            if len(self._buffer) < width * height * 4:
+                return frames
+            frames.append((width, height, bytes(self._buffer[:width * height * 4])))
+            del self._buffer[:width * height * 4]
+            self._size = None
+
+    def close(self):
+        """Конец потока: остаток в буфере — оборванный заголовок или кадр."""
+        if self._size is not None:
+            raise ValueError("Поток PAM оборвался в кадре")
+        if self._buffer:
+            raise ValueError("Поток PAM оборвался в заголовке")
+
+    @staticmethod
+    def _parse_header(header: bytes) -> tuple[int, int]:
+        lines = header.split(b"\n")
+        if lines[0].strip() != b"P7":
+            raise ValueError(f"Неожиданный заголовок PAM: {header[:20]!r}")
+        fields = {}
+        for line in lines[1:]:
+            key, _, value = line.strip().partition(b" ")
+            fields[key] = value
+        if fields.get(b"TUPLTYPE") != b"RGB_ALPHA":
+            raise ValueError(f"Ожидался RGBA, получено {fields.get(b'TUPLTYPE')!r}")
+        return int(fields[b"WIDTH"]), int(fields[b"HEIGHT"])
+
+
+def read_pam_frames(stream: BinaryIO, chunk_size: int = 1 << 20) -> Iterator[tuple[int, int, bytes]]:
+    """Кадры из потока PAM: (ширина, высота, RGBA-байты)."""
+    parser = PamParser()
+    while chunk := stream.read(chunk_size):
+        yield from parser.feed(chunk)
+    parser.close()
+
+
+def crop_to_alpha(width: int, height: int, rgba: bytes) -> tuple[int, int, int, int, bytes] | None:
+    """
+    Обрезает кадр до непрозрачной области: (x, y, ширина, высота, RGBA-байты) или None,
+    если кадр пуст. Границы чётные — так картинка встаёт точно и на yuv420p.
+    Проверки строк — операции над bytes, без цикла по пикселям.
+    """
+    alpha = rgba[3::4]
+    empty = bytes(width)
+    left, right, top, bottom = width, 0, None, 0
+    for y in range(height):
+        row = alpha[y * width:(y + 1) * width]
+        if row == empty:
+            continue
+        if top is None:
+            top = y
+        bottom = y + 1
+        left = min(left, width - len(row.lstrip(b"\0")))
+        right = max(right, len(row.rstrip(b"\0")))
+    if top is None:
+        return None
+
+    left, top = left - left % 2, top - top % 2
+    right, bottom = min(right + right % 2, width), min(bottom + bottom % 2, height)
+    stride = width * 4
+    cropped = b"".join(
+        rgba[y * stride + left * 4:y * stride + right * 4] for y in range(top, bottom)
+    )
+    return left, top, right - left, bottom - top, cropped
+
+
+def encode_png(width: int, height: int, rgba: bytes) -> bytes:
+    """Минимальный PNG (RGBA, 8 бит, без фильтров строк): zlib из стандартной библиотеки."""
+    stride = width * 4
+    raw = b"".join(b"\0" + rgba[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _pad(width: int, height: int, rgba: bytes, left: int, top: int,
+         canvas_width: int, canvas_height: int) -> bytes:
+    """Кладёт картинку на прозрачный холст canvas_width x canvas_height в точку (left, top)."""
+    row_left = bytes(left * 4)
+    row_right = bytes((canvas_width - left - width) * 4)
+    stride = width * 4
+    return b"".join([
+        bytes(top * canvas_width * 4),
+        *(row_left + rgba[y * stride:(y + 1) * stride] + row_right for y in range(height)),
+        bytes((canvas_height - top - height) * canvas_width * 4),
+    ])
+
+
+class CueImageWriter:
+    """
+    Собирает кадры отрисовки в картинки реплик: обрезает по прозрачности, а в finish()
+    кладёт все реплики на общий холст (объединение их рамок) и пишет PNG в workdir.
+    Общий размер и позиция нужны, чтобы реплики шли одним потоком картинок
+    через один overlay (см. overlay_args). Рядом пишется прозрачный BLANK_NAME для пауз.
+    """
+
+    def __init__(self, cues: list[tuple[float, float, str]], workdir: str):
+        self.cues = cues
+        self.workdir = workdir
+        self._crops: list[tuple[int, tuple[int, int, int, int, bytes]]] = []
+        self._frames = 0
+
+    def add(self, width: int, height: int, rgba: bytes):
+        index, self._frames = self._frames, self._frames + 1
+        if index >= len(self.cues):
+            return
+        cropped = crop_to_alpha(width, height, rgba)
+        if cropped is not None: # Иначе реплика из одних пробелов
+            self._crops.append((index, cropped))
+
+    def finish(self) -> list[CueImage]:
+        if not self._crops:
+            return []
+        left = min(x for _, (x, _, _, _, _) in self._crops)
+        top = min(y for _, (_, y, _, _, _) in self._crops)
+        width = max(x + w for _, (x, _, w, _, _) in self._crops) - left
+        height = max(y + h for _, (_, y, _, h, _) in self._crops) - top
+
+        images = []
+        for index, (x, y, w, h, data) in self._crops:
+            path = os.path.join(self.workdir, f"cue_{index}.png")
+            with open(path, "wb") as f:
+                f.write(encode_png(width, height, _pad(w, h, data, x - left, y - top, width, height)))
+            start, end, _ = self.cues[index]
+            images.append(CueImage(start, end, path, left, top))
+        with open(os.path.join(self.workdir, BLANK_NAME), "wb") as f:
+            f.write(encode_png(width, height, bytes(width * height * 4)))
+        self._crops = []
+        return images
+
+
+def write_cues_srt(cues: list[tuple[float, float, str]], workdir: str):
+    """Служебный SRT для rasterize_cmd: реплика i видна на кадре t = i с."""
+    with open(os.path.join(workdir, CUES_SRT_NAME), "w", encoding="utf-8") as f:
+        for i, (_, _, text) in enumerate(cues):
+            f.write(f"{i + 1}\n")
+            f.write(f"{_srt_time(max(i - _CUE_HALF_WINDOW, 0.0))} --> {_srt_time(i + _CUE_HALF_WINDOW)}\n")
+            f.write(f"{text}\n\n")
+
+
+@metrics.timed("subtitle_raster")
+def render_cue_images(video_path: str, cues: list[tuple[float, float, str]], workdir: str) -> list[CueImage]:
+    """
+    Рисует каждую реплику SRT один раз (тем же libass и стилем, что и при вжигании)
+    и сохраняет PNG в workdir. Бросает CalledProcessError, если ffmpeg упал.
+    Асинхронный аналог (процесс убивается при отмене) — async_pipeline.render_cue_images_async.
+    """
+    if not cues:
+        return []
+    write_cues_srt(cues, workdir)
+    cmd = rasterize_cmd(video_path, len(cues))
+    writer = CueImageWriter(cues, workdir)
+    with metrics.FFMPEG_IN_FLIGHT.track():
+        proc = subprocess.Popen(
+            cmd, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stderr_tail = deque(maxlen=50)
+        reader = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+        reader.start()
+        try:
+            for width, height, rgba in read_pam_frames(proc.stdout):
+                writer.add(width, height, rgba)
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+            reader.join()
+    if returncode != 0:
+        stderr = b"".join(stderr_tail).decode("utf-8", "replace")
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    return writer.finish()
+
+
+def shift_cue_images(images: list[CueImage], start: float, end: float) -> list[CueImage]:
+    """Картинки для куска [start, end): окна обрезаны по границам и сдвинуты к нулю."""
+    return [
+        CueImage(max(image.start, start) - start, min(image.end, end) - start, image.path, image.x, image.y)
+        for image in images
+        if image.end > start and image.start < end
+    ]
+
+
+def _ffconcat_path(path: str) -> str:
+    return "'" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def _ffconcat_entry(path: str, duration: float) -> str:
+    # framerate 1000: метки времени картинки в миллисекундах; по умолчанию у демультиплексора
+    # картинок шаг 1/25 с, и смена реплики съезжала бы на кадр относительно libass
+    return f"file {_ffconcat_path(path)}\noption framerate 1000\nduration {duration:.6f}\n"
+
+
+def write_overlay_list(images: list[CueImage], list_path: str):
+    """
+    ffconcat-список — все реплики одним потоком картинок: картинка держится до начала
+    следующей записи, поэтому паузы между репликами заполняет прозрачный BLANK_NAME.
+    """
+    blank = os.path.join(os.path.dirname(images[0].path), BLANK_NAME)
+    cursor = 0.0
+    with open(list_path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for image in sorted(images, key=lambda image: image.start):
+            start = max(image.start, cursor)
+            if image.end <= start:
+                continue # Окно целиком перекрыто предыдущей репликой
+            if start > cursor:
+                f.write(_ffconcat_entry(blank, start - cursor))
+            f.write(_ffconcat_entry(image.path, image.end - start))
+            cursor = image.end
+        # После последней реплики — прозрачный кадр, иначе overlay держал бы её до конца видео
+        f.write(_ffconcat_entry(blank, 1.0))
+
+
+def overlay_args(images: list[CueImage], first_input: int, list_path: str) -> tuple[list[str], list[str]]:
+    """
+    Аргументы ffmpeg для вжигания картинок в видео входа 0: один вход first_input
+    (ffconcat-список реплик, пишется в list_path) и filter_complex с выходом [v].
+    Один overlay на все реплики, сколько бы их ни было; вне окон реплик он
+    пропускает кадр без смешивания.
+    """
+    if not images:
+        return [], ["-map", "0:v:0"]
+    write_overlay_list(images, list_path)
+    windows = "+".join(f"gte(t,{image.start:.3f})*lt(t,{image.end:.3f})" for image in images)
+    graph = f"[0:v][{first_input}:v]overlay=x={images[0].x}:y={images[0].y}:eof_action=pass:enable='{windows}'[v]"
+    return ["-f", "concat", "-safe", "0", "-i", list_path], ["-filter_complex", graph, "-map", "[v]"]
@@ -0,0 +1,151 @@
+# src/workspace.py
+
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class WorkspaceFull(Exception):
+    """Нет места ни в RAM, ни на диске под рабочую папку задачи."""
+
+
+class Workspace:
+    """
+    Рабочая папка одной задачи. Все промежуточные файлы задачи живут здесь,
+    поэтому одновременные задачи не могут перезаписать файлы друг друга.
+    """
+
+    def __init__(self, manager: "WorkspaceManager", job_id: str, path: str, reserved: int, in_ram: bool):
+        self.manager = manager
+        self.job_id = job_id
+        self.path = path
+        self.reserved = reserved
+        self.in_ram = in_ram
+        self.closed = False
+
+    def file(self, name: str) -> str:
+        """Путь к файлу внутри рабочей папки."""
+        return os.path.join(self.path, name)
+
+    def usage(self) -> int:
+        """Сколько байт фактически занято файлами задачи."""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass # Файл удалили между walk и getsize
+        return total
+
+    def cleanup(self):
+        """Удаляет папку и возвращает резерв менеджеру. Повторный вызов безопасен."""
+        if self.closed:
+            return
+        self.closed = True
+        used = self.usage()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._release(self)
+        logger.info(
+            f"Рабочая папка задачи {self.job_id} удалена "
+            f"(занято {used} из {self.reserved} зарезервированных байт)"
+        )
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+class WorkspaceManager:
+    """
+    Выдаёт задачам отдельные рабочие папки.
+    Предпочитает RAM (tmpfs, например /dev/shm), пока укладывается в ram_budget,
+    иначе — диск в пределах disk_budget. Учитывает зарезервированные байты,
+    чтобы планировщик мог отказать в задаче до того, как закончится место.
+    """
+
+    def __init__(self, ram_root: str | None, disk_root: str, ram_budget: int, disk_budget: int):
+        self.ram_root = ram_root if ram_root and self._usable(ram_root) else None
+        self.disk_root = disk_root
+        self.ram_budget = ram_budget if self.ram_root else 0
+        self.disk_budget = disk_budget
+
+        self.ram_reserved = 0
+        self.disk_reserved = 0
+        self._lock = threading.Lock()
+        os.makedirs(disk_root, exist_ok=True)
+
+    @staticmethod
+    def _usable(root: str) -> bool:
+        """tmpfs-папка существует (или её можно создать) и доступна на запись."""
+        try:
+            os.makedirs(root, exist_ok=True)
+            return os.access(root, os.W_OK)
+        except OSError:
+            return False
+
+    def _fits(self, root: str, reserved: int, budget: int, size: int) -> bool:
+        if reserved + size > budget:
+            return False
+        # Бюджет может быть больше реального свободного места — проверяем и его
+        try:
+            return shutil.disk_usage(root).free >= size
+        except OSError:
+            return False
+
+    def can_admit(self, expected_bytes: int) -> bool:
+        """Хватит ли места под задачу с ожидаемым объёмом файлов."""
+        with self._lock:
+            return self._choose_root(expected_bytes) is not None
+
+    def _choose_root(self, size: int) -> bool | None:
+        """True — RAM, False — диск, None — места нет. Вызывать под _lock."""
+        if self.ram_root and self._fits(self.ram_root, self.ram_reserved, self.ram_budget, size):
+            return True
+        if self._fits(self.disk_root, self.disk_reserved, self.disk_budget, size):
+            return False
+        return None
+
+    def acquire(self, expected_bytes: int, job_id: str | None = None) -> Workspace:
+        """Резервирует место и создаёт рабочую папку. Бросает WorkspaceFull."""
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            in_ram = self._choose_root(expected_bytes)
+            if in_ram is None:
+                raise WorkspaceFull(
+                    f"Нет места под задачу ({expected_bytes} байт): "
+                    f"RAM {self.ram_reserved}/{self.ram_budget}, диск {self.disk_reserved}/{self.disk_budget}"
+                )
+            if in_ram:
+                self.ram_reserved += expected_bytes
+            else:
+                self.disk_reserved += expected_bytes
+
+        root = self.ram_root if in_ram else self.disk_root
+        path = os.path.join(root, f"job_{job_id}")
+        os.makedirs(path, exist_ok=True)
+        logger.info(f"Рабочая папка задачи {job_id}: {path} ({'RAM' if in_ram else 'диск'}, {expected_bytes} байт)")
+        return Workspace(self, job_id, path, expected_bytes, in_ram)
+
+    def _release(self, workspace: Workspace):
+        with self._lock:
+            if workspace.in_ram:
+                self.ram_reserved -= workspace.reserved
+            else:
+                self.disk_reserved -= workspace.reserved
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ram_root": self.ram_root,
+                "ram_reserved": self.ram_reserved,
+                "ram_budget": self.ram_budget,
+                "disk_reserved": self.disk_reserved,
+                "disk_budget": self.disk_budget,
+            }
@@ -0,0 +1,30 @@
+# tests/conftest.py
+
+import pytest
+
+
+@pytest.fixture
+def pipeline_env(tmp_path, monkeypatch):
+    """
+    Окружение пайплайна без внешних сервисов: рабочие папки во временной папке,
+    клиенты API тесты подменяют сами.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMENI_API_KEY", "test")
+    monkeypatch.setenv("ELEVEN_LAB_API", "test")
+    monkeypatch.setenv("WORKSPACE_RAM_ROOT", str(tmp_path / "ram"))
+    monkeypatch.setenv("WORKSPACE_DISK_ROOT", str(tmp_path / "disk"))
+    # Повторы лимитера — без реальных пауз
+    monkeypatch.setenv("API_BACKOFF_BASE", "0")
+
+
+@pytest.fixture
+def pipeline(pipeline_env):
+    from src.pipeline import VideoPipeline
+    return VideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
+
+
+@pytest.fixture
+def async_pipeline(pipeline_env):
+    from src.async_pipeline import AsyncVideoPipeline
+    return AsyncVideoPipeline(tts_cache_max_bytes=0, desc_cache_max_entries=0)
@@ -0,0 +1,93 @@
+# tests/test_aligned_tts.py
+
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+TEXT = "Сегодня мы посмотрим на очень странное видео. Кот прыгает на стол, а собака смотрит на него с удивлением!"
+CHAR_SECONDS = 0.125 # Точно представимо в float: тайминги в SRT без погрешности округления
+
+
+def mp3_frames(count: int) -> bytes:
+    """count пустых фреймов MPEG1 Layer III, 128 кбит/с, 44.1 кГц (по 1152 сэмпла)."""
+    return (b"\xff\xfb\x90\x64" + bytes(413)) * count
+
+
+class FakeTextToSpeech:
+    """Заменяет text_to_speech ElevenLabs: синтетические тайминги по символу на CHAR_SECONDS."""
+
+    def __init__(self, alignment: bool = True, fail_aligned: bool = False):
+        self.alignment = alignment
+        self.fail_aligned = fail_aligned
+        self.aligned_texts = []
+        self.chunk_texts = []
+
+    def convert_with_timestamps(self, text: str, **kwargs):
+        self.aligned_texts.append(text)
+        if self.fail_aligned:
+            raise RuntimeError("with-timestamps недоступен")
+        alignment = SimpleNamespace(
+            characters=list(text),
+            character_start_times_seconds=[i * CHAR_SECONDS for i in range(len(text))],
+            character_end_times_seconds=[(i + 1) * CHAR_SECONDS for i in range(len(text))],
+        ) if self.alignment else None
+        return SimpleNamespace(
+            audio_base_64=base64.b64encode(mp3_frames(10)).decode("ascii"), alignment=alignment
+        )
+
+    def convert(self, text: str, **kwargs):
+        self.chunk_texts.append(text)
+        return iter([mp3_frames(20)])
+
+
+@pytest.fixture
+def aligned_pipeline(pipeline):
+    pipeline.tts_mode = "aligned"
+    pipeline.fused_render = True # Без склейки через ffmpeg: фрагменты уходят в ffconcat-список
+    return pipeline
+
+
+def read_cues(srt_path: str) -> list[tuple[str, str]]:
+    with open(srt_path, encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n")
+    return [tuple(block.splitlines()[1:3]) for block in blocks]
+
+
+def test_cue_boundaries_follow_character_timings(tmp_path, aligned_pipeline):
+    tts = FakeTextToSpeech()
+    aligned_pipeline.elevenlabs_client = SimpleNamespace(text_to_speech=tts)
+
+    audio_path, srt_path = aligned_pipeline.generate_audio_and_srt(TEXT, "voice", str(tmp_path))
+
+    # Один запрос на весь текст, фразы склеены через пробел
+    assert tts.aligned_texts == [
+        "Сегодня мы посмотрим на очень странное видео. Кот прыгает на стол, а собака смотрит на него с удивлением!"
+    ]
+    assert tts.chunk_texts == []
+    assert audio_path.endswith("voice_final.mp3")
+    # Фраза i: от начала её первого символа до конца последнего (символы 0-44, 46-65, 67-104)
+    assert read_cues(srt_path) == [
+        ("00:00:00,000 --> 00:00:05,625", "Сегодня мы посмотрим на очень странное видео."),
+        ("00:00:05,750 --> 00:00:08,250", "Кот прыгает на стол,"),
+        ("00:00:08,375 --> 00:00:13,125", "а собака смотрит на него с удивлением!"),
+    ]
+
+
+@pytest.mark.parametrize("tts", [
+    FakeTextToSpeech(fail_aligned=True), # Ошибка запроса
+    FakeTextToSpeech(alignment=False),   # Ответ без таймингов
+], ids=["error", "no_alignment"])
+def test_falls_back_to_chunks(tmp_path, aligned_pipeline, tts):
+    aligned_pipeline.elevenlabs_client = SimpleNamespace(text_to_speech=tts)
+
+    audio_path, srt_path = aligned_pipeline.generate_audio_and_srt(TEXT, "voice", str(tmp_path))
+
+    assert len(tts.aligned_texts) == 1
+    assert tts.chunk_texts == aligned_pipeline._smart_text_splitter(TEXT)
+    assert audio_path.endswith(".ffconcat")
+    assert not (tmp_path / "voice_final.mp3").exists()
+    # Пофразовые тайминги: 20 фреймов = 0.522 с на фразу и пауза между фразами
+    cues = read_cues(srt_path)
+    assert [text for _, text in cues] == tts.chunk_texts
+    assert cues[0][0] == "00:00:00,000 --> 00:00:00,522"
@@ -0,0 +1,78 @@
+# tests/test_async_pipeline.py
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from tests.test_aligned_tts import mp3_frames
+
+
+class ThreadRecordingCache:
+    """Кэш, который запоминает, из какого потока его вызывали."""
+
+    def __init__(self, hit=None):
+        self.hit = hit
+        self.threads = []
+        self.stored = []
+
+    def get(self, *args, **kwargs):
+        self.threads.append(threading.current_thread())
+        return self.hit
+
+    def put(self, *args, **kwargs):
+        self.threads.append(threading.current_thread())
+        self.stored.append(args)
+
+
+def test_gemini_error_reply_is_not_narrated(tmp_path, async_pipeline):
+    video_path = tmp_path / "in.mp4"
+    video_path.write_bytes(b"video")
+    narrated = []
+
+    async def get_desc_video_async(*args, **kwargs):
+        return {"title": "", "content": "Ошибка обработки: 503 UNAVAILABLE"}
+
+    async def generate_audio_and_srt_async(text, *args):
+        narrated.append(text)
+        return None, None
+
+    async_pipeline.get_desc_video_async = get_desc_video_async
+    async_pipeline.generate_audio_and_srt_async = generate_audio_and_srt_async
+
+    assert asyncio.run(async_pipeline.run_async(str(video_path))) == (None, None)
+    assert narrated == []
+
+
+def test_tts_cache_runs_off_the_event_loop(tmp_path, async_pipeline):
+    async def convert(**kwargs):
+        yield mp3_frames(20)
+
+    async_pipeline.async_elevenlabs_client = SimpleNamespace(text_to_speech=SimpleNamespace(convert=convert))
+    async_pipeline.tts_cache = ThreadRecordingCache()
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        chunk_path, duration = await async_pipeline._synthesize_chunk_async(["Привет."], 0, "voice", str(tmp_path))
+        return loop_thread, chunk_path, duration
+
+    loop_thread, chunk_path, duration = asyncio.run(scenario())
+
+    # Поиск (промах) и запись — по разу, и оба не в потоке event loop
+    assert len(async_pipeline.tts_cache.threads) == 2
+    assert loop_thread not in async_pipeline.tts_cache.threads
+    assert len(async_pipeline.tts_cache.stored) == 1
+    assert duration > 0 and open(chunk_path, "rb").read() == mp3_frames(20)
+
+
+def test_description_hit_by_unique_id_runs_off_the_event_loop(async_pipeline):
+    data = {"title": "Заголовок", "content": "Текст"}
+    async_pipeline.desc_cache = ThreadRecordingCache(hit=data)
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        return loop_thread, await async_pipeline.get_desc_video_async("missing.mp4", file_unique_id="AgADxyz")
+
+    loop_thread, result = asyncio.run(scenario())
+
+    assert result == data
+    assert async_pipeline.desc_cache.threads and loop_thread not in async_pipeline.desc_cache.threads
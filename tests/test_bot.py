@@ -0,0 +1,82 @@
+# tests/test_bot.py
+
+import asyncio
+import importlib
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from src.cache import ResultCache, file_sha256
+from src.journal import JobJournal, JobRecord
+from src.workspace import WorkspaceManager
+
+
+@pytest.fixture
+def bot_module(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123:test")
+    return importlib.import_module("bot")
+
+
+class FakeStatusMessage:
+    def __init__(self):
+        self.texts = []
+        self.videos = []
+
+    async def edit_text(self, text: str):
+        self.texts.append(text)
+
+    async def delete(self):
+        pass
+
+    async def answer_video(self, video, caption=None):
+        self.videos.append(caption)
+
+
+class FakePipeline:
+    """Этапы AsyncVideoPipeline, которые вызывает process_video: Gemini отвечает ошибкой."""
+
+    def __init__(self):
+        self.narrated = []
+
+    def result_variant(self, subtitle_mode):
+        return "burn"
+
+    def start_prepare(self, input_path, workdir, subtitle_mode=None):
+        return None
+
+    async def discard_prepare(self, prep_task):
+        pass
+
+    async def get_desc_video_async(self, *args):
+        return {"title": "", "content": "Ошибка обработки: 429 RESOURCE_EXHAUSTED"}
+
+    async def generate_audio_and_srt_async(self, text, base_filename, workdir):
+        self.narrated.append(text)
+        return None, None
+
+
+def test_gemini_error_reply_is_not_narrated_or_cached(tmp_path, bot_module):
+    pipeline = FakePipeline()
+    workspace = WorkspaceManager(None, str(tmp_path / "work"), ram_budget=0, disk_budget=10**9).acquire(10)
+    with open(workspace.file("input.mp4"), "wb") as f:
+        f.write(b"video")
+    result_cache = ResultCache(str(tmp_path / "results.sqlite3"), ttl=3600, max_entries=10)
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "jobs"))
+    record = JobRecord(job_id="j1", user_id=1, chat_id=1, file_id="f", file_unique_id="u")
+    journal.add(record)
+    status = FakeStatusMessage()
+
+    job_result = asyncio.run(bot_module.process_video(
+        None, pipeline, status, workspace, record, result_cache, journal
+    ))
+
+    # Сбой, который стоит повторить: текст ошибки не озвучен, не сохранён и не закэширован
+    assert job_result == "error"
+    assert pipeline.narrated == []
+    assert status.videos == []
+    assert status.texts[-1] == "Ошибка: Не удалось получить текст из видео. 😢"
+    assert journal.get("j1").text_data is None
+    key = ResultCache.make_key(file_sha256(workspace.file("input.mp4")), "burn")
+    assert result_cache.get(key=key, file_unique_id="u:burn") is None
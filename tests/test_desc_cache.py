@@ -0,0 +1,33 @@
+# tests/test_desc_cache.py
+
+import json
+
+from src import pipeline as pipeline_module
+from src.cache import DescriptionCache
+
+
+def test_file_unique_id_hit_is_scoped_to_model_and_prompt(tmp_path, pipeline, monkeypatch):
+    pipeline.desc_cache = DescriptionCache(str(tmp_path / "descriptions.sqlite3"), ttl=3600, max_entries=10)
+    data = {"title": "Заголовок", "content": "Текст озвучки."}
+
+    _, cache_key = pipeline._desc_cache_lookup("video.mp4", "AgADxyz", content_hash="0" * 64)
+    pipeline._parse_desc_response(json.dumps(data), cache_key, "AgADxyz")
+
+    # Тот же файл в Telegram — ответ из кэша без хэширования видео
+    cached, _ = pipeline._desc_cache_lookup("missing.mp4", "AgADxyz")
+    assert cached == data
+
+    # Сменился промпт: ни по file_unique_id, ни по содержимому старый ответ не отдаётся
+    monkeypatch.setattr(pipeline_module, "DESC_PROMPT", "Новый промпт")
+    cached, new_key = pipeline._desc_cache_lookup("video.mp4", "AgADxyz", content_hash="0" * 64)
+    assert cached is None
+    assert new_key != cache_key
+
+
+def test_error_reply_is_not_cached(tmp_path, pipeline):
+    pipeline.desc_cache = DescriptionCache(str(tmp_path / "descriptions.sqlite3"), ttl=3600, max_entries=10)
+    _, cache_key = pipeline._desc_cache_lookup("video.mp4", "AgADxyz", content_hash="0" * 64)
+
+    pipeline._parse_desc_response(json.dumps({"title": "", "content": ""}), cache_key, "AgADxyz")
+
+    assert pipeline._desc_cache_lookup("video.mp4", "AgADxyz", content_hash="0" * 64)[0] is None
@@ -0,0 +1,112 @@
+# tests/test_encode_scheduler.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.encode_scheduler import EncodeScheduler
+
+
+@pytest.fixture
+def eight_cpus(monkeypatch):
+    monkeypatch.setattr(EncodeScheduler, "_available_cpus", staticmethod(lambda: list(range(8))))
+
+
+def test_budget_from_cores_and_threads(eight_cpus):
+    assert EncodeScheduler(cores=8, threads=4).capacity == 2
+    assert EncodeScheduler(cores=8, threads=3).capacity == 2
+    assert EncodeScheduler(cores=64, threads=2).cores == 8    # Не больше доступных ядер
+    assert EncodeScheduler(cores=2, threads=4).threads == 2   # Потоков не больше ядер
+    assert EncodeScheduler(cores=8, threads=16).capacity == 1
+
+
+def test_pinned_slots_get_disjoint_cpus(eight_cpus):
+    scheduler = EncodeScheduler(cores=8, threads=4, pin_cpus=True)
+
+    with scheduler.slot() as first, scheduler.slot() as second:
+        assert (first.cpus, second.cpus) == ([0, 1, 2, 3], [4, 5, 6, 7])
+        assert first.preexec_fn is not None
+    with scheduler.slot() as again:
+        assert again.cpus == [0, 1, 2, 3] # Ядра вернулись в пул
+    with EncodeScheduler(cores=8, threads=4).slot() as unpinned:
+        assert unpinned.cpus is None and unpinned.preexec_fn is None
+
+
+def test_threads_wait_in_fifo_order(eight_cpus):
+    scheduler = EncodeScheduler(cores=4, threads=4)
+    order = []
+    holder = scheduler.slot()
+    holder.__enter__()
+
+    def encode(name: str):
+        with scheduler.slot():
+            order.append(name)
+
+    threads = []
+    for name in ("a", "b", "c"):
+        threads.append(threading.Thread(target=encode, args=(name,)))
+        threads[-1].start()
+        while scheduler.waiting < len(threads):
+            time.sleep(0.001) # Дожидаемся, пока поток встанет в очередь: порядок постановки фиксирован
+    assert scheduler.active == 1 and not order
+
+    holder.__exit__(None, None, None)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["a", "b", "c"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue(eight_cpus):
+    scheduler = EncodeScheduler(cores=4, threads=4)
+
+    async def scenario():
+        granted = []
+
+        async def encode(name: str, hold: asyncio.Event):
+            async with scheduler.slot_async():
+                granted.append(name)
+                await hold.wait()
+
+        first_hold, hold = asyncio.Event(), asyncio.Event()
+        first = asyncio.create_task(encode("first", first_hold))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(encode("cancelled", hold))
+        last = asyncio.create_task(encode("last", hold))
+        await asyncio.sleep(0.01)
+        assert scheduler.waiting == 2
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 1
+        first_hold.set()
+        hold.set()
+        await asyncio.gather(first, last)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return granted
+
+    assert asyncio.run(scenario()) == ["first", "last"]
+    assert (scheduler.active, scheduler.waiting) == (0, 0)
+
+
+def test_slot_granted_while_cancelling_is_returned(eight_cpus):
+    scheduler = EncodeScheduler(cores=4, threads=4)
+
+    async def scenario():
+        holder = scheduler.slot()
+        holder.__enter__()
+        waiting = asyncio.create_task(scheduler.slot_async().__aenter__())
+        await asyncio.sleep(0.01)
+        # Слот выдаётся в тот же шаг цикла, в котором задачу отменяют
+        holder.__exit__(None, None, None)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert (scheduler.active, scheduler.waiting) == (0, 0)
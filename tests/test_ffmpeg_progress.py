@@ -0,0 +1,80 @@
+# tests/test_ffmpeg_progress.py
+
+import pytest
+
+from src.ffmpeg_progress import ProgressParser, ProgressTracker, RenderProgress, with_progress
+
+BLOCK = """frame=120
+fps=59.5
+stream_0_0_q=28.0
+bitrate=N/A
+total_size=524288
+out_time_us=4000000
+out_time_ms=4000000
+out_time=00:00:04.000000
+dup_frames=0
+drop_frames=0
+speed=1.98x
+progress=continue
+"""
+
+
+def feed_all(parser: ProgressParser, text: str) -> list:
+    return [progress for line in text.splitlines() if (progress := parser.feed(line))]
+
+
+def test_with_progress_is_a_global_option():
+    assert with_progress(["ffmpeg", "-i", "in.mp4", "out.mp4", "-y"]) == [
+        "ffmpeg", "-progress", "pipe:1", "-nostats", "-i", "in.mp4", "out.mp4", "-y"
+    ]
+
+
+def test_parser_emits_one_snapshot_per_block():
+    parser = ProgressParser()
+    first, last = feed_all(parser, BLOCK + BLOCK.replace("out_time_us=4000000", "out_time_us=6500000")
+                                   .replace("progress=continue", "progress=end"))
+    assert (first.out_time, first.fps, first.speed, first.done) == (4.0, 59.5, 1.98, False)
+    assert (last.out_time, last.done) == (6.5, True)
+
+
+def test_parser_handles_na_and_out_time_fallback():
+    parser = ProgressParser()
+    [start] = feed_all(parser, "fps=N/A\nout_time_us=N/A\nout_time=00:01:02.500000\nspeed=N/A\nprogress=continue\n")
+    assert (start.out_time, start.fps, start.speed) == (62.5, 0.0, 0.0)
+    # Отрицательное время в самом начале кодирования
+    [negative] = feed_all(parser, "out_time_us=-577000\nprogress=continue\n")
+    assert negative.out_time == 0.0
+
+
+def test_render_progress_percent_and_eta():
+    progress = RenderProgress(out_time=5.0, total=20.0, elapsed=2.0, fps=60.0)
+    assert progress.speed == 2.5
+    assert progress.percent == 25.0
+    assert progress.eta == 6.0
+    assert RenderProgress(out_time=25.0, total=20.0, elapsed=2.0, fps=0.0).percent == 99.9
+    assert RenderProgress(out_time=5.0, total=None, elapsed=2.0, fps=0.0).eta is None
+    assert RenderProgress(out_time=5.0, total=20.0, elapsed=2.0, fps=0.0, done=True).percent == 100.0
+
+
+def test_tracker_sums_parallel_parts():
+    seen = []
+    tracker = ProgressTracker(total=40.0, callback=seen.append)
+    parser = ProgressParser()
+    [block] = feed_all(parser, BLOCK)
+    tracker.part("segment_0")(block)
+    tracker.part("segment_1")(block)
+    assert seen[-1].out_time == 8.0
+    assert seen[-1].fps == pytest.approx(119.0)
+
+    tracker.reset()
+    assert tracker.snapshot().out_time == 0.0
+    assert tracker.finish().done
+
+
+def test_tracker_survives_broken_callback():
+    def broken(progress):
+        raise RuntimeError("сообщение уже удалено")
+
+    tracker = ProgressTracker(total=10.0, callback=broken)
+    tracker.part("render")(feed_all(ProgressParser(), BLOCK)[0])
+    assert tracker.finish().percent == 100.0
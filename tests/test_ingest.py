@@ -0,0 +1,63 @@
+# tests/test_ingest.py
+
+import asyncio
+import hashlib
+
+from src.ingest import GrowingFile
+
+
+async def collect(growing: GrowingFile, block_size: int) -> bytes:
+    return b"".join([block async for block in growing.follow(block_size)])
+
+
+def test_readers_follow_the_writer(tmp_path):
+    blocks = [bytes([i]) * (1000 + i) for i in range(20)]
+
+    async def scenario():
+        growing = GrowingFile(str(tmp_path / "video.mp4"))
+        # Читатели стартуют раньше, чем появились данные, и с разным размером блока
+        readers = [asyncio.create_task(collect(growing, size)) for size in (64, 4096)]
+        for block in blocks:
+            growing.write(block)
+            await asyncio.sleep(0)
+        growing.close()
+        return growing, await asyncio.gather(*readers)
+
+    growing, results = asyncio.run(scenario())
+
+    expected = b"".join(blocks)
+    assert results == [expected, expected]
+    assert growing.size == len(expected)
+    assert growing.hexdigest() == hashlib.sha256(expected).hexdigest()
+    assert (tmp_path / "video.mp4").read_bytes() == expected
+
+
+def test_reader_waits_for_new_blocks(tmp_path):
+    async def scenario():
+        growing = GrowingFile(str(tmp_path / "video.mp4"))
+        growing.write(b"first")
+        stream = growing.follow()
+        assert await anext(stream) == b"first"
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.05)
+        assert not pending.done() # Файл не закрыт: читатель ждёт, а не завершается
+        growing.write(b"second")
+        assert await asyncio.wait_for(pending, timeout=1) == b"second"
+
+        growing.close()
+        growing.close() # Повторное закрытие безопасно
+        assert [block async for block in stream] == []
+
+    asyncio.run(scenario())
+
+
+def test_late_reader_starts_from_beginning(tmp_path):
+    async def scenario():
+        growing = GrowingFile(str(tmp_path / "video.mp4"))
+        growing.write(b"abc")
+        growing.write(b"def")
+        growing.close()
+        return await collect(growing, 2)
+
+    assert asyncio.run(scenario()) == b"abcdef"
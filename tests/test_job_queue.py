@@ -0,0 +1,99 @@
+# tests/test_job_queue.py
+
+import time
+
+import pytest
+
+from src.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def status(queue: JobQueue, job_id: str):
+    return {job.job_id: job for job in queue.jobs()}[job_id]
+
+
+def expire_leases(queue: JobQueue):
+    queue._conn.execute("UPDATE render_jobs SET lease_expires = ?", (time.time() - 1,))
+
+
+def test_lease_heartbeat_complete(queue):
+    queue.put("a", 1, {"job_dir": "shared/a"})
+    job = queue.lease("w1")
+    assert (job.job_id, job.status, job.attempts, job.payload) == ("a", "leased", 1, {"job_dir": "shared/a"})
+    assert queue.lease("w2") is None # Одна задача — одному воркеру
+
+    assert queue.heartbeat("a", "w1", "render")
+    assert not queue.heartbeat("a", "w2") # Чужая аренда
+    assert queue.complete("a", "w1", {"result_path": "r.mp4"})
+    assert (status(queue, "a").status, status(queue, "a").stage) == ("done", "render")
+    assert status(queue, "a").result == {"result_path": "r.mp4"}
+
+
+def test_expired_lease_moves_to_another_worker(queue):
+    queue.put("a", 1, {})
+    queue.lease("w1")
+    expire_leases(queue)
+
+    job = queue.lease("w2")
+    assert job.job_id == "a" and job.attempts == 2
+    # Старый владелец узнаёт о потере аренды и не может сдать результат
+    assert not queue.heartbeat("a", "w1")
+    assert not queue.complete("a", "w1", {})
+    assert queue.complete("a", "w2", {})
+
+
+def test_attempts_are_limited(queue):
+    queue.put("a", 1, {})
+    queue.lease("w1")
+    expire_leases(queue)
+    queue.lease("w2")
+    expire_leases(queue)
+
+    assert queue.lease("w3") is None
+    assert status(queue, "a").status == "failed"
+    assert status(queue, "a").result == {"error": "попытки исчерпаны"}
+
+
+def test_fail_retries_until_attempts_run_out(queue):
+    queue.put("a", 1, {})
+    queue.lease("w1")
+    assert queue.fail("a", "w1", "ffmpeg упал", retry=True)
+    assert status(queue, "a").status == "queued"
+
+    queue.lease("w1")
+    assert queue.fail("a", "w1", "ffmpeg упал", retry=True)
+    assert status(queue, "a").status == "failed"
+    assert status(queue, "a").result == {"error": "ffmpeg упал"}
+
+
+def test_fail_without_retry(queue):
+    queue.put("a", 1, {})
+    queue.lease("w1")
+    queue.fail("a", "w1", "видео без текста", retry=False)
+    assert status(queue, "a").status == "failed"
+
+
+def test_release_does_not_spend_an_attempt(queue):
+    queue.put("a", 1, {})
+    queue.lease("w1")
+    queue.release("a", "w1")
+    assert status(queue, "a").attempts == 0
+    assert queue.lease("w2").attempts == 1
+
+
+def test_cancel_user_revokes_leases(queue):
+    queue.put("a", 1, {})
+    queue.put("b", 1, {})
+    queue.put("c", 2, {})
+    queue.lease("w1")
+
+    assert sorted(queue.cancel_user(1)) == ["a", "b"]
+    assert not queue.heartbeat("a", "w1")
+    assert queue.depth() == 1
+    assert queue.lease("w1").job_id == "c"
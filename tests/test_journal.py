@@ -0,0 +1,102 @@
+# tests/test_journal.py
+
+import pytest
+
+from src.journal import JobJournal, JobRecord
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.sqlite3"), str(tmp_path / "files"), max_attempts=2)
+    yield journal
+    journal.close()
+
+
+def record(job_id: str = "job-1", **kwargs) -> JobRecord:
+    return JobRecord(job_id=job_id, user_id=1, chat_id=2, file_id="file", file_unique_id="unique", **kwargs)
+
+
+def write(path, content: str) -> str:
+    path.write_text(content)
+    return str(path)
+
+
+def test_stages_are_persisted(tmp_path, journal):
+    journal.add(record(file_size=100, subtitle_mode="soft"))
+    assert journal.get("job-1") == record(file_size=100, subtitle_mode="soft")
+
+    journal.save_text("job-1", {"title": "Заголовок", "content": "Текст"})
+    journal.close()
+
+    reopened = JobJournal(str(tmp_path / "journal.sqlite3"), str(tmp_path / "files"))
+    saved = reopened.get("job-1")
+    assert (saved.stage, saved.text_data) == ("text", {"title": "Заголовок", "content": "Текст"})
+    reopened.close()
+
+
+def test_pending_in_arrival_order(journal):
+    for job_id in ("b", "a", "c"):
+        journal.add(record(job_id))
+    journal.finish("a")
+
+    assert [job.job_id for job in journal.pending()] == ["b", "c"]
+
+
+def test_attempts_are_counted_before_work(journal):
+    journal.add(record())
+
+    assert journal.begin_attempt("job-1") == 1
+    assert journal.can_retry("job-1")
+    assert journal.begin_attempt("job-1") == 2
+    assert not journal.can_retry("job-1")
+    assert journal.begin_attempt("missing") == 0
+    assert not journal.can_retry("missing")
+
+
+def test_audio_round_trip(tmp_path, journal):
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    chunks = [(write(workdir / "voice_0.mp3", "a"), 1.5), (write(workdir / "voice_1.mp3", "b"), 2.0)]
+    list_path = write(workdir / "voice_audio.ffconcat", "ffconcat version 1.0\n")
+    srt_path = write(workdir / "voice.srt", "1\n")
+    journal.add(record())
+    journal.save_audio("job-1", list_path, srt_path, chunks)
+    # create_video удаляет свои входы: журнал должен хранить копии
+    for path in workdir.iterdir():
+        path.unlink()
+
+    restored = journal.restore_audio("job-1", str(workdir))
+
+    assert restored == (list_path, srt_path)
+    assert sorted(path.name for path in workdir.iterdir()) == [
+        "voice.srt", "voice_0.mp3", "voice_1.mp3", "voice_audio.ffconcat"
+    ]
+    assert journal.get("job-1").stage == "audio"
+
+
+def test_restore_without_saved_audio(tmp_path, journal):
+    journal.add(record())
+    assert journal.restore_audio("job-1", str(tmp_path)) is None
+
+
+def test_restore_with_missing_files(tmp_path, journal):
+    audio_path = write(tmp_path / "voice_final.mp3", "a")
+    srt_path = write(tmp_path / "voice.srt", "1\n")
+    journal.add(record())
+    journal.save_audio("job-1", audio_path, srt_path, [(audio_path, 3.0)])
+    (tmp_path / "files" / "job-1" / "voice.srt").unlink()
+
+    assert journal.restore_audio("job-1", str(tmp_path / "files")) is None
+
+
+def test_finish_removes_files(tmp_path, journal):
+    audio_path = write(tmp_path / "voice_final.mp3", "a")
+    srt_path = write(tmp_path / "voice.srt", "1\n")
+    journal.add(record())
+    journal.save_audio("job-1", audio_path, srt_path, [(audio_path, 3.0)])
+    (tmp_path / "files" / "job-1.partial").mkdir() # Остаток прерванного копирования
+
+    journal.finish("job-1")
+
+    assert journal.get("job-1") is None
+    assert list((tmp_path / "files").iterdir()) == []
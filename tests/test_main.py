@@ -0,0 +1,81 @@
+# tests/test_main.py
+
+import json
+import os
+
+from main import Manifest, find_inputs, input_key, output_path_for
+
+
+def entry(path: str, status: str, key: str = "1:1", output: str | None = None) -> dict:
+    return {"input": path, "input_key": key, "status": status, "output": output}
+
+
+def test_manifest_resumes_from_last_line(tmp_path):
+    manifest_path = tmp_path / "batch" / "manifest.jsonl"
+    output = tmp_path / "a.mp4"
+    output.write_bytes(b"video")
+    manifest = Manifest(str(manifest_path))
+    manifest.write(entry("a.mov", "failed"))
+    manifest.write(entry("a.mov", "done", output=str(output)))
+    manifest.write(entry("b.mov", "failed"))
+    manifest.close()
+
+    reopened = Manifest(str(manifest_path))
+
+    # Актуальна последняя строка по входу
+    assert reopened.is_done("a.mov", "1:1")
+    assert not reopened.failed("a.mov")
+    assert reopened.failed("b.mov")
+    # Файл изменился или результата больше нет — обрабатываем заново
+    assert not reopened.is_done("a.mov", "2:2")
+    output.unlink()
+    assert not reopened.is_done("a.mov", "1:1")
+    reopened.close()
+
+
+def test_manifest_survives_torn_write(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    good = json.dumps(entry("a.mov", "failed"))
+    manifest_path.write_text(good + "\n" + '{"input": "b.mov", "sta')
+
+    manifest = Manifest(str(manifest_path))
+    manifest.write(entry("c.mov", "failed"))
+    manifest.close()
+
+    # Оборванная строка пропущена, новая запись к ней не приклеилась
+    lines = manifest_path.read_text().splitlines()
+    assert lines[0] == good and json.loads(lines[-1])["input"] == "c.mov"
+    reopened = Manifest(str(manifest_path))
+    assert set(reopened.entries) == {"a.mov", "c.mov"}
+    reopened.close()
+
+
+def test_find_inputs_walks_dirs_and_globs(tmp_path):
+    for name in ("lib/a.mp4", "lib/nested/b.MOV", "lib/notes.txt", "archive/c.webm", "out/old.mp4"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+
+    found = find_inputs(
+        [str(tmp_path / "lib"), str(tmp_path / "archive" / "*.webm"), str(tmp_path / "**" / "*.mp4")],
+        exclude_dir=str(tmp_path / "out")
+    )
+
+    # Без дублей и без результатов прошлых запусков
+    assert found == [
+        str(tmp_path / "archive" / "c.webm"), str(tmp_path / "lib" / "a.mp4"), str(tmp_path / "lib" / "nested" / "b.MOV")
+    ]
+
+
+def test_input_key_tracks_size_and_mtime(tmp_path):
+    path = tmp_path / "a.mp4"
+    path.write_bytes(b"video")
+    key = input_key(str(path))
+
+    os.utime(path, ns=(0, 123))
+    assert input_key(str(path)) != key
+    assert input_key(str(path)) == "5:123"
+
+
+def test_output_mirrors_input_tree(tmp_path):
+    assert output_path_for("/lib/series/ep1.mov", "/lib", "/out") == os.path.join("/out", "series", "ep1.mp4")
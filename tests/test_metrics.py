@@ -0,0 +1,117 @@
+# tests/test_metrics.py
+
+import asyncio
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src import metrics
+from src.metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_with_labels(registry):
+    counter = Counter("calls_total", "Вызовы", ("api", "status"), registry=registry)
+    counter.inc(api="gemini", status="ok")
+    counter.inc(2.5, api='t"ts', status="error")
+
+    assert counter.value(api="gemini", status="ok") == 1
+    assert registry.render().splitlines() == [
+        "# HELP calls_total Вызовы",
+        "# TYPE calls_total counter",
+        'calls_total{api="gemini",status="ok"} 1',
+        'calls_total{api="t\\"ts",status="error"} 2.5',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc(api="gemini") # Не хватает метки
+
+
+def test_gauge_track_and_function(registry):
+    gauge = Gauge("in_flight", "В работе", registry=registry)
+    with gauge.track():
+        with gauge.track():
+            assert gauge.value() == 2
+    assert gauge.value() == 0
+
+    depth = Gauge("depth", "Очередь", registry=registry)
+    depth.set_function(lambda: 7)
+    assert depth.value() == 7
+    assert "depth 7" in registry.render()
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("seconds", "Длительность", ("stage",), buckets=(1, 5), registry=registry)
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, stage="render")
+
+    samples = registry.render().splitlines()[2:]
+
+    # Граница включается в свою корзину (le — "меньше или равно")
+    assert samples == [
+        'seconds_bucket{stage="render",le="1"} 2',
+        'seconds_bucket{stage="render",le="5"} 3',
+        'seconds_bucket{stage="render",le="+Inf"} 4',
+        'seconds_sum{stage="render"} 14.5',
+        'seconds_count{stage="render"} 4',
+    ]
+
+
+def test_duplicate_names_are_rejected(registry):
+    Counter("jobs_total", "Задачи", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("jobs_total", "Ещё раз", registry=registry)
+
+
+def test_timed_measures_functions_and_coroutines(monkeypatch):
+    observed = []
+    monkeypatch.setattr(metrics.STAGE_SECONDS, "observe", lambda value, **labels: observed.append(labels["stage"]))
+
+    @metrics.timed("sync_stage")
+    def work():
+        return "sync"
+
+    @metrics.timed("async_stage")
+    async def work_async():
+        await asyncio.sleep(0)
+        return "async"
+
+    assert work() == "sync"
+    assert asyncio.run(work_async()) == "async"
+    with pytest.raises(RuntimeError):
+        with metrics.stage("failed_stage"):
+            raise RuntimeError
+    assert observed == ["sync_stage", "async_stage", "failed_stage"]
+
+
+def test_api_call_counts_status(registry, monkeypatch):
+    calls = Counter("api_calls_total", "Вызовы", ("api", "call", "status"), registry=registry)
+    monkeypatch.setattr(metrics, "API_CALLS", calls)
+
+    with metrics.api_call("gemini", "generate"):
+        pass
+    with pytest.raises(TimeoutError):
+        with metrics.api_call("gemini", "generate"):
+            raise TimeoutError
+
+    assert calls.value(api="gemini", call="generate", status="ok") == 1
+    assert calls.value(api="gemini", call="generate", status="error") == 1
+
+
+def test_metrics_endpoint(registry):
+    Counter("jobs_total", "Задачи", registry=registry).inc()
+    server = MetricsServer("127.0.0.1", 0, registry).start()
+    host, port = server.address
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "jobs_total 1" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://{host}:{port}/other")
+        assert error.value.code == 404
+    finally:
+        server.stop()
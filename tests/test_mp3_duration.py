@@ -0,0 +1,119 @@
+# tests/test_mp3_duration.py
+
+import shutil
+import struct
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from src.mp3_duration import _duration_from_vbr_header, _find_first_frame, _skip_id3v2, get_mp3_duration
+
+requires_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")), reason="нужны ffmpeg и ffprobe в PATH"
+)
+
+
+def ffprobe_duration(path) -> float:
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(path)
+    ], check=True, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+
+def make_mp3(path, *encoder_args: str, seconds: float = 2.3, sample_rate: int = 44100) -> bytes:
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-ar", str(sample_rate), "-c:a", "libmp3lame", *encoder_args, str(path)
+    ], check=True)
+    return path.read_bytes()
+
+
+def frame_seconds(data: bytes) -> float:
+    _, header = _find_first_frame(data, _skip_id3v2(data))
+    return header["samples"] / header["sample_rate"]
+
+
+def with_vbri_header(data: bytes) -> bytes:
+    """
+    Вставляет перед аудио служебный фрейм с заголовком VBRI (как у Fraunhofer-кодировщиков):
+    ffmpeg такие не пишет, поэтому собираем из потока без Xing.
+    """
+    pos, header = _find_first_frame(data, _skip_id3v2(data))
+    frames = round(get_mp3_duration(data) * header["sample_rate"] / header["samples"])
+    vbri = bytearray(header["length"])
+    vbri[0:4] = data[pos:pos + 4]
+    # VBRI лежит через 32 байта после заголовка фрейма: версия, задержка, качество, байты, фреймы
+    vbri[36:54] = b"VBRI" + struct.pack(">HHHII", 1, 0, 75, len(data) - pos + len(vbri), frames)
+    return data[:pos] + bytes(vbri) + data[pos:]
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("name, encoder_args", [
+    ("cbr_info", ["-b:a", "128k"]),                     # CBR с заголовком Info
+    ("cbr_frames", ["-b:a", "128k", "-write_xing", "0"]), # CBR без заголовка: проход по фреймам
+    ("vbr_xing", ["-q:a", "4"]),                        # VBR с заголовком Xing
+    ("mono_mpeg2", ["-b:a", "32k", "-ac", "1"]),        # MPEG2 (22 кГц), моно
+])
+def test_matches_ffprobe(tmp_path, name, encoder_args):
+    sample_rate = 22050 if name == "mono_mpeg2" else 44100
+    path = tmp_path / f"{name}.mp3"
+    data = make_mp3(path, *encoder_args, sample_rate=sample_rate)
+
+    duration = get_mp3_duration(data)
+
+    assert duration is not None
+    assert abs(duration - ffprobe_duration(path)) <= frame_seconds(data)
+
+
+@requires_ffmpeg
+def test_vbri_matches_ffprobe(tmp_path):
+    data = with_vbri_header(make_mp3(tmp_path / "plain.mp3", "-q:a", "4", "-write_xing", "0"))
+    path = tmp_path / "vbri.mp3"
+    path.write_bytes(data)
+    pos, header = _find_first_frame(data, _skip_id3v2(data))
+    assert _duration_from_vbr_header(data, pos, header) is not None
+
+    duration = get_mp3_duration(data)
+
+    assert duration is not None
+    assert abs(duration - ffprobe_duration(path)) <= frame_seconds(data)
+
+
+def test_unparseable_bytes():
+    assert get_mp3_duration(b"") is None
+    assert get_mp3_duration(b"\0" * 4096) is None
+    assert get_mp3_duration(b"RIFF" + bytes(1000)) is None
+
+
+@requires_ffmpeg
+def test_synthesize_falls_back_to_ffprobe(tmp_path, pipeline):
+    # WAV с тишиной: ни одного слова синхронизации MPEG, зато ffprobe его читает
+    wav_path = tmp_path / "silence.wav"
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono",
+        "-t", "1.5", str(wav_path)
+    ], check=True)
+    audio = wav_path.read_bytes()
+    assert get_mp3_duration(audio) is None
+
+    requests = []
+
+    def convert(**kwargs):
+        requests.append(kwargs["text"])
+        return iter([audio[:1000], audio[1000:]])
+
+    pipeline.elevenlabs_client = SimpleNamespace(text_to_speech=SimpleNamespace(convert=convert))
+    probed = []
+    real_probe = pipeline._get_audio_duration
+    pipeline._get_audio_duration = lambda path: probed.append(path) or real_probe(path)
+
+    chunk_path, duration = pipeline._synthesize_chunk(["Привет."], 0, "voice", str(tmp_path))
+
+    assert requests == ["Привет."]
+    assert probed == [chunk_path]
+    assert duration == pytest.approx(1.5, abs=0.01)
@@ -0,0 +1,227 @@
+# tests/test_rate_limit.py
+
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import rate_limit
+from src.rate_limit import CircuitBreaker, ProviderLimiter, retry_after
+from src.scheduler import JobScheduler
+
+
+class ScriptedServer:
+    """
+    Локальный HTTP-сервер: отвечает на запросы по сценарию (код, Retry-After),
+    после сценария — 200. Запоминает время каждого запроса.
+    """
+
+    def __init__(self, script: list[tuple[int, str | None]]):
+        self.script = list(script)
+        self.hits: list[float] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.hits.append(time.monotonic())
+                status, wait = server.script.pop(0) if server.script else (200, None)
+                self.send_response(status)
+                if wait is not None:
+                    self.send_header("Retry-After", wait)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/text-to-speech"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def request(self) -> bytes:
+        # urllib.error.HTTPError несёт code и headers — как исключения SDK
+        with urllib.request.urlopen(urllib.request.Request(self.url, data=b"{}")) as response:
+            return response.read()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def make(script):
+        servers.append(ScriptedServer(script))
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def make_limiter(**kwargs) -> ProviderLimiter:
+    options = dict(max_retries=4, backoff_base=0.0, breaker_failures=10, breaker_cooldown=0.2)
+    return ProviderLimiter("test", **{**options, **kwargs})
+
+
+def test_retries_scripted_errors_until_success(server_factory):
+    server = server_factory([(429, None), (503, None), (500, None)])
+
+    assert make_limiter().call(server.request, "convert") == b"ok"
+    assert len(server.hits) == 4
+
+
+def test_honors_retry_after(server_factory):
+    server = server_factory([(429, "0.3")])
+
+    make_limiter().call(server.request, "convert")
+
+    assert server.hits[1] - server.hits[0] >= 0.3
+
+
+def test_retry_after_pauses_other_requests(server_factory):
+    server = server_factory([(429, "0.4")])
+    limiter = make_limiter(max_retries=0)
+    with pytest.raises(urllib.error.HTTPError):
+        limiter.call(server.request, "convert")
+    failed = time.monotonic()
+
+    # Квота общая: пока действует Retry-After, ждёт и запрос, который 429 не получал
+    with limiter.limit():
+        admitted = time.monotonic()
+
+    assert admitted - failed >= 0.35
+
+
+def test_client_errors_are_not_retried(server_factory):
+    server = server_factory([(400, None)])
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        make_limiter().call(server.request, "convert")
+
+    assert error.value.code == 400
+    assert len(server.hits) == 1
+
+
+def test_gives_up_after_max_retries(server_factory):
+    server = server_factory([(503, None)] * 5)
+
+    with pytest.raises(urllib.error.HTTPError):
+        make_limiter(max_retries=2).call(server.request, "convert")
+
+    assert len(server.hits) == 3
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    limiter = make_limiter(backoff_base=0.5, backoff_max=3.0)
+    ranges = []
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: ranges.append((low, high)) or high)
+
+    delays = [limiter._backoff(attempt) for attempt in range(6)]
+
+    # Полный разброс от нуля до экспоненты, но не выше backoff_max
+    assert ranges == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 3.0), (0, 3.0), (0, 3.0)]
+    assert delays == [0.5, 1.0, 2.0, 3.0, 3.0, 3.0]
+
+
+def test_backoff_samples_stay_in_bounds():
+    limiter = make_limiter(backoff_base=0.1, backoff_max=1.0)
+    for attempt in range(8):
+        samples = [limiter._backoff(attempt) for _ in range(200)]
+        cap = min(1.0, 0.1 * 2 ** attempt)
+        assert all(0 <= sample <= cap for sample in samples)
+        assert max(samples) > cap / 2 # Разброс, а не одно значение
+
+
+def test_retry_after_formats():
+    class Error(Exception):
+        def __init__(self, headers=None, details=None):
+            self.headers = headers
+            self.details = details
+
+    assert retry_after(Error({"retry-after": "7"})) == 7.0
+    assert retry_after(Error(details={"error": {"details": [{"retryDelay": "12s"}]}})) == 12.0
+    assert retry_after(Error()) is None
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failures=2, cooldown=0.2)
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    delay, probe = breaker.admit()
+    assert 0 < delay <= 0.2 and not probe
+
+    time.sleep(0.25)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.admit() == (0.0, True)        # Один пробный запрос
+    assert breaker.admit()[1] is False           # Остальные ждут его результата
+
+    breaker.failure()                            # Проба не удалась — снова разомкнута
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.25)
+    assert breaker.admit() == (0.0, True)
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.admit() == (0.0, False)
+
+
+def test_breaker_cooldown_honors_retry_after():
+    breaker = CircuitBreaker("test", failures=1, cooldown=0.1)
+    breaker.failure(delay=5.0)
+    assert breaker.open_for() > 4.0
+
+
+def test_open_breaker_makes_new_jobs_wait_not_fail(server_factory):
+    server = server_factory([(503, None)] * 2)
+
+    async def scenario():
+        limiter = make_limiter(max_retries=1, breaker_failures=2, breaker_cooldown=0.5)
+        with pytest.raises(urllib.error.HTTPError):
+            await limiter.call_async(lambda: asyncio.to_thread(server.request), "convert")
+        assert limiter.breaker.state == CircuitBreaker.OPEN
+
+        scheduler = JobScheduler(workers=1, gate=limiter.wait_available_async)
+        await scheduler.start()
+        started = asyncio.Event()
+        results = []
+        opened = time.monotonic()
+
+        async def job():
+            started.set()
+            results.append(await limiter.call_async(lambda: asyncio.to_thread(server.request), "convert"))
+
+        await scheduler.submit(1, job)
+        await asyncio.sleep(0.2)
+        # Цепь разомкнута: задача стоит в очереди, воркер её не взял
+        assert not started.is_set() and scheduler.queue_depth == 1
+
+        await asyncio.wait_for(started.wait(), timeout=2)
+        assert time.monotonic() - opened >= 0.4
+        while scheduler.running:
+            await asyncio.sleep(0.01)
+        assert results == [b"ok"] # Задача дождалась провайдера и выполнилась
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert len(server.hits) == 3 # Две ошибки и пробный запрос, который прошёл
+
+
+def test_pipeline_waits_for_both_providers(async_pipeline):
+    async def scenario():
+        async_pipeline.tts_limiter.breaker.cooldown = 0.3
+        async_pipeline.tts_limiter.breaker.failures = 1
+        async_pipeline.tts_limiter.breaker.failure()
+        started = time.monotonic()
+        await asyncio.wait_for(async_pipeline.wait_providers_async(), timeout=2)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.25
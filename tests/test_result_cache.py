@@ -0,0 +1,112 @@
+# tests/test_result_cache.py
+
+import pytest
+
+from src import cache as cache_module
+from src.cache import ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs) -> ResultCache:
+    options = dict(ttl=100.0, max_entries=10, artifacts_dir=str(tmp_path / "artifacts"), max_artifact_bytes=0)
+    return ResultCache(str(tmp_path / "results.sqlite3"), **{**options, **kwargs})
+
+
+def video(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.write_bytes(bytes(size))
+    return str(path)
+
+
+def test_key_depends_on_variant():
+    assert ResultCache.make_key("hash", "soft") != ResultCache.make_key("hash", "burn")
+    assert ResultCache.make_key("hash", "soft") == ResultCache.make_key("hash", "soft")
+
+
+def test_lookup_by_key_and_file_unique_id(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.put("key", "file-id", "Подпись", file_unique_id="AgADxyz")
+
+    expected = {"key": "key", "file_id": "file-id", "caption": "Подпись", "artifact_path": None}
+    assert cache.get(file_unique_id="AgADxyz") == expected
+    assert cache.get("key") == expected
+    # Промах только по file_unique_id промахом не считается: дальше ищут по содержимому
+    assert cache.get(file_unique_id="other") is None
+    assert cache.get("other") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_expired_entries_are_dropped(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.put("key", "file-id", None)
+
+    clock.now += 101
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_by_max_entries(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, f"id-{key}", None)
+        clock.now += 1
+    cache.get("a") # "b" теперь дольше всех без обращений
+    clock.now += 1
+
+    cache.put("c", "id-c", None)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_artifacts_are_moved_and_trimmed_without_losing_file_id(tmp_path, clock):
+    cache = make_cache(tmp_path, max_artifact_bytes=150)
+    first = video(tmp_path, "first.mp4", 100)
+    cache.put("a", "id-a", None, artifact_src=first)
+    clock.now += 1
+
+    cache.put("b", "id-b", None, artifact_src=video(tmp_path, "second.mp4", 100))
+
+    a, b = cache.get("a"), cache.get("b")
+    # Файлы сверх бюджета вытесняются по LRU, сама запись и её file_id остаются
+    assert a == {"key": "a", "file_id": "id-a", "caption": None, "artifact_path": None}
+    assert b["artifact_path"] == str(tmp_path / "artifacts" / "b.mp4")
+    assert sorted(path.name for path in (tmp_path / "artifacts").iterdir()) == ["b.mp4"]
+    assert cache.stats()["artifact_bytes"] == 100
+
+
+def test_oversized_artifact_is_not_kept(tmp_path, clock):
+    cache = make_cache(tmp_path, max_artifact_bytes=50)
+    source = video(tmp_path, "big.mp4", 100)
+
+    cache.put("a", "id-a", None, artifact_src=source)
+
+    assert cache.get("a")["artifact_path"] is None
+    assert (tmp_path / "big.mp4").exists() # Не перенесён: его удалит сама задача
+
+
+def test_update_and_invalidate(tmp_path, clock):
+    cache = make_cache(tmp_path, max_artifact_bytes=1000)
+    cache.put("a", "old-id", None, artifact_src=video(tmp_path, "a.mp4", 10))
+
+    cache.update_file_id("a", "new-id")
+    assert cache.get("a")["file_id"] == "new-id"
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert list((tmp_path / "artifacts").iterdir()) == []
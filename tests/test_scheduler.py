@@ -0,0 +1,80 @@
+# tests/test_scheduler.py
+
+import asyncio
+
+import pytest
+
+from src.scheduler import JobRejected, JobScheduler
+
+
+async def wait_until(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнилось"
+        await asyncio.sleep(0.01)
+
+
+def test_position_updates_are_tracked_and_delivered():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, max_queue=5, per_user_limit=5)
+        await scheduler.start()
+        release = asyncio.Event()
+        positions = {}
+
+        def on_position(name):
+            async def notify(position: int):
+                positions.setdefault(name, []).append(position)
+            return notify
+
+        await scheduler.submit(1, release.wait)
+        await wait_until(lambda: scheduler.running == 1)
+        await scheduler.submit(1, release.wait, on_position=on_position("a"))
+        await scheduler.submit(1, release.wait, on_position=on_position("b"))
+        # Пока уведомления в полёте, планировщик держит на них ссылки
+        assert scheduler._notify_tasks
+        await wait_until(lambda: not scheduler._notify_tasks)
+        assert positions == {"a": [1], "b": [2]}
+
+        release.set()
+        await wait_until(lambda: scheduler.queue_depth == 0 and scheduler.running == 0)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failing_position_callback_is_logged_not_lost(caplog):
+    async def scenario():
+        scheduler = JobScheduler(workers=1, max_queue=5, per_user_limit=5)
+        await scheduler.start()
+        release = asyncio.Event()
+
+        async def broken(position: int):
+            raise RuntimeError("Telegram недоступен")
+
+        await scheduler.submit(1, release.wait)
+        await wait_until(lambda: scheduler.running == 1)
+        await scheduler.submit(1, release.wait, on_position=broken)
+        await wait_until(lambda: not scheduler._notify_tasks)
+        release.set()
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert "Не удалось обновить позицию в очереди" in caplog.text
+
+
+def test_queue_limits():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, max_queue=2, per_user_limit=1)
+        await scheduler.start()
+        release = asyncio.Event()
+        await scheduler.submit(1, release.wait)
+        await wait_until(lambda: scheduler.running == 1)
+        await scheduler.submit(2, release.wait)
+        with pytest.raises(JobRejected):
+            await scheduler.submit(2, release.wait) # Лимит пользователя
+        await scheduler.submit(3, release.wait)
+        with pytest.raises(JobRejected):
+            await scheduler.submit(4, release.wait) # Очередь заполнена
+        await scheduler.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+# tests/test_segments.py
+
+import shutil
+import subprocess
+
+import pytest
+
+requires_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")), reason="нужны ffmpeg и ffprobe в PATH"
+)
+
+
+@pytest.fixture
+def segmenting(pipeline):
+    pipeline.segment_seconds = 20.0
+    pipeline.segment_render_min_seconds = 90.0
+    return pipeline
+
+
+def keyframes_output(times: list[float]) -> str:
+    """Вывод ffprobe packet=pts_time,flags: ключевой кадр каждые times, между ними обычные."""
+    lines = []
+    for t in times:
+        lines += [f"{t:.6f},K__", f"{t + 0.5:.6f},___"]
+    return "\n".join(lines + ["N/A,K__", ""])
+
+
+def test_parse_keyframes_only_key_packets(segmenting):
+    output = "4.000000,K__\n0.000000,K__\n2.000000,___\nN/A,K__\n,K__\n6.000000,K_D\n"
+    assert segmenting._parse_keyframes(output) == [0.0, 4.0, 6.0]
+
+
+def test_plan_segments_starts_on_keyframes(segmenting):
+    keyframes = [float(t) for t in range(0, 120, 3)]
+
+    assert segmenting._plan_segments(keyframes, 95.0) == [
+        (0.0, 21.0), (21.0, 42.0), (42.0, 63.0), (63.0, 84.0), (84.0, 95.0)
+    ]
+    # Хвост короче половины куска присоединяется к предыдущему
+    assert segmenting._plan_segments(keyframes, 90.0)[-1] == (63.0, 90.0)
+    # Ключевые кадры дальше limit не используются
+    assert segmenting._plan_segments(keyframes, 30.0) == [(0.0, 30.0)]
+
+
+def test_segments_follow_audio_length(tmp_path, segmenting):
+    list_path = tmp_path / "voice_audio.ffconcat"
+    list_path.write_text(
+        "ffconcat version 1.0\nfile 'voice_0.mp3'\nduration 30.000000\nfile 'voice_1.mp3'\nduration 29.000000\n"
+    )
+    output = keyframes_output([float(t) for t in range(0, 180, 2)])
+
+    segments = segmenting._segments_for(180.0, output, str(list_path))
+
+    # -shortest обрежет видео по звуку: кодируем до конца озвучки (+1 с), а не все 180 с
+    assert segments == [(0.0, 20.0), (20.0, 40.0), (40.0, 60.0)]
+    assert segmenting._segments_for(180.0, None, str(list_path)) is None
+    assert segmenting._segments_for(25.0, output, str(list_path)) is None # Всего один кусок
+
+
+def test_srt_slice_shifts_and_clips_cues(tmp_path, segmenting):
+    cues = [(0.5, 2.0, "Первая"), (2.5, 4.5, "Вторая\nв две строки"), (5.0, 6.0, "Третья")]
+    path = tmp_path / "segment_1.srt"
+
+    segmenting._write_srt_slice(cues, 2.0, 5.0, str(path))
+
+    assert segmenting._read_srt(str(path)) == [(0.5, 2.5, "Вторая\nв две строки")]
+
+
+def test_segment_jobs_seek_before_keyframe(tmp_path, segmenting):
+    srt_path = tmp_path / "job.srt"
+    srt_path.write_text("1\n00:00:01,000 --> 00:00:25,000\nРеплика\n\n", encoding="utf-8")
+
+    jobs = segmenting._segment_jobs(
+        "in.mp4", str(srt_path), [(0.0, 20.0), (20.0, 40.0), (40.0, 60.0)], str(tmp_path)
+    )
+
+    (first, first_output), (second, second_output), (third, _) = jobs
+    assert first[first.index("-ss") + 1] == "0.000000"
+    assert second[second.index("-ss") + 1] == "19.999000"
+    assert second[second.index("-t") + 1] == "20.000000"
+    assert (first_output, second_output) == (str(tmp_path / "segment_0.mp4"), str(tmp_path / "segment_1.mp4"))
+    # Реплика, перешедшая через границу, есть в обоих срезах
+    assert segmenting._read_srt(str(tmp_path / "segment_1.srt")) == [(0.0, 5.001, "Реплика")]
+    # В куске без реплик фильтра subtitles нет: пустой SRT он не открывает
+    assert "-vf" in second and "-vf" not in third
+    assert third[third.index("-map") + 1] == "0:v:0"
+
+
+@requires_ffmpeg
+def test_segmented_render_keeps_every_frame(tmp_path, segmenting):
+    video_path, audio_path, srt_path = (str(tmp_path / name) for name in ("in.mp4", "voice.mp3", "job.srt"))
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25:duration=6",
+        "-c:v", "libx264", "-g", "25", "-pix_fmt", "yuv420p", video_path
+    ], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=duration=6", audio_path], check=True)
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write("1\n00:00:00,500 --> 00:00:03,500\nРеплика через границу куска\n\n")
+    segmenting.segment_seconds = 2.0
+    segmenting.segment_render_min_seconds = 5.0
+
+    segments = segmenting._plan_render_segments(video_path, audio_path)
+    assert segments == [(0.0, 2.0), (2.0, 4.0), (4.0, 6.0)]
+    segmented_path = str(tmp_path / "segmented.mp4")
+    segmenting._render_segmented(audio_path, video_path, segmented_path, srt_path, segments)
+
+    count = subprocess.run([
+        "ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+        "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", segmented_path
+    ], check=True, capture_output=True, text=True).stdout.strip()
+    # Ни один кадр не потерян и не задвоен на стыках кусков
+    assert int(count) == 150
+    assert not list(tmp_path.glob("segments_*")) # Папка кусков удалена
@@ -0,0 +1,86 @@
+# tests/test_soft_subtitles.py
+
+import shutil
+import subprocess
+
+import pytest
+
+requires_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")), reason="нужны ffmpeg и ffprobe в PATH"
+)
+
+
+def test_mode_resolution(pipeline):
+    pipeline.subtitle_mode = "burn"
+    assert pipeline._resolve_subtitle_mode(None) == "burn"
+    assert pipeline._resolve_subtitle_mode("soft") == "soft"
+    assert pipeline._resolve_subtitle_mode("karaoke") == "burn" # Неизвестный режим — вжигаем
+
+
+def test_soft_cmd_copies_video(tmp_path, pipeline):
+    audio_path = tmp_path / "voice.mp3"
+    audio_path.write_bytes((b"\xff\xfb\x90\x64" + bytes(413)) * 100) # 100 фреймов по 1152 сэмпла, 44.1 кГц
+
+    cmd = pipeline._soft_subtitles_cmd(str(audio_path), "in.mp4", "out.mp4", "job.srt", "hevc")
+
+    assert cmd[cmd.index("-c:v") + 1] == "copy"
+    assert cmd[cmd.index("-tag:v") + 1] == "hvc1"
+    assert cmd[cmd.index("-c:s") + 1] == "mov_text"
+    assert "-vf" not in cmd and "-filter_complex" not in cmd
+    # Длина — по озвучке: -shortest обрезал бы ролик по концу последней реплики
+    assert cmd[cmd.index("-t") + 1] == "2.612245" and "-shortest" not in cmd
+
+
+def test_soft_cmd_without_audio_length(pipeline):
+    cmd = pipeline._soft_subtitles_cmd("missing.mp3", "in.mp4", "out.mp4", "job.srt", "h264")
+    assert "-shortest" in cmd and "-t" not in cmd
+
+
+def streams(path: str) -> list[tuple[str, str]]:
+    output = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "stream=codec_type,codec_name", "-of", "csv=p=0", path
+    ], check=True, capture_output=True, text=True).stdout
+    return sorted(tuple(line.split(",")) for line in output.split())
+
+
+def video_packets(path: str) -> list[str]:
+    """Размеры и флаги видеопакетов: при копировании они те же, что во входе."""
+    return subprocess.run([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=size,flags", "-of", "csv=p=0", path
+    ], check=True, capture_output=True, text=True).stdout.split()
+
+
+def make_inputs(tmp_path, codec_args: list[str]) -> tuple[str, str, str]:
+    video_path, audio_path, srt_path = (str(tmp_path / name) for name in ("in.mp4", "voice.mp3", "job.srt"))
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25:duration=2",
+        *codec_args, video_path
+    ], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=duration=2", audio_path], check=True)
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write("1\n00:00:00,000 --> 00:00:01,500\nРеплика\n\n")
+    return video_path, audio_path, srt_path
+
+
+@requires_ffmpeg
+def test_h264_gets_subtitle_track_without_reencoding(tmp_path, pipeline):
+    video_path, audio_path, srt_path = make_inputs(tmp_path, ["-c:v", "libx264", "-pix_fmt", "yuv420p"])
+    final_path = str(tmp_path / "out.mp4")
+
+    assert pipeline.create_video(audio_path, video_path, final_path, srt_path, subtitle_mode="soft")
+
+    assert streams(final_path) == [("aac", "audio"), ("h264", "video"), ("mov_text", "subtitle")]
+    # Видео целиком, хотя последняя реплика кончается на 1.5 с
+    assert video_packets(final_path) == video_packets(video_path)
+
+
+@requires_ffmpeg
+def test_incompatible_codec_falls_back_to_burn(tmp_path, pipeline):
+    video_path, audio_path, srt_path = make_inputs(tmp_path, ["-c:v", "mpeg4"])
+    final_path = str(tmp_path / "out.mp4")
+
+    assert pipeline.create_video(audio_path, video_path, final_path, srt_path, subtitle_mode="soft")
+
+    # mpeg4 в mp4 копировать не стали: видео перекодировано, субтитры вжиты
+    assert streams(final_path) == [("aac", "audio"), ("h264", "video")]
@@ -0,0 +1,259 @@
+# tests/test_subtitle_overlay.py
+
+import asyncio
+import io
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+
+import pytest
+
+from src import async_pipeline
+from src.subtitle_overlay import (
+    BLANK_NAME, CueImage, CueImageWriter, PamParser, crop_to_alpha, encode_png, overlay_args,
+    read_pam_frames, shift_cue_images, write_overlay_list
+)
+
+requires_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="нужен ffmpeg в PATH")
+
+
+def pam(width: int, height: int, rgba: bytes, tupltype: bytes = b"RGB_ALPHA") -> bytes:
+    header = f"P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH 4\nMAXVAL 255\n".encode()
+    return header + b"TUPLTYPE " + tupltype + b"\nENDHDR\n" + rgba
+
+
+def canvas(width: int, height: int, box: tuple[int, int, int, int], pixel: bytes = b"\x10\x20\x30\xff") -> bytes:
+    """Прозрачный кадр с непрозрачным прямоугольником box = (x, y, ширина, высота)."""
+    x, y, w, h = box
+    rows = []
+    for row in range(height):
+        line = bytearray(width * 4)
+        if y <= row < y + h:
+            line[x * 4:(x + w) * 4] = pixel * w
+        rows.append(bytes(line))
+    return b"".join(rows)
+
+
+def decode_png(data: bytes) -> tuple[int, int, bytes]:
+    """Разбор PNG из encode_png (без фильтров строк) с проверкой CRC каждого блока."""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        tag, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        (crc,) = struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + body)
+        chunks[tag] = body
+        pos += 12 + length
+    width, height, depth, color = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, color) == (8, 6)
+    raw = zlib.decompress(chunks[b"IDAT"])
+    stride = width * 4 + 1
+    assert all(raw[y * stride] == 0 for y in range(height))
+    return width, height, b"".join(raw[y * stride + 1:(y + 1) * stride] for y in range(height))
+
+
+def test_pam_parser_accepts_any_chunking():
+    first, second = canvas(4, 2, (1, 0, 2, 1)), canvas(2, 3, (0, 1, 1, 1))
+    stream = pam(4, 2, first) + pam(2, 3, second)
+    parser = PamParser()
+
+    frames = [frame for i in range(len(stream)) for frame in parser.feed(stream[i:i + 1])]
+    parser.close()
+
+    assert frames == [(4, 2, first), (2, 3, second)]
+    assert list(read_pam_frames(io.BytesIO(stream), chunk_size=7)) == frames
+
+
+@pytest.mark.parametrize("stream, error", [
+    (pam(4, 2, bytes(31)), "в кадре"),
+    (b"P7\nWIDTH 4\n", "в заголовке"),
+    (b"P6\n4 2\n255\n" + bytes(2048), "заголовок"),
+    (pam(4, 2, bytes(32), tupltype=b"RGB"), "RGBA"),
+])
+def test_pam_parser_rejects_broken_streams(stream, error):
+    with pytest.raises(ValueError, match=error):
+        list(read_pam_frames(io.BytesIO(stream)))
+
+
+def test_crop_to_alpha_aligns_to_even_bounds():
+    rgba = canvas(10, 8, (3, 1, 4, 3))
+
+    x, y, w, h, data = crop_to_alpha(10, 8, rgba)
+
+    # Непрозрачное — столбцы 3-6, строки 1-3: рамка расширена до чётных границ
+    assert (x, y, w, h) == (2, 0, 6, 4)
+    assert data == b"".join(rgba[row * 40 + 8:row * 40 + 32] for row in range(4))
+
+
+def test_crop_to_alpha_keeps_frame_edge():
+    x, y, w, h, _ = crop_to_alpha(5, 3, canvas(5, 3, (4, 2, 1, 1)))
+    assert (x, y, w, h) == (4, 2, 1, 1) # Нечётный край кадра — дальше расширять некуда
+
+
+def test_crop_to_alpha_empty_frame():
+    assert crop_to_alpha(6, 4, bytes(6 * 4 * 4)) is None
+
+
+def test_encode_png_round_trip():
+    rgba = bytes(range(256)) * 3 # 8 x 24 пикселя
+    assert decode_png(encode_png(8, 24, rgba)) == (8, 24, rgba)
+
+
+def test_writer_puts_cues_on_common_canvas(tmp_path):
+    cues = [(0.0, 1.0, "раз"), (1.0, 2.0, "   "), (2.5, 3.0, "три")]
+    writer = CueImageWriter(cues, str(tmp_path))
+    writer.add(12, 10, canvas(12, 10, (2, 6, 4, 2)))
+    writer.add(12, 10, bytes(12 * 10 * 4))         # Реплика из пробелов: картинки нет
+    writer.add(12, 10, canvas(12, 10, (6, 4, 4, 4)))
+    writer.add(12, 10, canvas(12, 10, (0, 0, 2, 2))) # Лишний кадр сверх числа реплик
+
+    images = writer.finish()
+
+    assert [(image.start, image.end, image.x, image.y) for image in images] == [
+        (0.0, 1.0, 2, 4), (2.5, 3.0, 2, 4)
+    ]
+    assert [os.path.basename(image.path) for image in images] == ["cue_0.png", "cue_2.png"]
+    first = decode_png((tmp_path / "cue_0.png").read_bytes())
+    third = decode_png((tmp_path / "cue_2.png").read_bytes())
+    blank = decode_png((tmp_path / BLANK_NAME).read_bytes())
+    # Общая рамка: x 2-10, y 4-8, у всех картинок один размер
+    assert first[:2] == third[:2] == blank[:2] == (8, 4)
+    assert first[2] == canvas(8, 4, (0, 2, 4, 2))
+    assert third[2] == canvas(8, 4, (4, 0, 4, 4))
+    assert blank[2] == bytes(8 * 4 * 4)
+
+
+def test_writer_without_visible_cues(tmp_path):
+    writer = CueImageWriter([(0.0, 1.0, " ")], str(tmp_path))
+    writer.add(4, 4, bytes(64))
+    assert writer.finish() == []
+    assert not (tmp_path / BLANK_NAME).exists()
+
+
+def test_shift_cue_images():
+    images = [CueImage(0.5, 2.0, "a.png", 0, 0), CueImage(2.5, 4.0, "b.png", 0, 0), CueImage(5.0, 6.0, "c.png", 0, 0)]
+
+    shifted = shift_cue_images(images, 1.5, 3.0)
+
+    assert [(image.start, image.end, image.path) for image in shifted] == [(0.0, 0.5, "a.png"), (1.0, 1.5, "b.png")]
+
+
+def read_list(path) -> list[tuple[str, float]]:
+    lines = path.read_text().splitlines()
+    assert lines[0] == "ffconcat version 1.0"
+    entries = []
+    for i in range(1, len(lines), 3):
+        assert lines[i + 1] == "option framerate 1000"
+        entries.append((os.path.basename(lines[i][len("file '"):-1]), float(lines[i + 2].split()[1])))
+    return entries
+
+
+def test_overlay_list_fills_gaps_with_blank(tmp_path):
+    images = [
+        CueImage(1.5, 2.5, str(tmp_path / "cue_1.png"), 0, 0),
+        CueImage(0.0, 1.0, str(tmp_path / "cue_0.png"), 0, 0),
+        CueImage(2.0, 3.0, str(tmp_path / "cue_2.png"), 0, 0), # Наложилась на предыдущую
+        CueImage(2.2, 2.4, str(tmp_path / "cue_3.png"), 0, 0), # Целиком внутри уже показанной
+    ]
+
+    write_overlay_list(images, str(tmp_path / "overlay.ffconcat"))
+
+    assert read_list(tmp_path / "overlay.ffconcat") == [
+        ("cue_0.png", 1.0), (BLANK_NAME, 0.5), ("cue_1.png", 1.0), ("cue_2.png", 0.5), (BLANK_NAME, 1.0)
+    ]
+
+
+def test_overlay_args_single_input_for_all_cues(tmp_path):
+    images = [CueImage(i * 2.0, i * 2.0 + 1.5, str(tmp_path / f"cue_{i}.png"), 120, 1146) for i in range(40)]
+    list_path = str(tmp_path / "overlay.ffconcat")
+
+    inputs, video_args = overlay_args(images, 2, list_path)
+
+    assert inputs == ["-f", "concat", "-safe", "0", "-i", list_path]
+    graph = video_args[video_args.index("-filter_complex") + 1]
+    assert graph.count("overlay=") == 1
+    assert graph.startswith("[0:v][2:v]overlay=x=120:y=1146:")
+    assert "gte(t,78.000)*lt(t,79.500)" in graph
+    assert video_args[-2:] == ["-map", "[v]"]
+    assert len(read_list(tmp_path / "overlay.ffconcat")) == 80
+
+
+def test_overlay_args_without_images(tmp_path):
+    assert overlay_args([], 1, str(tmp_path / "overlay.ffconcat")) == ([], ["-map", "0:v:0"])
+
+
+def test_async_raster_kills_ffmpeg_on_cancel(tmp_path, monkeypatch):
+    # Вместо ffmpeg — процесс, который записывает pid и молчит
+    script = "import os, time; open('pid', 'w').write(str(os.getpid())); time.sleep(60)"
+    monkeypatch.setattr(async_pipeline, "rasterize_cmd", lambda video_path, count: [sys.executable, "-c", script])
+
+    async def scenario():
+        task = asyncio.create_task(
+            async_pipeline.render_cue_images_async("in.mp4", [(0.0, 1.0, "раз")], str(tmp_path))
+        )
+        while not (tmp_path / "pid").exists() or not (tmp_path / "pid").read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int((tmp_path / "pid").read_text()), 0)
+
+
+def test_async_raster_reports_process_error(tmp_path, monkeypatch):
+    script = "import sys; sys.stderr.write('boom\\n'); sys.exit(3)"
+    monkeypatch.setattr(async_pipeline, "rasterize_cmd", lambda video_path, count: [sys.executable, "-c", script])
+
+    with pytest.raises(async_pipeline.ProcessError) as error:
+        asyncio.run(async_pipeline.render_cue_images_async("in.mp4", [(0.0, 1.0, "раз")], str(tmp_path)))
+
+    assert error.value.returncode == 3
+    assert "boom" in error.value.stderr
+
+
+def gray_band(path: str, height: int) -> list[bytes]:
+    """Нижняя половина кадров в оттенках серого — там, где субтитры."""
+    out = subprocess.run([
+        "ffmpeg", "-v", "error", "-i", path,
+        "-vf", f"crop=iw:{height}:0:ih-{height}", "-f", "rawvideo", "-pix_fmt", "gray", "-"
+    ], check=True, capture_output=True).stdout
+    size = 360 * height
+    return [out[i:i + size] for i in range(0, len(out), size)]
+
+
+@requires_ffmpeg
+def test_overlay_matches_libass(tmp_path, async_pipeline):
+    video_path, audio_path, srt_path = (str(tmp_path / name) for name in ("in.mp4", "a.mp3", "job.srt"))
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=360x640:rate=30:duration=3",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", video_path
+    ], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=duration=3", audio_path], check=True)
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write("1\n00:00:00,200 --> 00:00:01,000\nСмотрите внимательно.\n\n")
+        f.write("2\n00:00:01,100 --> 00:00:01,900\nНикто не ожидал, что всё закончится именно так.\n\n")
+        f.write("3\n00:00:02,300 --> 00:00:02,900\nВот.\n\n")
+    async_pipeline.subtitle_renderer = "overlay"
+
+    images = asyncio.run(async_pipeline._render_subtitle_images_async(video_path, srt_path))
+    assert images and len({(image.x, image.y) for image in images}) == 1
+    outputs = {}
+    for name, cue_images in (("libass", None), ("overlay", images)):
+        outputs[name] = str(tmp_path / f"{name}.mp4")
+        subprocess.run(
+            async_pipeline._create_video_cmd(audio_path, video_path, outputs[name], srt_path, cue_images),
+            check=True, capture_output=True
+        )
+
+    libass, overlay = gray_band(outputs["libass"], 320), gray_band(outputs["overlay"], 320)
+    assert len(libass) == len(overlay) == 90
+    for i, (expected, actual) in enumerate(zip(libass, overlay)):
+        # Только шум кодировщика: реплика на каждом кадре та же и сменяется на том же кадре
+        assert sum(abs(a - b) for a, b in zip(expected, actual)) / len(expected) < 1.5, f"кадр {i}"
@@ -0,0 +1,69 @@
+# tests/test_worker.py
+
+import asyncio
+import os
+
+import pytest
+
+import worker
+from src.job_queue import JobQueue
+from src.workspace import WorkspaceManager
+
+
+class FakePipeline:
+    """Этапы AsyncVideoPipeline, которые вызывает render, без Gemini, TTS и ffmpeg."""
+
+    def __init__(self, tmp_path, text_data: dict):
+        self.workspaces = WorkspaceManager(None, str(tmp_path / "work"), ram_budget=0, disk_budget=10**9)
+        self.text_data = text_data
+        self.narrated = []
+
+    def estimate_job_bytes(self, size: int) -> int:
+        return size
+
+    def start_prepare(self, input_path, workdir, subtitle_mode=None):
+        return None
+
+    async def discard_prepare(self, prep_task):
+        pass
+
+    async def get_desc_video_async(self, *args, **kwargs):
+        return self.text_data
+
+    async def generate_audio_and_srt_async(self, text, base_filename, workdir):
+        self.narrated.append(text)
+        return None, None
+
+
+@pytest.fixture
+def queue(tmp_path):
+    job_dir = tmp_path / "shared" / "a"
+    job_dir.mkdir(parents=True)
+    (job_dir / "input.mp4").write_bytes(b"video")
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=60, max_attempts=3)
+    queue.put("a", 1, {"job_dir": str(job_dir)})
+    yield queue
+    queue.close()
+
+
+def test_gemini_error_reply_is_retried_not_rendered(tmp_path, queue):
+    pipeline = FakePipeline(tmp_path, {"title": "", "content": "Ошибка обработки: 503 UNAVAILABLE"})
+    job = queue.lease("w1")
+
+    asyncio.run(worker.run_job(pipeline, queue, job, "w1"))
+
+    assert pipeline.narrated == []
+    [queued] = queue.jobs()
+    assert (queued.status, queued.attempts) == ("queued", 1)
+    assert os.listdir(tmp_path / "work") == [] # Рабочая папка убрана
+
+
+def test_missing_audio_fails_without_retry(tmp_path, queue):
+    pipeline = FakePipeline(tmp_path, {"title": "Заголовок", "content": "Текст."})
+    job = queue.lease("w1")
+
+    asyncio.run(worker.run_job(pipeline, queue, job, "w1"))
+
+    assert pipeline.narrated == ["Текст."]
+    [failed] = queue.jobs()
+    assert (failed.status, failed.result) == ("failed", {"error": "Не удалось сгенерировать аудио"})
@@ -0,0 +1,57 @@
+# tests/test_workspace.py
+
+import os
+
+import pytest
+
+from src.workspace import WorkspaceFull, WorkspaceManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return WorkspaceManager(
+        ram_root=str(tmp_path / "ram"), disk_root=str(tmp_path / "disk"), ram_budget=100, disk_budget=250
+    )
+
+
+def test_prefers_ram_then_spills_to_disk(manager, tmp_path):
+    first = manager.acquire(80, "a")
+    second = manager.acquire(80, "b") # В RAM осталось 20 байт
+    assert first.in_ram and first.path == str(tmp_path / "ram" / "job_a")
+    assert not second.in_ram and second.path == str(tmp_path / "disk" / "job_b")
+    assert os.path.isdir(first.path) and os.path.isdir(second.path)
+    assert manager.stats()["ram_reserved"] == 80
+    assert manager.stats()["disk_reserved"] == 80
+
+
+def test_rejects_when_both_budgets_are_spent(manager):
+    manager.acquire(100)
+    manager.acquire(200)
+    assert not manager.can_admit(60)
+    with pytest.raises(WorkspaceFull):
+        manager.acquire(60)
+    assert manager.can_admit(50) # На диске осталось ровно 50
+
+
+def test_cleanup_returns_reservation_once(manager):
+    workspace = manager.acquire(100)
+    with open(workspace.file("chunk.mp3"), "wb") as f:
+        f.write(b"x" * 10)
+    assert workspace.usage() == 10
+
+    workspace.cleanup()
+    workspace.cleanup() # Повторный вызов не освобождает резерв дважды
+    assert not os.path.exists(workspace.path)
+    assert manager.stats()["ram_reserved"] == 0
+    assert manager.acquire(100).in_ram
+
+
+def test_unusable_ram_root_falls_back_to_disk(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    manager = WorkspaceManager(
+        ram_root=str(blocker / "ram"), disk_root=str(tmp_path / "disk"), ram_budget=100, disk_budget=100
+    )
+    with manager.acquire(50) as workspace:
+        assert not workspace.in_ram
+    assert manager.stats()["disk_reserved"] == 0
@@ -0,0 +1,181 @@
+# worker.py
+"""
+Воркер рендеринга для режима RENDER_MODE=queue: берёт задачи из общей очереди,
+обрабатывает видео (Gemini, ElevenLabs, ffmpeg) и кладёт результат в общее
+хранилище, откуда его отправляет бот. Воркеров можно запустить сколько угодно,
+на любых машинах, которым видны очередь (RENDER_QUEUE_PATH) и хранилище (RENDER_SHARED_DIR):
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import socket
+
+from dotenv import load_dotenv
+
+from src import metrics
+from src.async_pipeline import AsyncVideoPipeline
+from src.job_queue import JobQueue, QueuedJob
+
+# --- Настройка ---
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+RENDER_QUEUE_PATH = os.getenv("RENDER_QUEUE_PATH", "shared/queue.sqlite3")
+RENDER_LEASE_SECONDS = float(os.getenv("RENDER_LEASE_SECONDS", "60"))
+RENDER_MAX_ATTEMPTS = int(os.getenv("RENDER_MAX_ATTEMPTS", "3"))
+
+# Сколько задач один процесс воркера выполняет одновременно
+WORKER_JOBS = int(os.getenv("WORKER_JOBS", "2"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1.0"))
+# Свой порт /metrics у каждого процесса воркера (0 — выключен)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+
+class RenderFailed(Exception):
+    """Задача не удалась; retry — стоит ли отдать её на повтор (сбой ffmpeg, а не ответ API)."""
+
+    def __init__(self, message: str, retry: bool = False):
+        super().__init__(message)
+        self.retry = retry
+
+
+async def render(pipeline: AsyncVideoPipeline, queue: JobQueue, job: QueuedJob, worker_id: str) -> dict:
+    """Те же шаги, что process_video в боте; этапы сообщаются боту через очередь."""
+    payload = job.payload
+    input_path = os.path.join(payload["job_dir"], "input.mp4")
+    # Своё имя на каждую попытку: после потери аренды тот же файл может писать другой воркер
+    final_path = os.path.join(payload["job_dir"], f"result_{job.attempts}.mp4")
+    subtitle_mode = payload.get("subtitle_mode")
+
+    workspace = pipeline.workspaces.acquire(
+        pipeline.estimate_job_bytes(os.path.getsize(input_path)), job.job_id
+    )
+    prep_task = None
+    try:
+        # Подготовка видео (staged-режим) идёт в фоне, пока работают Gemini и TTS
+        prep_task = pipeline.start_prepare(input_path, workspace.path, subtitle_mode)
+
+        await asyncio.to_thread(queue.heartbeat, job.job_id, worker_id, "text")
+        text_data = await pipeline.get_desc_video_async(
+            input_path, payload.get("file_unique_id"), workspace.path
+        )
+        if not text_data or not text_data.get("content"):
+            raise RenderFailed("Не удалось получить текст из видео")
+        # Ответ с ошибкой Gemini (пустой title) не озвучиваем: задача уйдёт на повтор
+        if not text_data.get("title"):
+            raise RenderFailed(text_data["content"], retry=True)
+
+        await asyncio.to_thread(queue.heartbeat, job.job_id, worker_id, "audio")
+        audio_path, srt_path = await pipeline.generate_audio_and_srt_async(
+            text_data["content"], "voice", workspace.path
+        )
+        if not audio_path or not srt_path:
+            raise RenderFailed("Не удалось сгенерировать аудио")
+
+        await asyncio.to_thread(queue.heartbeat, job.job_id, worker_id, "render")
+        render_input = await pipeline.finish_prepare(prep_task, input_path)
+        if not await pipeline.create_video_async(audio_path, render_input, final_path, srt_path, subtitle_mode):
+            raise RenderFailed("Не удалось собрать финальное видео", retry=True)
+
+        return {"title": text_data.get("title"), "result_path": final_path}
+    except BaseException:
+        if os.path.exists(final_path):
+            os.remove(final_path)
+        raise
+    finally:
+        await pipeline.discard_prepare(prep_task)
+        workspace.cleanup()
+
+
+async def run_job(pipeline: AsyncVideoPipeline, queue: JobQueue, job: QueuedJob, worker_id: str):
+    """
+    Выполняет задачу, продлевая аренду; потеря аренды (отмена, истечение) останавливает работу.
+    Вызовы очереди — в потоке: пока другой процесс держит блокировку записи SQLite,
+    event loop (и heartbeat остальных задач) не должен стоять.
+    """
+    task = asyncio.create_task(render(pipeline, queue, job, worker_id))
+    job_result = "error"
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=queue.lease_seconds / 3)
+            if done:
+                break
+            if not await asyncio.to_thread(queue.heartbeat, job.job_id, worker_id):
+                logger.warning(f"Задача {job.job_id}: аренда потеряна (отмена или истечение), останавливаю")
+                job_result = "cancelled"
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return
+
+        try:
+            result = task.result()
+        except RenderFailed as e:
+            logger.error(f"Задача {job.job_id}: {e}")
+            job_result = "failed"
+            await asyncio.to_thread(queue.fail, job.job_id, worker_id, str(e), retry=e.retry)
+            return
+        except Exception as e:
+            logger.error(f"Задача {job.job_id}: ошибка рендеринга: {e}", exc_info=True)
+            await asyncio.to_thread(queue.fail, job.job_id, worker_id, str(e), retry=True)
+            return
+
+        if await asyncio.to_thread(queue.complete, job.job_id, worker_id, result):
+            job_result = "ok"
+            logger.info(f"Задача {job.job_id} готова: {result['result_path']}")
+        else:
+            logger.warning(f"Задача {job.job_id}: аренда потеряна до сдачи результата")
+            os.remove(result["result_path"])
+
+    except asyncio.CancelledError:
+        # Воркер останавливается: задача вернётся в очередь, попытка не сгорает
+        job_result = "cancelled"
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.to_thread(queue.release, job.job_id, worker_id)
+        logger.info(f"Задача {job.job_id} возвращена в очередь")
+        raise
+    finally:
+        metrics.JOBS.inc(result=job_result)
+
+
+async def worker_loop(n: int, pipeline: AsyncVideoPipeline, queue: JobQueue, worker_id: str):
+    while True:
+        # Пока Gemini или ElevenLabs недоступны, задачи остаются в очереди, попытки не тратятся
+        await pipeline.wait_providers_async()
+        job = await asyncio.to_thread(queue.lease, worker_id)
+        if job is None:
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            continue
+        logger.info(f"Воркер {n}: задача {job.job_id} (попытка {job.attempts})")
+        with metrics.JOBS_RUNNING.track():
+            await run_job(pipeline, queue, job, worker_id)
+
+
+async def main():
+    """Запуск воркера."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(RENDER_QUEUE_PATH, lease_seconds=RENDER_LEASE_SECONDS, max_attempts=RENDER_MAX_ATTEMPTS)
+    pipeline = AsyncVideoPipeline()
+
+    metrics.QUEUE_DEPTH.set_function(queue.depth)
+    metrics_server = metrics.MetricsServer(METRICS_HOST, WORKER_METRICS_PORT).start() if WORKER_METRICS_PORT else None
+
+    logger.info(f"Воркер {worker_id} запущен: задач одновременно={WORKER_JOBS}, очередь={RENDER_QUEUE_PATH}")
+    try:
+        await asyncio.gather(*(worker_loop(n, pipeline, queue, worker_id) for n in range(WORKER_JOBS)))
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+        queue.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Воркер остановлен вручную.")